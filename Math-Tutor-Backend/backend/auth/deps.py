@@ -1,23 +1,87 @@
 # backend/auth/deps.py
-from fastapi import Depends, HTTPException, status
+import threading
+from dataclasses import dataclass
+from datetime import date
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from cachetools import TTLCache
 from typing import Optional
 import jwt  # PyJWT exceptions
 
-from db.session import get_db
+from db.session import SessionLocal
 from services.auth_service import get_user
 from .jwt_utils import decode_token
 
-# OAuth2PasswordBearer expects the Authorization header: "Authorization: Bearer <token>"
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+@dataclass(frozen=True)
+class UserSnapshot:
+    """Immutable copy of the user row; safe to share across requests (no ORM session)."""
+    id: int
+    name: str
+    email: str
+    school: Optional[str] = None
+    date_of_birth: Optional[date] = None
+    grade: Optional[str] = None
+    is_active: bool = True
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+
+# user_id -> UserSnapshot. Short TTL keeps profile edits visible quickly while
+# sparing a DB round-trip on almost every authenticated request.
+_user_cache: TTLCache = TTLCache(maxsize=50_000, ttl=30)
+_user_cache_lock = threading.Lock()
+
+
+def invalidate_cached_user(user_id: int) -> None:
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
+
+async def _load_user_snapshot(user_id: int) -> Optional[UserSnapshot]:
+    async with SessionLocal() as db:
+        user = await get_user(db, user_id=user_id)
+        if not user:
+            return None
+        return UserSnapshot(
+            id=user.id,
+            name=user.name,
+            email=user.email,
+            school=user.school,
+            date_of_birth=user.date_of_birth,
+            grade=user.grade,
+            is_active=user.is_active,
+        )
+
+
+class BearerTokenScheme(OAuth2PasswordBearer):
+    """
+    OAuth2PasswordBearer with a slimmer header parse.
+
+    Subclassing keeps the security scheme in the OpenAPI schema (so /docs still
+    shows the Authorize button) while each request only does one header lookup
+    and a slice instead of the generic scheme/param split.
+    """
+
+    async def __call__(self, request: Request) -> str:
+        authorization = request.headers.get("authorization")
+        if not authorization or authorization[:7].lower() != "bearer ":
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Not authenticated",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return authorization[7:]
+
+
+# Expects the Authorization header: "Authorization: Bearer <token>"
+oauth2_scheme = BearerTokenScheme(tokenUrl="/auth/login")
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserSnapshot:
     """
     Dependency to get the current user from the Bearer token.
 
-    Returns a User object from the DB, or raises 401/403 if token invalid/expired/missing.
+    Returns a cached UserSnapshot (the DB is only hit on a cache miss),
+    or raises 401/403 if token invalid/expired/missing.
     """
     if not token:
         # This branch is rarely hit because oauth2_scheme itself will raise when missing,
@@ -60,7 +124,13 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    user = get_user(db, user_id=user_id)
+    with _user_cache_lock:
+        user = _user_cache.get(user_id)
+    if user is None:
+        user = await _load_user_snapshot(user_id)
+        if user is not None:
+            with _user_cache_lock:
+                _user_cache[user_id] = user
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
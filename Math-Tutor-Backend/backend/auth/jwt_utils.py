@@ -1,7 +1,12 @@
 # backend/auth/jwt_utils.py
 import os
-from datetime import datetime, timedelta
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 import jwt
+import orjson
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,12 +15,64 @@ JWT_SECRET = os.getenv("JWT_SECRET", "please-change-this")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
 
+# Signing/verification keys are resolved once at import instead of being re-encoded
+# on every call. HS* algorithms share the secret bytes; asymmetric algorithms
+# (e.g. JWT_ALGORITHM=EdDSA, verified via `cryptography`/OpenSSL) read PEM keys.
+if JWT_ALGORITHM.startswith("HS"):
+    _SIGNING_KEY = _VERIFY_KEY = JWT_SECRET.encode("utf-8")
+else:
+    _SIGNING_KEY = os.getenv("JWT_PRIVATE_KEY", "").replace("\\n", "\n").encode("utf-8")
+    _VERIFY_KEY = os.getenv("JWT_PUBLIC_KEY", "").replace("\\n", "\n").encode("utf-8")
+
+class _OrjsonPyJWT(jwt.PyJWT):
+    """PyJWT with the claims set (de)serialized by orjson instead of stdlib json.
+
+    Uses the payload hooks PyJWT documents for subclassing; signing and claim
+    validation are unchanged. exp/iat/nbf are already ints by the time they get here.
+    """
+
+    def _encode_payload(self, payload, headers=None, json_encoder=None) -> bytes:
+        return orjson.dumps(payload)
+
+    def _decode_payload(self, decoded) -> dict:
+        try:
+            payload = orjson.loads(decoded["payload"])
+        except orjson.JSONDecodeError as e:
+            raise jwt.DecodeError(f"Invalid payload string: {e}") from e
+        if not isinstance(payload, dict):
+            raise jwt.DecodeError("Invalid payload string: must be a json object")
+        return payload
+
+
+_JWT = _OrjsonPyJWT()
+
+_ALGS = [JWT_ALGORITHM]
+_DEFAULT_EXP = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+_DECODE_OPTIONS = {"require": ["exp", "sub"], "verify_aud": False}
+
+# Verified payloads keyed by a digest of the token, so repeat requests with the same
+# bearer token skip signature verification. Entries still honour the token's own exp.
+_decoded_cache: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+_decoded_cache_lock = threading.Lock()
+
 def create_access_token(subject: int, expires_delta: timedelta | None = None) -> str:
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    expire = datetime.now(timezone.utc) + (expires_delta or _DEFAULT_EXP)
     to_encode = {"sub": str(subject), "exp": expire}
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    encoded_jwt = _JWT.encode(to_encode, _SIGNING_KEY, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
 def decode_token(token: str) -> dict:
-    payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    with _decoded_cache_lock:
+        payload = _decoded_cache.get(key)
+    if payload is not None:
+        if payload.get("exp", 0) > time.time():
+            return payload
+        with _decoded_cache_lock:
+            _decoded_cache.pop(key, None)
+
+    # Raises jwt.ExpiredSignatureError / jwt.PyJWTError exactly as before on a miss
+    payload = _JWT.decode(token, _VERIFY_KEY, algorithms=_ALGS, options=_DECODE_OPTIONS)
+    with _decoded_cache_lock:
+        _decoded_cache[key] = payload
     return payload
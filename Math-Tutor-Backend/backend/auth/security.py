@@ -1,11 +1,66 @@
 # backend/auth/security.py
-from passlib.context import CryptContext
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from argon2 import PasswordHasher, Type
+from argon2.exceptions import InvalidHashError, VerificationError
 
-# Using argon2 (no 72-byte limit, stronger defaults than bcrypt)
-pwd_ctx = CryptContext(schemes=["argon2"], deprecated="auto")
+# Argon2id parameters, pinned explicitly rather than inherited from library defaults
+# (m=64 MiB, t=3, p=4), so the per-login CPU/RAM budget is predictable.
+# 46 MiB / t=2 / p=1 follows the OWASP baseline and keeps a single hash() well under
+# 500 ms on a shared Railway vCPU. Tune via env after benchmarking with `python -m argon2`.
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "2"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "47104"))  # KiB (46 MiB)
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "1"))
+
+# Using argon2 (no 72-byte limit, stronger defaults than bcrypt).
+# argon2-cffi is called directly: only one scheme is in use, so Passlib's
+# CryptContext dispatch layer is pure overhead on every login/signup.
+# Hashes are standard PHC strings, so ones written by Passlib still verify.
+ph = PasswordHasher(
+    time_cost=ARGON2_TIME_COST,
+    memory_cost=ARGON2_MEMORY_COST,
+    parallelism=ARGON2_PARALLELISM,
+    hash_len=32,
+    salt_len=16,
+    type=Type.ID,
+)
+
+# Hashing runs on a dedicated, size-capped pool so bursts of logins cannot starve the
+# event loop or Starlette's shared threadpool. argon2-cffi releases the GIL inside the
+# C kernel, so threads give real parallelism without pickling/forking a process pool.
+# Workers are capped so workers x memory_cost stays within ARGON2_MAX_MEMORY_MB.
+ARGON2_MAX_MEMORY_MB = int(os.getenv("ARGON2_MAX_MEMORY_MB", "256"))
+HASH_WORKERS = int(os.getenv(
+    "ARGON2_WORKERS",
+    str(max(1, min(os.cpu_count() or 1, ARGON2_MAX_MEMORY_MB * 1024 // ARGON2_MEMORY_COST))),
+))
+HASH_EXECUTOR = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="argon2")
+
+# Verified against when the email is unknown, so a miss costs the same Argon2 work
+# as a wrong password and response timing does not reveal which accounts exist.
+DUMMY_HASH = ph.hash(os.urandom(16).hex())
 
 def get_password_hash(password: str) -> str:
-    return pwd_ctx.hash(password)
+    return ph.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_ctx.verify(plain_password, hashed_password)
+    try:
+        return ph.verify(hashed_password, plain_password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True when the stored hash was made with different parameters than `ph`."""
+    try:
+        return ph.check_needs_rehash(hashed_password)
+    except InvalidHashError:
+        return True
+
+async def get_password_hash_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(HASH_EXECUTOR, get_password_hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(HASH_EXECUTOR, verify_password, plain_password, hashed_password)
@@ -1,20 +0,0 @@
-# db_connection.py
-import os
-from dotenv import load_dotenv
-import psycopg2
-from psycopg2.extras import RealDictCursor
-
-load_dotenv()
-
-def get_db_connection():
-    """Return a new connection using DATABASE_URL (Neon URI)."""
-    database_url = os.getenv("DATABASE_URL")
-    if not database_url:
-        raise RuntimeError("DATABASE_URL not set in environment")
-
-    try:
-        # psycopg2 accepts a libpq-style URI (postgresql://...)
-        conn = psycopg2.connect(database_url)
-        return conn
-    except psycopg2.Error as e:
-        raise Exception(f"Database connection failed: {e}")
@@ -1,20 +1,180 @@
 # db_connection.py
+import logging
 import os
+import threading
+import time
 from dotenv import load_dotenv
+from fastapi import HTTPException
+from db.pool_sizing import sync_pool_max_default
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2 import pool as pg_pool
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.extras import RealDictCursor, register_default_json, register_default_jsonb
+import orjson
 
 load_dotenv()
+logger = logging.getLogger(__name__)
+
+# json/jsonb columns are already decoded to Python objects by psycopg2; use orjson
+# for that instead of the stdlib parser on every pooled connection.
+register_default_json(globally=True, loads=orjson.loads)
+register_default_jsonb(globally=True, loads=orjson.loads)
+
+# Process-wide psycopg2 pool shared by every get_db_connection() caller, so a
+# request reuses an open socket instead of paying TCP + TLS + auth to Neon.
+PG_POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN_SIZE", "2"))
+# Defaults to what DB_MAX_CONN / WEB_CONCURRENCY leaves after the async engine
+PG_POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX_SIZE", str(sync_pool_max_default())))
+# Seconds a caller waits for a free connection before failing with a 503. Kept
+# short: a waiting caller holds one of the worker threads (THREADPOOL_SIZE in
+# main.py) that every other sync request needs too.
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "1"))
+# Connections idle longer than this are reopened on checkout; Neon drops them
+# when compute scales to zero, and a dead socket would fail the first query.
+PG_POOL_MAX_IDLE = float(os.getenv("PG_POOL_MAX_IDLE", "240"))
+
+_pool = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool raises PoolError when exhausted instead of blocking;
+# the semaphore makes callers queue briefly for a slot instead.
+_slots = threading.BoundedSemaphore(PG_POOL_MAX_SIZE)
+_returned_at: dict[int, float] = {}
+# Connections checked out per thread. A request checks out one connection and
+# passes it down; a second checkout on a thread that already holds one never
+# waits, since the slot it waits for may be the one its own caller holds.
+_held: dict[int, int] = {}
+_held_lock = threading.Lock()
+
+
+class PoolExhaustedError(HTTPException):
+    """No pooled connection became free in time; surfaces as 503 Service Unavailable."""
+
+    def __init__(self):
+        super().__init__(status_code=503, detail="Database is busy, please retry", headers={"Retry-After": "1"})
+
+
+def _get_pool() -> pg_pool.ThreadedConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                database_url = os.getenv("DATABASE_URL")
+                if not database_url:
+                    raise RuntimeError("DATABASE_URL not set in environment")
+                # psycopg2 accepts a libpq-style URI (postgresql://...)
+                _pool = pg_pool.ThreadedConnectionPool(PG_POOL_MIN_SIZE, PG_POOL_MAX_SIZE, dsn=database_url)
+    return _pool
+
+
+class PooledConnection:
+    """A psycopg2 connection checked out of the shared pool.
+
+    Behaves like the underlying connection (cursor/commit/rollback/`with conn:`);
+    close() rolls back any open transaction and returns it to the pool.
+    """
+
+    __slots__ = ("_conn", "_closed", "_owner")
+
+    def __init__(self, conn, owner: int):
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "_closed", False)
+        object.__setattr__(self, "_owner", owner)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    @property
+    def closed(self):
+        return 1 if self._closed else self._conn.closed
+
+    def close(self):
+        if self._closed:
+            return
+        object.__setattr__(self, "_closed", True)
+        conn = self._conn
+        discard = bool(conn.closed)
+        if not discard:
+            try:
+                if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+            except psycopg2.Error:
+                discard = True
+        if not discard:
+            _returned_at[id(conn)] = time.monotonic()
+        try:
+            if _pool is None:  # pool already shut down
+                conn.close()
+            else:
+                _pool.putconn(conn, close=discard)
+        finally:
+            _release_slot(self._owner)
+
+    def __del__(self):
+        # Safety net for code paths that forget close(); never leak a pool slot.
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def _release_slot(owner: int) -> None:
+    with _held_lock:
+        if _held.get(owner, 0) <= 1:
+            _held.pop(owner, None)
+        else:
+            _held[owner] -= 1
+    _slots.release()
+
 
 def get_db_connection():
-    """Return a new connection using DATABASE_URL (Neon URI)."""
-    database_url = os.getenv("DATABASE_URL")
-    if not database_url:
-        raise RuntimeError("DATABASE_URL not set in environment")
+    """
+    Return a pooled connection using DATABASE_URL (Neon URI). close() returns it to the pool.
 
+    Raises PoolExhaustedError (503) if none frees up within PG_POOL_TIMEOUT, or at once
+    if this thread already holds a connection: pass that one down instead.
+    """
+    owner = threading.get_ident()
+    with _held_lock:
+        nested = owner in _held
+    if nested:
+        logger.warning("Nested pooled connection checkout; pass the caller's connection down instead")
+    if not _slots.acquire(timeout=0 if nested else PG_POOL_TIMEOUT):
+        raise PoolExhaustedError()
+    with _held_lock:
+        _held[owner] = _held.get(owner, 0) + 1
     try:
-        # psycopg2 accepts a libpq-style URI (postgresql://...)
-        conn = psycopg2.connect(database_url)
-        return conn
+        pool = _get_pool()
+        while True:
+            conn = pool.getconn()
+            returned_at = _returned_at.pop(id(conn), None)
+            if not conn.closed and (returned_at is None or time.monotonic() - returned_at <= PG_POOL_MAX_IDLE):
+                return PooledConnection(conn, owner)
+            pool.putconn(conn, close=True)
     except psycopg2.Error as e:
+        _release_slot(owner)
         raise Exception(f"Database connection failed: {e}")
+    except BaseException:
+        _release_slot(owner)
+        raise
+
+
+def close_db_pool():
+    """Close every pooled connection (app shutdown)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+        _returned_at.clear()
@@ -108,6 +108,82 @@ def run_status_migration():
         conn.close()
 
 
+def _run_sql_migration(filename: str, message: str):
+    """Run a .sql migration file from this directory in one transaction"""
+    load_dotenv()
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        raise RuntimeError("DATABASE_URL not set in environment")
+
+    migration_path = os.path.join(os.path.dirname(__file__), filename)
+    with open(migration_path, "r", encoding="utf-8") as f:
+        sql = f.read()
+
+    conn = psycopg2.connect(database_url)
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+        print(f"Migration completed: {message}")
+    finally:
+        conn.close()
+
+
+def run_random_key_migration():
+    """Run migration to add the indexed random_key sampling column to omni_math_data"""
+    _run_sql_migration("migrations_add_random_key.sql", "random_key column added to omni_math_data")
+
+
+def run_domain_arr_migration():
+    """Run migration to add the GIN-indexed domain_arr column to omni_math_data"""
+    _run_sql_migration("migrations_add_domain_arr.sql", "domain_arr column added to omni_math_data")
+
+
+def run_embedding_hnsw_migration():
+    """Run migration to add the halfvec HNSW index on omni_math_data.embedding"""
+    _run_sql_migration("migrations_add_embedding_hnsw.sql", "HNSW index created on omni_math_data.embedding")
+
+
+def run_hot_path_indexes_migration():
+    """Run migration to add composite indexes for the curriculum and practice queries"""
+    _run_sql_migration("migrations_add_hot_path_indexes.sql", "composite indexes created on daily_tasks, curriculum_plans and student_mistakes")
+
+
+def run_rmo_problem_pool_migration():
+    """Run migration to create the mv_rmo_problems mock-test candidate pool"""
+    _run_sql_migration("migrations_add_rmo_problem_pool.sql", "mv_rmo_problems materialized view created")
+
+
+def run_grading_results_unique_migration():
+    """Run migration to deduplicate grading_results and make (submission_id, problem_id) unique"""
+    _run_sql_migration("migrations_add_grading_results_unique.sql", "unique index created on grading_results (submission_id, problem_id)")
+
+
+def run_wrong_answer_index_migration():
+    """Run migration to add a partial index on grading_results for wrong answers by recency"""
+    _run_sql_migration("migrations_add_wrong_answer_index.sql", "partial index created on grading_results (submission_id, graded_at) for wrong answers")
+
+
+def run_trigram_indexes_migration():
+    """Run migration to add pg_trgm indexes for the ILIKE domain/topic lookups"""
+    _run_sql_migration("migrations_add_trigram_indexes.sql", "trigram indexes created on omni_math_data.domain and study_materials.related_topics")
+
+
+def run_student_submissions_index_migration():
+    """Run migration to add an index on test_submissions (student_id, submission_id)"""
+    _run_sql_migration("migrations_add_student_submissions_index.sql", "index created on test_submissions (student_id, submission_id)")
+
+
+def run_practice_session_unique_migration():
+    """Run migration to allow one 'Practice Session' mock test per student"""
+    _run_sql_migration("migrations_add_practice_session_unique.sql", "unique index created on mock_tests (student_id) for practice sessions")
+
+
+def run_grading_batches_migration():
+    """Run migration to add the grading_batches table for Batch API grading"""
+    _run_sql_migration("migrations_add_grading_batches.sql", "grading_batches table created")
+
+
 def reset_sequences(truncate_tables=False):
     """
     Reset all sequences (submission_id, result_id, test_id, id) to start from 1.
@@ -179,5 +255,27 @@ if __name__ == "__main__":
         run_alter_migration()
     elif len(sys.argv) > 1 and sys.argv[1] == "status":
         run_status_migration()
+    elif len(sys.argv) > 1 and sys.argv[1] == "random_key":
+        run_random_key_migration()
+    elif len(sys.argv) > 1 and sys.argv[1] == "domain_arr":
+        run_domain_arr_migration()
+    elif len(sys.argv) > 1 and sys.argv[1] == "embedding_hnsw":
+        run_embedding_hnsw_migration()
+    elif len(sys.argv) > 1 and sys.argv[1] == "hot_path_indexes":
+        run_hot_path_indexes_migration()
+    elif len(sys.argv) > 1 and sys.argv[1] == "rmo_problem_pool":
+        run_rmo_problem_pool_migration()
+    elif len(sys.argv) > 1 and sys.argv[1] == "grading_results_unique":
+        run_grading_results_unique_migration()
+    elif len(sys.argv) > 1 and sys.argv[1] == "wrong_answer_index":
+        run_wrong_answer_index_migration()
+    elif len(sys.argv) > 1 and sys.argv[1] == "trigram_indexes":
+        run_trigram_indexes_migration()
+    elif len(sys.argv) > 1 and sys.argv[1] == "student_submissions_index":
+        run_student_submissions_index_migration()
+    elif len(sys.argv) > 1 and sys.argv[1] == "practice_session_unique":
+        run_practice_session_unique_migration()
+    elif len(sys.argv) > 1 and sys.argv[1] == "grading_batches":
+        run_grading_batches_migration()
     else:
         run_migration()
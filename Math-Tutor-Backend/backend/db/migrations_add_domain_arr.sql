@@ -0,0 +1,11 @@
+-- Migration: array form of omni_math_data.domain with a GIN index
+-- domain is a comma-separated string ("Mathematics, Algebra, Prealgebra").
+-- Lookups previously ran unnest(string_to_array(domain, ',')) + LIKE on every
+-- row; domain_arr @> ARRAY['Algebra'] / && can use the GIN index instead.
+
+-- Generated so ingestion keeps writing only `domain`; elements come out trimmed
+ALTER TABLE omni_math_data
+ADD COLUMN IF NOT EXISTS domain_arr TEXT[]
+GENERATED ALWAYS AS (regexp_split_to_array(btrim(coalesce(domain, ''), ' ,'), '\s*,\s*')) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_omni_math_data_domain_arr ON omni_math_data USING GIN (domain_arr);
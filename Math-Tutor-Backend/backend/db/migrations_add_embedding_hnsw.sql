@@ -0,0 +1,13 @@
+-- Migration: HNSW index for nearest-neighbour search on omni_math_data.embedding
+-- Without an index, ORDER BY embedding <-> q LIMIT k scans every row.
+-- The index is built over a half-precision (fp16) copy of the 384-dim vectors,
+-- so graph traversal reads half the bytes per candidate. The fp32 column is
+-- left as-is so ingestion and the problems API are unaffected; queries must
+-- order by (embedding::halfvec(384)) <-> q::halfvec(384) to use the index.
+
+CREATE EXTENSION IF NOT EXISTS vector;
+
+CREATE INDEX IF NOT EXISTS idx_omni_math_data_embedding_hnsw
+ON omni_math_data
+USING hnsw ((embedding::halfvec(384)) halfvec_l2_ops)
+WITH (m = 16, ef_construction = 64);
@@ -0,0 +1,10 @@
+-- Migration: grading_batches table
+-- Scheduled mock-test submissions are graded through the OpenAI Batch API
+-- (services/mock_test_service.py). Each row is an in-flight batch and the
+-- submissions it covers; it is deleted once the results are stored.
+
+CREATE TABLE IF NOT EXISTS grading_batches (
+  batch_id TEXT PRIMARY KEY,
+  submission_ids INTEGER[] NOT NULL,
+  created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
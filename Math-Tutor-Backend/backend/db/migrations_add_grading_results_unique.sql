@@ -0,0 +1,13 @@
+-- Migration: one grading_results row per (submission_id, problem_id)
+-- Re-grading upserts on this key (routes/submissions/grading.py) instead of
+-- deleting and re-inserting every row of the submission.
+
+-- Keep only the latest result where earlier code left duplicates behind
+DELETE FROM grading_results gr
+USING grading_results newer
+WHERE newer.submission_id = gr.submission_id
+  AND newer.problem_id = gr.problem_id
+  AND newer.result_id > gr.result_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS grading_results_submission_problem_key
+ON grading_results (submission_id, problem_id);
@@ -0,0 +1,15 @@
+-- Migration: composite indexes matching the hot curriculum/practice query shapes
+-- daily_tasks:      WHERE student_id = ? AND task_date = ?            (daily tasks, generation)
+--                   WHERE student_id = ? ORDER BY task_date DESC, task_id  (task history)
+-- curriculum_plans: WHERE batch_id = ? ORDER BY week_number           (batch plans)
+-- student_mistakes: WHERE student_id = ? GROUP BY domain              (weakness analysis)
+-- user_curriculum_selections(student_id) is already covered by its UNIQUE constraint.
+
+CREATE INDEX IF NOT EXISTS daily_tasks_student_date_idx
+ON daily_tasks (student_id, task_date DESC, task_id);
+
+CREATE INDEX IF NOT EXISTS curriculum_plans_batch_week_idx
+ON curriculum_plans (batch_id, week_number);
+
+CREATE INDEX IF NOT EXISTS student_mistakes_student_domain_idx
+ON student_mistakes (student_id, domain);
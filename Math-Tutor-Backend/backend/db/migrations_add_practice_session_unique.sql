@@ -0,0 +1,21 @@
+-- Migration: at most one 'Practice Session' mock test per student
+-- Practice submissions get or create it with a single
+-- INSERT ... ON CONFLICT on this index (routes/submissions/upload.py,
+-- routes/practice_sessions.py) instead of SELECT-then-INSERT, which let two
+-- concurrent first submissions both insert one.
+
+-- Earlier duplicates are retyped rather than deleted: deleting a mock test
+-- would cascade to its submissions and grading results.
+UPDATE mock_tests mt
+SET test_type = 'Practice Session (duplicate)'
+WHERE mt.test_type = 'Practice Session'
+  AND EXISTS (
+    SELECT 1 FROM mock_tests older
+    WHERE older.test_type = 'Practice Session'
+      AND older.student_id = mt.student_id
+      AND older.test_id < mt.test_id
+  );
+
+CREATE UNIQUE INDEX IF NOT EXISTS mock_tests_practice_session_key
+ON mock_tests (student_id)
+WHERE test_type = 'Practice Session';
@@ -0,0 +1,9 @@
+-- Migration: random sampling key for omni_math_data
+-- Problem pickers start an index range scan at a random point instead of
+-- ORDER BY RANDOM(), which sorts every matching row.
+
+-- The volatile default is evaluated per row, so existing rows get distinct keys
+ALTER TABLE omni_math_data
+ADD COLUMN IF NOT EXISTS random_key DOUBLE PRECISION NOT NULL DEFAULT random();
+
+CREATE INDEX IF NOT EXISTS idx_omni_math_data_random_key ON omni_math_data (random_key);
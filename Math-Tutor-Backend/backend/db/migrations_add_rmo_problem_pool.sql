@@ -0,0 +1,20 @@
+-- Migration: pre-filtered candidate pool for RMO mock tests
+-- Mock tests draw problems per domain with difficulty 3.0-6.0. This view holds one
+-- row per (problem, domain element) inside that band, so a fetch is an index seek
+-- on (domain_key, random_key) over a much smaller relation than omni_math_data.
+-- `domain` keeps the original comma-separated string returned to clients.
+-- Refreshed nightly (REFRESH MATERIALIZED VIEW CONCURRENTLY needs the unique index).
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_rmo_problems AS
+SELECT p.problem_id, d.domain_key, p.domain, p.problem, p.solution, p.answer,
+       p.difficulty_level, p.created_at, p.random_key
+FROM omni_math_data p
+CROSS JOIN LATERAL unnest(p.domain_arr) AS d(domain_key)
+WHERE p.difficulty_level BETWEEN 3.0 AND 6.0
+  AND d.domain_key <> '';
+
+CREATE UNIQUE INDEX IF NOT EXISTS mv_rmo_problems_problem_domain_idx
+ON mv_rmo_problems (problem_id, domain_key);
+
+CREATE INDEX IF NOT EXISTS mv_rmo_problems_domain_key_idx
+ON mv_rmo_problems (domain_key, random_key);
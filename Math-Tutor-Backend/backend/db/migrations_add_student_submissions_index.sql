@@ -0,0 +1,9 @@
+-- Migration: index test_submissions by student
+-- Weakness analysis, analytics, recommendations, tutor context and the
+-- submissions list all filter WHERE ts.student_id = ? and join on
+-- submission_id. UNIQUE(test_id, student_id) leads with test_id, so these
+-- lookups scanned the whole table. student_id stays TEXT: callers bind
+-- str(student_id), which matches the column type and needs no cast.
+
+CREATE INDEX IF NOT EXISTS test_submissions_student_idx
+ON test_submissions (student_id, submission_id);
@@ -0,0 +1,13 @@
+-- Migration: trigram indexes for the substring (ILIKE '%x%') lookups
+-- omni_math_data.domain:          daily tasks, practice sessions, recommendations
+-- study_materials.related_topics: daily tasks, practice recommendations
+-- A leading-wildcard ILIKE cannot use a B-tree; with these GIN indexes the
+-- planner answers the same unchanged queries from the index.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS omni_math_data_domain_trgm_idx
+ON omni_math_data USING GIN (domain gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS study_materials_related_topics_trgm_idx
+ON study_materials USING GIN ((related_topics::text) gin_trgm_ops);
@@ -0,0 +1,7 @@
+-- Migration: partial index for the "recent wrong answers" filters
+-- Weakness analysis, tutor context and daily-task regeneration look up a
+-- submission's wrong answers by graded_at; only those rows are indexed.
+
+CREATE INDEX IF NOT EXISTS grading_results_wrong_recent_idx
+ON grading_results (submission_id, graded_at DESC)
+WHERE answer_is_correct = FALSE;
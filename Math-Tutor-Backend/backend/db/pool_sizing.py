@@ -0,0 +1,44 @@
+# backend/db/pool_sizing.py
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Every uvicorn worker opens its own asyncpg engine pool and its own psycopg2 pool,
+# so WEB_CONCURRENCY workers x (both pools) must stay under the server's connection
+# limit or Postgres starts refusing connections under load. Set DB_MAX_CONN to the
+# connections this app may use in total (e.g. Neon's max_connections minus headroom
+# for migrations/consoles); explicit DB_POOL_SIZE / DB_MAX_OVERFLOW / PG_POOL_MAX_SIZE
+# still win over the derived values.
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+DB_MAX_CONN = int(os.getenv("DB_MAX_CONN", "0"))
+
+
+def worker_connection_budget() -> int:
+    """Connections one worker may hold across both pools; 0 when DB_MAX_CONN is unset."""
+    if not DB_MAX_CONN:
+        return 0
+    # Keep a couple of connections per worker spare for overflow bursts
+    return max(2, DB_MAX_CONN // WEB_CONCURRENCY - 2)
+
+
+def async_pool_defaults() -> tuple[int, int]:
+    """(pool_size, max_overflow) for the asyncpg engine.
+
+    min(cpu * 2, half the worker budget): async routes multiplex many requests over
+    few connections, so more than ~2 per core only adds server-side contention.
+    """
+    budget = worker_connection_budget()
+    if not budget:
+        return 20, 10
+    pool_size = max(1, min((os.cpu_count() or 1) * 2, budget // 2))
+    return pool_size, pool_size // 2
+
+
+def sync_pool_max_default() -> int:
+    """Max size of the psycopg2 pool: whatever the worker budget leaves after the async engine."""
+    budget = worker_connection_budget()
+    if not budget:
+        return 20
+    pool_size, max_overflow = async_pool_defaults()
+    return max(2, budget - pool_size - max_overflow)
@@ -51,6 +51,13 @@ CREATE TABLE IF NOT EXISTS grading_results (
   graded_at TIMESTAMP NOT NULL DEFAULT NOW()
 );
 
+-- Table: grading_batches (OpenAI Batch API jobs grading scheduled mock tests)
+CREATE TABLE IF NOT EXISTS grading_batches (
+  batch_id TEXT PRIMARY KEY,
+  submission_ids INTEGER[] NOT NULL,
+  created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
 -- Table: student_mistakes (agentic memory)
 CREATE TABLE IF NOT EXISTS student_mistakes (
   id SERIAL PRIMARY KEY,
@@ -190,3 +197,28 @@ CREATE TABLE IF NOT EXISTS daily_tasks (
   created_at TIMESTAMP NOT NULL DEFAULT NOW(),
   UNIQUE(student_id, task_date, task_type, task_content)
 );
+
+-- Composite indexes for the hot curriculum/practice query shapes
+-- (see migrations_add_hot_path_indexes.sql for existing databases)
+CREATE INDEX IF NOT EXISTS daily_tasks_student_date_idx ON daily_tasks (student_id, task_date DESC, task_id);
+CREATE INDEX IF NOT EXISTS curriculum_plans_batch_week_idx ON curriculum_plans (batch_id, week_number);
+CREATE INDEX IF NOT EXISTS student_mistakes_student_domain_idx ON student_mistakes (student_id, domain);
+
+-- One grading result per problem of a submission; re-grading upserts on it
+-- (see migrations_add_grading_results_unique.sql for existing databases)
+CREATE UNIQUE INDEX IF NOT EXISTS grading_results_submission_problem_key ON grading_results (submission_id, problem_id);
+
+-- Wrong answers by recency (see migrations_add_wrong_answer_index.sql for existing databases)
+CREATE INDEX IF NOT EXISTS grading_results_wrong_recent_idx ON grading_results (submission_id, graded_at DESC) WHERE answer_is_correct = FALSE;
+
+-- Substring (ILIKE '%x%') lookups on study material topics; omni_math_data.domain
+-- gets the same index from migrations_add_trigram_indexes.sql
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS study_materials_related_topics_trgm_idx ON study_materials USING GIN ((related_topics::text) gin_trgm_ops);
+
+-- Per-student submission lookups (see migrations_add_student_submissions_index.sql for existing databases)
+CREATE INDEX IF NOT EXISTS test_submissions_student_idx ON test_submissions (student_id, submission_id);
+
+-- One practice-session mock test per student; practice submissions upsert on it
+-- (see migrations_add_practice_session_unique.sql for existing databases)
+CREATE UNIQUE INDEX IF NOT EXISTS mock_tests_practice_session_key ON mock_tests (student_id) WHERE test_type = 'Practice Session';
@@ -1,8 +1,12 @@
 # backend/db/session.py
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, scoped_session
+from decimal import Decimal
+import orjson
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from dotenv import load_dotenv
+from db.pool_sizing import async_pool_defaults
 
 load_dotenv()
 
@@ -10,16 +14,85 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL is not set in the environment (.env)")
 
-# Use a standard synchronous engine (psycopg2). Works with NeonDB.
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
 
-# Create Session factory
-SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
+def _async_url(database_url: str):
+    """Point a libpq-style (postgresql://) URL at asyncpg.
 
-def get_db():
+    asyncpg does not understand libpq-only query params such as sslmode /
+    channel_binding, so they are stripped from the URL and sslmode is passed
+    through connect_args instead (asyncpg accepts the same mode names).
+    """
+    url = make_url(database_url)
+    query = dict(url.query)
+    connect_args = {}
+    sslmode = query.pop("sslmode", None)
+    query.pop("channel_binding", None)
+    if sslmode and sslmode != "disable":
+        connect_args["ssl"] = sslmode
+    return url.set(drivername="postgresql+asyncpg", query=query), connect_args
+
+
+_ASYNC_URL, _CONNECT_ARGS = _async_url(DATABASE_URL)
+
+# Pool sizing for Neon, derived from DB_MAX_CONN / WEB_CONCURRENCY (see
+# db/pool_sizing.py) unless set explicitly. Connections are recycled before Neon's
+# idle timeout, and pre-pinged on checkout so one dropped when compute scaled to
+# zero is replaced instead of failing the request (DB_POOL_PRE_PING=0 to skip).
+_DEFAULT_POOL_SIZE, _DEFAULT_MAX_OVERFLOW = async_pool_defaults()
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(_DEFAULT_POOL_SIZE)))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", str(_DEFAULT_MAX_OVERFLOW)))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+
+# On direct connections asyncpg prepares each distinct statement server-side and
+# keeps it in a per-connection LRU (DB_STATEMENT_CACHE_SIZE entries), so repeated
+# queries skip Postgres parse/plan.
+# Neon's "-pooler" endpoint is PgBouncer in transaction mode, which cannot
+# keep named prepared statements across transactions and rejects most
+# startup parameters; set statement_timeout on the role there instead.
+if "-pooler" in (_ASYNC_URL.host or ""):
+    _CONNECT_ARGS["statement_cache_size"] = 0
+    _CONNECT_ARGS["prepared_statement_cache_size"] = 0
+else:
+    _CONNECT_ARGS["prepared_statement_cache_size"] = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+    _CONNECT_ARGS["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+
+# Async engine (asyncpg) so ORM-backed endpoints await the DB instead of
+# blocking the event loop or a threadpool worker. Works with NeonDB.
+engine = create_async_engine(
+    _ASYNC_URL,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_recycle=DB_POOL_RECYCLE,
+    connect_args=_CONNECT_ARGS,
+)
+
+def _json_default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def _json_encode(value) -> str:
+    # asyncpg's text codec expects str; orjson returns bytes
+    return orjson.dumps(value, default=_json_default).decode()
+
+@event.listens_for(engine.sync_engine, "connect")
+def _register_json_codecs(dbapi_connection, connection_record):
+    """Decode/encode json(b) as Python objects (via orjson), matching psycopg2's behaviour for raw SQL."""
+    for typename in ("json", "jsonb"):
+        dbapi_connection.run_async(
+            lambda conn, typename=typename: conn.set_type_codec(
+                typename, encoder=_json_encode, decoder=orjson.loads, schema="pg_catalog"
+            )
+        )
+
+# Create Session factory. expire_on_commit=False so returned ORM objects stay
+# readable after commit without an implicit (and async-illegal) lazy refresh.
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+async def get_db():
     """FastAPI dependency - yields a DB session and closes it after use."""
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
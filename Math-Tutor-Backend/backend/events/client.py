@@ -1,10 +1,23 @@
 import os
-import inngest
+from functools import lru_cache
 
-# Create the Inngest client
-inngest_client = inngest.Inngest(
-    app_id="math_tutor_backend",
-    signing_key=os.getenv("INNGEST_SIGNING_KEY"),
-    event_key=os.getenv("INNGEST_EVENT_KEY"),
-)
 
+@lru_cache(maxsize=1)
+def get_inngest_client():
+    """Build the Inngest client on first use.
+
+    Returns None when neither INNGEST_SIGNING_KEY nor INNGEST_EVENT_KEY is set
+    (and INNGEST_DEV is off), so local runs never import or configure the SDK.
+    """
+    signing_key = os.getenv("INNGEST_SIGNING_KEY")
+    event_key = os.getenv("INNGEST_EVENT_KEY")
+    if not (signing_key or event_key or os.getenv("INNGEST_DEV")):
+        return None
+
+    import inngest
+
+    return inngest.Inngest(
+        app_id="math_tutor_backend",
+        signing_key=signing_key,
+        event_key=event_key,
+    )
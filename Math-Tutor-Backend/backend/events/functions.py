@@ -1,13 +1,20 @@
 import inngest
 import logging
-from .client import inngest_client
+from .client import get_inngest_client
 from services.mock_test_service import (
     generate_entry_mock_test_for_user,
-    generate_scheduled_test_for_batch
+    generate_scheduled_test_for_batch,
+    refresh_rmo_problem_pool,
+    submit_scheduled_grading_batch,
+    collect_scheduled_grading_batches,
 )
+from services.curriculum_service import regenerate_daily_tasks_bulk
 
 logger = logging.getLogger(__name__)
 
+# Only imported when Inngest is enabled, so the client is always configured here
+inngest_client = get_inngest_client()
+
 # 1. Hello World (Test function)
 @inngest_client.create_function(
     fn_id="hello-world",  # Use fn_id
@@ -61,9 +68,61 @@ async def schedule_weekly_mock_function(ctx: inngest.Context):
     count = len(created_ids) if created_ids else 0
     return {"status": "success", "count": count}
 
+# 4. Nightly refresh of the mock-test candidate pool
+@inngest_client.create_function(
+    fn_id="refresh-rmo-problem-pool",
+    trigger=inngest.TriggerCron(cron="0 3 * * *"),
+)
+async def refresh_rmo_problem_pool_function(ctx: inngest.Context):
+    """
+    Runs every night at 3:00 AM so newly ingested problems reach mv_rmo_problems.
+    """
+    await ctx.step.run("refresh-mv-rmo-problems", refresh_rmo_problem_pool)
+    return {"status": "success"}
+
+# 5. Nightly regeneration of tomorrow's daily tasks for improving students
+@inngest_client.create_function(
+    fn_id="regenerate-daily-tasks",
+    trigger=inngest.TriggerCron(cron="30 3 * * *"),
+)
+async def regenerate_daily_tasks_function(ctx: inngest.Context):
+    """
+    Runs every night at 3:30 AM; one COPY loads the new tasks for every student.
+    """
+    count = await ctx.step.run("regenerate-daily-tasks-bulk", regenerate_daily_tasks_bulk)
+    return {"status": "success", "count": count}
+
+# 6. Nightly Batch API submission of submitted scheduled tests
+@inngest_client.create_function(
+    fn_id="submit-grading-batch",
+    trigger=inngest.TriggerCron(cron="0 1 * * *"),
+)
+async def submit_grading_batch_function(ctx: inngest.Context):
+    """
+    Runs every night at 1:00 AM; queues ungraded scheduled-test problems as one batch.
+    """
+    batch_id = await ctx.step.run("submit-scheduled-grading-batch", submit_scheduled_grading_batch)
+    return {"status": "success", "batch_id": batch_id}
+
+# 7. Hourly collection of finished grading batches
+@inngest_client.create_function(
+    fn_id="collect-grading-batches",
+    trigger=inngest.TriggerCron(cron="15 * * * *"),
+)
+async def collect_grading_batches_function(ctx: inngest.Context):
+    """
+    Runs every hour; stores results of completed batches and marks submissions graded.
+    """
+    count = await ctx.step.run("collect-scheduled-grading-batches", collect_scheduled_grading_batches)
+    return {"status": "success", "count": count}
+
 # List of functions to register in your serve handler (e.g., FastAPI, Flask)
 inngest_functions = [
     hello_world,
     generate_entry_test_function,
-    schedule_weekly_mock_function
+    schedule_weekly_mock_function,
+    refresh_rmo_problem_pool_function,
+    regenerate_daily_tasks_function,
+    submit_grading_batch_function,
+    collect_grading_batches_function
 ]
\ No newline at end of file
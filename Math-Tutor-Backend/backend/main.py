@@ -2,9 +2,12 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import asyncio
 import logging
 import os
-import inngest.fast_api
+from contextlib import asynccontextmanager
+
+import anyio.to_thread
 
 try:
     import torchvision
@@ -13,9 +16,8 @@ try:
 except Exception:
     pass
 
-from events.client import inngest_client
-from events.functions import inngest_functions
 from fastapi import FastAPI
+from responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -29,15 +31,89 @@ from auth import routes as auth_routes
 from routes import curriculum, practice, analytics, practice_sessions, recommendations, teaching
 
 from db.session import engine
+from db.db_connection import close_db_pool
+from services.symbolic_answer import close_symbolic_pool
 from db.base import Base
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+async def _ensure_tables():
+    # create_all introspects pg_catalog for every model on each boot; schema is
+    # managed by db/migrations.py, so only run it when explicitly asked (local dev).
+    if os.getenv("AUTO_CREATE_TABLES") != "1":
+        return
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        logger.info("Database tables ensured.")
+    except Exception as e:
+        logger.exception("Failed to create tables (if using migrations this may be expected): %s", e)
+
+
+def _preload_models():
+    logger.info("Running startup preloads...")
+    try:
+        try:
+            from services.embedding_service import get_embedding_model as _get_embedding_model
+            _get_embedding_model()
+            logger.info("Embedding model preloaded.")
+        except Exception as e:
+            logger.warning("Embedding model preload skipped / failed: %s", e)
+
+        try:
+            from services.symbolic_answer import symbolic_answers_equal as _symbolic_answers_equal
+            # Starts the SymPy worker processes before the first graded answer
+            _symbolic_answers_equal("1", "1")
+        except Exception as e:
+            logger.warning("SymPy worker preload skipped / failed: %s", e)
+
+        # .env was already loaded at the top of this module
+        if os.environ.get("OPENAI_API_KEY"):
+            logger.info("OpenAI API key detected in environment.")
+        else:
+            logger.warning("OpenAI API key NOT found. RAG hint generation will fail until configured.")
+    except Exception as e:
+        logger.exception("Error during startup preload: %s", e)
+
+
+async def _preload_models_in_background(ready: asyncio.Event):
+    try:
+        await asyncio.to_thread(_preload_models)
+    finally:
+        ready.set()
+
+
+# Sync `def` routes (psycopg2, OCR, OpenAI calls) run on anyio's worker threadpool,
+# which defaults to 40 threads; a burst of slow requests would queue everything
+# else behind them. Async routes on the asyncpg engine don't use it at all.
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "64"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    await _ensure_tables()
+    # Models load off the event loop so the server accepts connections right away.
+    # Endpoints that encode queries await app.state.models_ready (see
+    # routes/rag/tutor.py:wait_for_models) instead of blocking a worker thread.
+    app.state.models_ready = asyncio.Event()
+    preload = asyncio.create_task(_preload_models_in_background(app.state.models_ready))
+    yield
+    if not preload.done():
+        preload.cancel()
+    await engine.dispose()
+    close_db_pool()
+    close_symbolic_pool()
+
+
 app = FastAPI(
     title="AI Olympiad Tutor API",
     description="APIs for Omni-MATH problem retrieval, mock generation, and RAG search",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 logger.info("Server starting...")
@@ -55,12 +131,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-try:
-    Base.metadata.create_all(bind=engine)
-    logger.info("Database tables ensured.")
-except Exception as e:
-    logger.exception("Failed to create tables (if using migrations this may be expected): %s", e)
-
 try:
     storage_path = submissions_upload.ensure_storage_dir()
     app.mount("/storage", StaticFiles(directory=storage_path), name="storage")
@@ -84,9 +154,13 @@ app.include_router(teaching.router, prefix="/api")
 
 # Inngest requires INNGEST_SIGNING_KEY (from Inngest Cloud dashboard). Skip serve when missing so the app can run locally.
 if os.getenv("INNGEST_SIGNING_KEY"):
+    import inngest.fast_api
+    from events.client import get_inngest_client
+    from events.functions import inngest_functions
+
     inngest.fast_api.serve(
         app,
-        inngest_client,
+        get_inngest_client(),
         inngest_functions,
     )
     logger.info("Inngest serve mounted.")
@@ -96,34 +170,6 @@ else:
     )
 
 
-@app.on_event("startup")
-async def _preload_models():
-    logger.info("Running startup preloads...")
-    try:
-        try:
-            from services.embedding_service import get_embedding_model as _get_embedding_model
-            _get_embedding_model()
-            logger.info("Embedding model preloaded.")
-        except Exception as e:
-            logger.warning("Embedding model preload skipped / failed: %s", e)
-
-        try:
-            from services.tutor_service import _get_semantic_model as _get_tutor_model
-            _get_tutor_model()
-            logger.info("Tutor semantic model preloaded.")
-        except Exception as e:
-            logger.warning("Tutor model preload skipped / failed: %s", e)
-
-        from dotenv import load_dotenv
-        load_dotenv()
-        if os.getenv("OPENAI_API_KEY"):
-            logger.info("OpenAI API key detected in environment.")
-        else:
-            logger.warning("OpenAI API key NOT found. RAG hint generation will fail until configured.")
-    except Exception as e:
-        logger.exception("Error during startup preload: %s", e)
-
-
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("backend.main:app", host="0.0.0.0", port=8000, reload=True)
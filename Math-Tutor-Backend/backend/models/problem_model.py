@@ -10,5 +10,5 @@ class Problem(BaseModel):
     answer: str
     difficulty_level: float
     source: str
-    embedding: Optional[str]
+    embedding: Optional[str] = None
     created_at: Optional[datetime]
\ No newline at end of file
@@ -0,0 +1,28 @@
+# backend/responses.py
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from starlette.responses import JSONResponse
+
+
+def _default(obj: Any) -> Any:
+    # NUMERIC columns come back from psycopg2 as Decimal, which orjson does not handle
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize like ORJSONResponse does (for hand-built/streamed bodies)."""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (natively handles datetime/date/UUID/dataclasses).
+
+    Kept local because fastapi.responses.ORJSONResponse is deprecated.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
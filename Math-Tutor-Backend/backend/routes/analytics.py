@@ -43,7 +43,7 @@ def get_analytics_profile(current_user: UserOut = Depends(get_current_user)):
                 FROM grading_results gr
                 JOIN test_submissions ts ON ts.submission_id = gr.submission_id
                 JOIN omni_math_data omd ON omd.problem_id = gr.problem_id
-                JOIN LATERAL unnest(string_to_array(omd.domain, ',')) AS d(domain) ON TRUE
+                JOIN LATERAL unnest(omd.domain_arr) AS d(domain) ON TRUE
                 WHERE ts.student_id = %s
                 GROUP BY TRIM(d.domain)
             ),
@@ -54,7 +54,7 @@ def get_analytics_profile(current_user: UserOut = Depends(get_current_user)):
                 FROM grading_results gr
                 JOIN test_submissions ts ON ts.submission_id = gr.submission_id
                 JOIN omni_math_data omd ON omd.problem_id = gr.problem_id
-                JOIN LATERAL unnest(string_to_array(omd.domain, ',')) AS d(domain) ON TRUE
+                JOIN LATERAL unnest(omd.domain_arr) AS d(domain) ON TRUE
                 WHERE ts.student_id = %s
                     AND gr.graded_at >= NOW() - INTERVAL '30 days'
                 GROUP BY TRIM(d.domain)
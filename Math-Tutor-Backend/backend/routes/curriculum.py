@@ -1,15 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import date, datetime, timedelta
-import json
+from cachetools import TTLCache
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 from db.db_connection import get_db_connection
+from db.session import SessionLocal, get_db
 from auth.deps import get_current_user
 from schemas.auth import UserOut
-from services.curriculum_service import generate_daily_tasks, regenerate_daily_tasks_if_needed
+from responses import dumps
+from services.curriculum_service import generate_daily_tasks, generate_daily_tasks_for_dates, regenerate_daily_tasks_if_needed
 
 router = APIRouter(prefix="/curriculum", tags=["Curriculum"])
 
+# Batches and their weekly plans are reference data that change only through the
+# admin endpoints below, which invalidate these per-worker caches on write. The TTL
+# bounds staleness across workers.
+_batches_cache: TTLCache = TTLCache(maxsize=1, ttl=60)
+_plan_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+# Upper bound for the task history page size
+TASK_HISTORY_MAX_LIMIT = 1000
+
 class BatchCreate(BaseModel):
     batch_name: str
     duration_months: int  # 1, 3, 6, 12
@@ -24,113 +38,148 @@ class CurriculumPlanItem(BaseModel):
     description: Optional[str] = None
     resources: Optional[List[dict]] = []
 
+# Statements are built once at import. asyncpg prepares each one server-side the
+# first time a pooled connection runs it and reuses the plan afterwards (see the
+# statement-cache notes in db/session.py), so hot reads skip parse/plan.
+_INSERT_BATCH_SQL = text("""
+    INSERT INTO batches (batch_name, duration_months, start_date)
+    VALUES (:batch_name, :duration_months, :start_date)
+    RETURNING batch_id, batch_name, duration_months, start_date
+""")
+_LIST_BATCHES_SQL = text("SELECT batch_id, batch_name, duration_months, start_date FROM batches ORDER BY start_date DESC")
+# Binds in a SELECT list have no column context, hence the explicit casts.
+_INSERT_PLAN_SQL = text("""
+    INSERT INTO curriculum_plans (batch_id, week_number, topic, description, resources)
+    SELECT CAST(:batch_id AS INTEGER), CAST(:week_number AS INTEGER), CAST(:topic AS TEXT),
+           CAST(:description AS TEXT), CAST(:resources AS JSONB)
+    WHERE EXISTS (SELECT 1 FROM batches WHERE batch_id = :batch_id)
+    RETURNING plan_id
+""")
+_USER_BATCH_SQL = text("SELECT batch_id FROM users WHERE id = :user_id")
+_BATCH_PLAN_SQL = text("""
+    SELECT week_number, topic, description, resources
+    FROM curriculum_plans
+    WHERE batch_id = :batch_id
+    ORDER BY week_number ASC
+""")
+# Progress is computed in the same row (date - date is an integer day count).
+_MY_SELECTION_SQL = text("""
+    SELECT selection_id, duration_months, start_date, end_date, selected_at,
+           elapsed, remaining, total,
+           CAST(ROUND(CAST(CASE WHEN total > 0 THEN LEAST(100, elapsed * 100.0 / total) ELSE 0 END AS NUMERIC), 2) AS FLOAT8)
+    FROM (
+        SELECT selection_id, duration_months, start_date, end_date, selected_at,
+               GREATEST(0, CURRENT_DATE - start_date) AS elapsed,
+               GREATEST(0, end_date - CURRENT_DATE) AS remaining,
+               end_date - start_date AS total
+        FROM user_curriculum_selections
+        WHERE student_id = :student_id
+    ) s
+""")
+_COMPLETE_TASK_SQL = text("""
+    UPDATE daily_tasks
+    SET is_completed = TRUE
+    WHERE task_id = :task_id AND student_id = :student_id AND is_completed = FALSE
+    RETURNING task_id
+""")
+_TASK_OWNED_SQL = text("SELECT task_id FROM daily_tasks WHERE task_id = :task_id AND student_id = :student_id")
+_TASK_HISTORY_SQL = text("""
+    SELECT task_id, task_date, task_type, task_content, is_completed, created_at
+    FROM daily_tasks
+    WHERE student_id = :student_id
+    ORDER BY task_date DESC, task_id
+    LIMIT :limit
+""").execution_options(yield_per=100)
+# The selection and that day's tasks in one round-trip: no row means no selection,
+# a single row with NULL task columns means no tasks yet.
+_SELECTION_DAILY_TASKS_SQL = text("""
+    SELECT ucs.duration_months, dt.task_id, dt.task_type, dt.task_content, dt.is_completed
+    FROM user_curriculum_selections ucs
+    LEFT JOIN daily_tasks dt ON dt.student_id = ucs.student_id AND dt.task_date = :task_date
+    WHERE ucs.student_id = :student_id
+    ORDER BY dt.task_type, dt.task_id
+""")
+
 @router.post("/batches", response_model=BatchOut)
-def create_batch(batch: BatchCreate, current_user: UserOut = Depends(get_current_user)):
+async def create_batch(batch: BatchCreate, current_user: UserOut = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     # In a real app, restrict to admin
-    conn = get_db_connection()
-    try:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO batches (batch_name, duration_months, start_date)
-            VALUES (%s, %s, %s)
-            RETURNING batch_id, batch_name, duration_months, start_date
-            """,
-            (batch.batch_name, batch.duration_months, batch.start_date)
-        )
-        row = cur.fetchone()
-        conn.commit()
-        return {
-            "batch_id": row[0],
-            "batch_name": row[1],
-            "duration_months": row[2],
-            "start_date": row[3]
-        }
-    finally:
-        conn.close()
+    result = await db.execute(
+        _INSERT_BATCH_SQL,
+        {"batch_name": batch.batch_name, "duration_months": batch.duration_months, "start_date": batch.start_date}
+    )
+    row = result.one()
+    await db.commit()
+    _batches_cache.clear()
+    return {
+        "batch_id": row[0],
+        "batch_name": row[1],
+        "duration_months": row[2],
+        "start_date": row[3]
+    }
 
 @router.get("/batches", response_model=List[BatchOut])
-def get_batches():
-    conn = get_db_connection()
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT batch_id, batch_name, duration_months, start_date FROM batches ORDER BY start_date DESC")
-        rows = cur.fetchall()
-        return [
+async def get_batches(db: AsyncSession = Depends(get_db)):
+    batches = _batches_cache.get("all")
+    if batches is None:
+        result = await db.execute(_LIST_BATCHES_SQL)
+        batches = [
             {
                 "batch_id": r[0],
                 "batch_name": r[1],
                 "duration_months": r[2],
                 "start_date": r[3]
-            } for r in rows
+            } for r in result.all()
         ]
-    finally:
-        conn.close()
+        _batches_cache["all"] = batches
+    return batches
 
 @router.post("/batches/{batch_id}/plan")
-def add_curriculum_to_batch(batch_id: int, plan: CurriculumPlanItem, current_user: UserOut = Depends(get_current_user)):
-    conn = get_db_connection()
-    try:
-        cur = conn.cursor()
-        # Verify batch exists
-        cur.execute("SELECT 1 FROM batches WHERE batch_id = %s", (batch_id,))
-        if not cur.fetchone():
-            raise HTTPException(status_code=404, detail="Batch not found")
-
-        cur.execute(
-            """
-            INSERT INTO curriculum_plans (batch_id, week_number, topic, description, resources)
-            VALUES (%s, %s, %s, %s, %s)
-            RETURNING plan_id
-            """,
-            (batch_id, plan.week_number, plan.topic, plan.description, json.dumps(plan.resources))
-        )
-        conn.commit()
-        return {"status": "success", "plan_id": cur.fetchone()[0]}
-    finally:
-        conn.close()
+async def add_curriculum_to_batch(batch_id: int, plan: CurriculumPlanItem, current_user: UserOut = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    # Insert only if the batch exists, so the check and insert share one round-trip.
+    result = await db.execute(
+        _INSERT_PLAN_SQL,
+        {
+            "batch_id": batch_id,
+            "week_number": plan.week_number,
+            "topic": plan.topic,
+            "description": plan.description,
+            "resources": plan.resources,
+        }
+    )
+    plan_id = result.scalar_one_or_none()
+    if plan_id is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    await db.commit()
+    _plan_cache.pop(batch_id, None)
+    return {"status": "success", "plan_id": plan_id}
 
 @router.get("/my-plan")
-def get_student_curriculum(current_user: UserOut = Depends(get_current_user)):
+async def get_student_curriculum(current_user: UserOut = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     """Get the curriculum plan for the current student's batch"""
-    conn = get_db_connection()
-    try:
-        cur = conn.cursor()
-        
-        # Get student's batch
-        cur.execute("SELECT batch_id FROM users WHERE id = %s", (current_user.id,))
-        user_row = cur.fetchone()
-        
-        if not user_row or not user_row[0]:
-            # Fallback or empty if not assigned to a batch
-            return {"message": "Student not assigned to a batch", "plan": []}
-            
-        batch_id = user_row[0]
-        
-        cur.execute(
-            """
-            SELECT week_number, topic, description, resources 
-            FROM curriculum_plans 
-            WHERE batch_id = %s 
-            ORDER BY week_number ASC
-            """, 
-            (batch_id,)
-        )
-        rows = cur.fetchall()
-        
-        return {
-            "batch_id": batch_id,
-            "plan": [
-                {
-                    "week": r[0],
-                    "topic": r[1],
-                    "description": r[2],
-                    "resources": r[3]
-                } for r in rows
-            ]
-        }
-    finally:
-        conn.close()
+    result = await db.execute(_USER_BATCH_SQL, {"user_id": current_user.id})
+    batch_id = result.scalar_one_or_none()
+
+    if not batch_id:
+        # Fallback or empty if not assigned to a batch
+        return {"message": "Student not assigned to a batch", "plan": []}
+
+    plan = _plan_cache.get(batch_id)
+    if plan is None:
+        result = await db.execute(_BATCH_PLAN_SQL, {"batch_id": batch_id})
+        plan = [
+            {
+                "week": r[0],
+                "topic": r[1],
+                "description": r[2],
+                "resources": r[3]
+            } for r in result.all()
+        ]
+        _plan_cache[batch_id] = plan
+
+    return {
+        "batch_id": batch_id,
+        "plan": plan
+    }
 
 
 # New Curriculum Selection and Daily Tasks Endpoints
@@ -142,6 +191,7 @@ class CurriculumSelectionRequest(BaseModel):
 @router.post("/select")
 def select_curriculum(
     selection: CurriculumSelectionRequest,
+    background_tasks: BackgroundTasks,
     current_user: UserOut = Depends(get_current_user)
 ):
     """User selects curriculum duration (one-time selection)"""
@@ -185,216 +235,188 @@ def select_curriculum(
         
         row = cur.fetchone()
         conn.commit()
-        
-        # Generate initial daily tasks for the first week
-        for i in range(7):
-            task_date = start_date + timedelta(days=i)
-            generate_daily_tasks(current_user.id, selection.duration_months, task_date)
-        
-        return {
-            "selection_id": row[0],
-            "duration_months": row[1],
-            "start_date": row[2],
-            "end_date": row[3],
-            "selected_at": row[4],
-            "message": "Curriculum plan selected successfully. Daily tasks have been generated for the first week."
-        }
-        
     finally:
+        # Released before task generation, which checks out its own connection
         conn.close()
 
+    # Generate initial daily tasks for the first week. Today's are ready before the
+    # response (the dashboard fetches them next); the other six days are batched
+    # after it is sent, on a connection the background task checks out itself.
+    generate_daily_tasks(current_user.id, selection.duration_months, start_date)
+    background_tasks.add_task(
+        generate_daily_tasks_for_dates,
+        current_user.id,
+        selection.duration_months,
+        [start_date + timedelta(days=i) for i in range(1, 7)],
+    )
+
+    return {
+        "selection_id": row[0],
+        "duration_months": row[1],
+        "start_date": row[2],
+        "end_date": row[3],
+        "selected_at": row[4],
+        "message": "Curriculum plan selected successfully. Today's tasks are ready; the rest of the first week is being generated."
+    }
+
 
 @router.get("/my-selection")
-def get_my_curriculum_selection(current_user: UserOut = Depends(get_current_user)):
+async def get_my_curriculum_selection(current_user: UserOut = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     """Get user's current curriculum selection"""
-    conn = get_db_connection()
-    try:
-        cur = conn.cursor()
-        
-        cur.execute("""
-            SELECT selection_id, duration_months, start_date, end_date, selected_at
-            FROM user_curriculum_selections
-            WHERE student_id = %s
-        """, (current_user.id,))
-        
-        row = cur.fetchone()
-        
-        if not row:
-            return {"message": "No curriculum selection found", "has_selection": False}
-        
-        # Calculate progress
-        start_date = row[2]
-        end_date = row[3]
-        today = date.today()
-        
-        total_days = (end_date - start_date).days
-        days_elapsed = (today - start_date).days if today >= start_date else 0
-        days_remaining = max(0, (end_date - today).days)
-        progress_percentage = min(100, max(0, (days_elapsed / total_days * 100) if total_days > 0 else 0))
-        
-        return {
-            "has_selection": True,
-            "selection_id": row[0],
-            "duration_months": row[1],
-            "start_date": row[2],
-            "end_date": row[3],
-            "selected_at": row[4],
-            "progress": {
-                "days_elapsed": days_elapsed,
-                "days_remaining": days_remaining,
-                "total_days": total_days,
-                "progress_percentage": round(progress_percentage, 2)
-            }
+    result = await db.execute(_MY_SELECTION_SQL, {"student_id": current_user.id})
+    row = result.first()
+    
+    if not row:
+        return {"message": "No curriculum selection found", "has_selection": False}
+    
+    return {
+        "has_selection": True,
+        "selection_id": row[0],
+        "duration_months": row[1],
+        "start_date": row[2],
+        "end_date": row[3],
+        "selected_at": row[4],
+        "progress": {
+            "days_elapsed": row[5],
+            "days_remaining": row[6],
+            "total_days": row[7],
+            "progress_percentage": row[8]
         }
-        
-    finally:
-        conn.close()
+    }
 
 
 @router.get("/daily-tasks")
-def get_daily_tasks(
+async def get_daily_tasks(
     task_date: Optional[date] = None,
-    current_user: UserOut = Depends(get_current_user)
+    current_user: UserOut = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Get daily tasks for the user. Defaults to today if no date provided."""
     if task_date is None:
         task_date = date.today()
     
-    conn = get_db_connection()
-    try:
-        cur = conn.cursor()
-        
-        # Check if user has a curriculum selection
-        cur.execute("""
-            SELECT duration_months FROM user_curriculum_selections
-            WHERE student_id = %s
-        """, (current_user.id,))
-        
-        selection = cur.fetchone()
-        if not selection:
-            return {
-                "message": "No curriculum selection found. Please select a curriculum plan first.",
-                "tasks": []
-            }
-        
-        duration_months = selection[0]
-        
-        # Check if tasks exist for this date
-        cur.execute("""
-            SELECT task_id, task_type, task_content, is_completed
-            FROM daily_tasks
-            WHERE student_id = %s AND task_date = %s
-            ORDER BY task_type, task_id
-        """, (current_user.id, task_date))
-        
-        rows = cur.fetchall()
-        
-        # If no tasks exist, generate them
-        if not rows:
-            tasks = generate_daily_tasks(current_user.id, duration_months, task_date)
-        else:
-            tasks = [
-                {
-                    "task_id": r[0],
-                    "task_type": r[1],
-                    "task_content": r[2] if isinstance(r[2], dict) else json.loads(r[2]) if isinstance(r[2], str) else r[2],
-                    "is_completed": r[3]
-                }
-                for r in rows
-            ]
-        
+    # Check if user has a curriculum selection and tasks exist for this date
+    result = await db.execute(_SELECTION_DAILY_TASKS_SQL, {"student_id": current_user.id, "task_date": task_date})
+    rows = result.all()
+    if not rows:
         return {
-            "task_date": task_date,
-            "tasks": tasks,
-            "total_tasks": len(tasks),
-            "completed_tasks": sum(1 for t in tasks if t.get("is_completed", False))
+            "message": "No curriculum selection found. Please select a curriculum plan first.",
+            "tasks": []
         }
-        
-    finally:
-        conn.close()
+    
+    duration_months = rows[0][0]
+    
+    # If no tasks exist, generate them (psycopg2 service, kept off the event loop)
+    if rows[0][1] is None:
+        tasks = await run_in_threadpool(generate_daily_tasks, current_user.id, duration_months, task_date)
+    else:
+        # jsonb is decoded by the codec registered in db/session.py
+        tasks = [
+            {
+                "task_id": r[1],
+                "task_type": r[2],
+                "task_content": r[3],
+                "is_completed": r[4]
+            }
+            for r in rows
+        ]
+    
+    return {
+        "task_date": task_date,
+        "tasks": tasks,
+        "total_tasks": len(tasks),
+        "completed_tasks": sum(1 for t in tasks if t.get("is_completed", False))
+    }
 
 
 @router.post("/daily-tasks/{task_id}/complete")
-def complete_task(
+async def complete_task(
     task_id: int,
-    current_user: UserOut = Depends(get_current_user)
+    background_tasks: BackgroundTasks,
+    current_user: UserOut = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Mark a daily task as completed"""
-    conn = get_db_connection()
-    try:
-        cur = conn.cursor()
-        
-        # Verify task belongs to user
-        cur.execute("""
-            SELECT task_id, is_completed FROM daily_tasks
-            WHERE task_id = %s AND student_id = %s
-        """, (task_id, current_user.id))
-        
-        task = cur.fetchone()
-        if not task:
+    # Mark as completed; only matches an owned, not-yet-completed task
+    result = await db.execute(_COMPLETE_TASK_SQL, {"task_id": task_id, "student_id": current_user.id})
+    completed = result.scalar_one_or_none()
+    await db.commit()
+    
+    if completed is None:
+        # Rare path: tell "not found" apart from "already completed"
+        result = await db.execute(_TASK_OWNED_SQL, {"task_id": task_id, "student_id": current_user.id})
+        if result.scalar_one_or_none() is None:
             raise HTTPException(status_code=404, detail="Task not found")
-        
-        if task[1]:  # Already completed
-            return {"message": "Task already completed", "task_id": task_id}
-        
-        # Mark as completed
-        cur.execute("""
-            UPDATE daily_tasks
-            SET is_completed = TRUE
-            WHERE task_id = %s AND student_id = %s
-        """, (task_id, current_user.id))
-        
-        conn.commit()
-        
-        # Check if regeneration is needed
-        regenerate_daily_tasks_if_needed(current_user.id)
-        
-        return {
-            "message": "Task marked as completed",
-            "task_id": task_id
-        }
-        
-    finally:
-        conn.close()
+        return {"message": "Task already completed", "task_id": task_id}
+    
+    # Check if regeneration is needed, after the response is sent
+    background_tasks.add_task(regenerate_daily_tasks_if_needed, current_user.id)
+    
+    return {
+        "message": "Task marked as completed",
+        "task_id": task_id
+    }
+
+
+class _SessionStreamingResponse(StreamingResponse):
+    """Closes its session once the response is finished, even if the client left before the body ran."""
+
+    def __init__(self, db: AsyncSession, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._db = db
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self._db.close()
+
+
+def _history_task(r) -> bytes:
+    return dumps({
+        "task_id": r[0],
+        "task_date": r[1],
+        "task_type": r[2],
+        "task_content": r[3],
+        "is_completed": r[4],
+        "created_at": r[5]
+    })
 
 
 @router.get("/daily-tasks/history")
-def get_task_history(
-    limit: int = 30,
+async def get_task_history(
+    limit: int = Query(30, ge=1, le=TASK_HISTORY_MAX_LIMIT),
     current_user: UserOut = Depends(get_current_user)
 ):
-    """Get task history for the user"""
-    conn = get_db_connection()
+    """Get task history for the user.
+
+    Rows are streamed from a server-side cursor and written out as they arrive, so
+    memory stays flat and the first bytes go out after the first row, whatever the
+    limit. The body has the same {"tasks": [...], "total": n} shape as before.
+    """
+    # Own session: the response body outlives the request's dependencies. The query
+    # is started and its first row read before the response is returned, so setup
+    # errors still surface as an HTTP error rather than a truncated 200 body.
+    db = SessionLocal()
     try:
-        cur = conn.cursor()
-        
-        cur.execute("""
-            SELECT task_id, task_date, task_type, task_content, is_completed, created_at
-            FROM daily_tasks
-            WHERE student_id = %s
-            ORDER BY task_date DESC, task_id
-            LIMIT %s
-        """, (current_user.id, limit))
-        
-        rows = cur.fetchall()
-        
-        return {
-            "tasks": [
-                {
-                    "task_id": r[0],
-                    "task_date": r[1],
-                    "task_type": r[2],
-                    "task_content": r[3] if isinstance(r[3], dict) else json.loads(r[3]) if isinstance(r[3], str) else r[3],
-                    "is_completed": r[4],
-                    "created_at": r[5]
-                }
-                for r in rows
-            ],
-            "total": len(rows)
-        }
-        
-    finally:
-        conn.close()
+        result = await db.stream(_TASK_HISTORY_SQL, {"student_id": current_user.id, "limit": limit})
+        first = await result.fetchone()
+    except Exception as e:
+        await db.close()
+        raise HTTPException(status_code=500, detail=f"Error fetching task history: {str(e)}")
+
+    async def stream_history():
+        total = 0
+        yield b'{"tasks":['
+        if first is not None:
+            yield _history_task(first)
+            total = 1
+            async for r in result:
+                yield b"," + _history_task(r)
+                total += 1
+        yield b'],"total":' + str(total).encode() + b"}"
+
+    return _SessionStreamingResponse(db, stream_history(), media_type="application/json")
 
 
 
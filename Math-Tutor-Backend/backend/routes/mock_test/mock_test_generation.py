@@ -3,45 +3,22 @@ from db.db_connection import get_db_connection
 from auth.deps import get_current_user
 from schemas.auth import UserOut
 from services.grading_service import (
-    verify_answer_correctness,
-    verify_solution_logical_flow,
+    verify_answer_and_solution,
     calculate_final_score,
 )
 from services.mock_test_service import (
+    fetch_problems_by_domain as _fetch_problems_by_domain,
     generate_entry_mock_test_for_user,
     generate_weakness_mock_test,
+    SCHEDULED_TEST_TYPE_PREFIX,
 )
 import json
 
 router = APIRouter()
 
-def parse_domains(domain_string: str) -> list:
-    """Parse comma-separated domain string into list of unique domains"""
-    if not domain_string or not domain_string.strip():
-        return []
-    domains = [d.strip() for d in domain_string.split(',')]
-    return list(set([d for d in domains if d]))
-
 def fetch_problems_by_domain(conn, domain: str, count: int) -> list:
     """Fetch problems for a specific domain with difficulty between 3.0 and 6.0"""
-    cur = conn.cursor()
-    try:
-        cur.execute("""
-            SELECT problem_id, domain, problem, solution, answer, difficulty_level, created_at
-            FROM omni_math_data
-            WHERE EXISTS (
-                SELECT 1 
-                FROM unnest(string_to_array(domain, ',')) AS d
-                WHERE LOWER(TRIM(d)) LIKE LOWER(%s)
-            )
-            AND difficulty_level >= 3.0 
-            AND difficulty_level <= 6.0
-            ORDER BY RANDOM()
-            LIMIT %s;
-        """, (f"%{domain}%", count))
-        return cur.fetchall()
-    finally:
-        cur.close()
+    return _fetch_problems_by_domain(conn, domain, count, min_diff=3.0, max_diff=6.0)
 
 @router.get("/entry_mock_test")
 def generate_entry_mock_test(current_user: UserOut = Depends(get_current_user)):
@@ -99,7 +76,8 @@ def get_user_mock_tests(current_user: UserOut = Depends(get_current_user)):
                     continue
 
                 cur.execute("""
-                    SELECT problem_id, domain, problem, solution, answer, difficulty_level, created_at
+                    SELECT problem_id, ARRAY(SELECT DISTINCT d FROM unnest(domain_arr) d WHERE d <> ''),
+                           problem, solution, answer, difficulty_level, created_at
                     FROM omni_math_data
                     WHERE problem_id = ANY(%s);
                 """, (problem_ids,))
@@ -111,7 +89,7 @@ def get_user_mock_tests(current_user: UserOut = Depends(get_current_user)):
 
                 for row in problem_rows:
                     problem_id = row[0]
-                    domain_list = parse_domains(row[1])
+                    domain_list = row[1]
 
                     problem = {
                         "problem_id": problem_id,
@@ -136,9 +114,10 @@ def get_user_mock_tests(current_user: UserOut = Depends(get_current_user)):
                     difficulty_range = "N/A"
 
                 grade_info = None
+                grading_status = None
                 if status == 'completed':
                     cur.execute("""
-                        SELECT submission_id FROM test_submissions
+                        SELECT submission_id, status FROM test_submissions
                         WHERE test_id = %s AND student_id = %s
                         LIMIT 1
                     """, (test_id, str(current_user.id)))
@@ -146,6 +125,9 @@ def get_user_mock_tests(current_user: UserOut = Depends(get_current_user)):
 
                     if submission_row:
                         submission_id = submission_row[0]
+                        # Scheduled tests stay 'processing' until their grading batch
+                        # is collected, which can take up to a day
+                        grading_status = "graded" if submission_row[1] == 'graded' else "pending"
                         cur.execute("""
                             SELECT 
                                 COUNT(*) as total_problems,
@@ -175,6 +157,7 @@ def get_user_mock_tests(current_user: UserOut = Depends(get_current_user)):
                     "problems": all_problems,
                     "created_at": created_at.isoformat() if created_at else None,
                     "status": status,
+                    "grading_status": grading_status,
                     "grade": grade_info,
                 })
 
@@ -229,12 +212,14 @@ def generate_targeted_test(current_user: UserOut = Depends(get_current_user)):
             all_problems = []
             domain_counts: dict = {}
             if problem_ids:
+                # Unique, non-empty domains straight from the domain_arr column
                 cur.execute(
-                    "SELECT problem_id, domain, problem, solution, answer, difficulty_level, created_at FROM omni_math_data WHERE problem_id = ANY(%s)",
+                    "SELECT problem_id, ARRAY(SELECT DISTINCT d FROM unnest(domain_arr) d WHERE d <> ''), "
+                    "problem, solution, answer, difficulty_level, created_at FROM omni_math_data WHERE problem_id = ANY(%s)",
                     (problem_ids,),
                 )
                 for pr in cur.fetchall():
-                    domains = parse_domains(pr[1])
+                    domains = pr[1]
                     all_problems.append({
                         "problem_id": pr[0], "domain": domains, "problem": pr[2],
                         "solution": pr[3], "answer": pr[4], "difficulty_level": pr[5],
@@ -281,7 +266,7 @@ def submit_test(test_id: int, current_user: UserOut = Depends(get_current_user))
         cur = conn.cursor()
         try:
             cur.execute("""
-                SELECT test_id, problems, COALESCE(status, 'not_started') as status
+                SELECT test_id, problems, COALESCE(status, 'not_started') as status, test_type
                 FROM mock_tests
                 WHERE test_id = %s AND student_id = %s
             """, (test_id, current_user.id))
@@ -290,7 +275,7 @@ def submit_test(test_id: int, current_user: UserOut = Depends(get_current_user))
             if not test_row:
                 raise HTTPException(status_code=404, detail="Test not found or access denied")
 
-            _, problems_json, current_status = test_row
+            _, problems_json, current_status, test_type = test_row
 
             if current_status == 'completed':
                 raise HTTPException(status_code=400, detail="Test already completed")
@@ -340,65 +325,84 @@ def submit_test(test_id: int, current_user: UserOut = Depends(get_current_user))
 
             conn.commit()
 
-            try:
-                cur.execute("""
-                    SELECT ps.problem_id, ps.student_solution, ps.student_answer, oml.answer, oml.solution, oml.domain
-                    FROM problem_submissions ps
-                    JOIN omni_math_data oml ON oml.problem_id = ps.problem_id
-                    WHERE ps.submission_id = %s
-                """, (submission_id,))
-
-                rows = cur.fetchall()
+            # Scheduled tests are graded later through the OpenAI Batch API (events/functions.py);
+            # the submission stays 'processing' until those results are stored.
+            batch_graded = submitted_count > 0 and (test_type or "").startswith(SCHEDULED_TEST_TYPE_PREFIX)
+            # "pending" until results are stored: batch-graded tests, or inline grading that failed
+            grading_status = "pending"
 
-                if rows:
+            if not batch_graded:
+                try:
+                    cur.execute("""
+                        SELECT ps.problem_id, ps.student_solution, ps.student_answer, oml.answer, oml.solution, oml.domain
+                        FROM problem_submissions ps
+                        JOIN omni_math_data oml ON oml.problem_id = ps.problem_id
+                        WHERE ps.submission_id = %s
+                    """, (submission_id,))
+
+                    rows = cur.fetchall()
+                    # No pooled connection is held across the model calls; results are
+                    # written on a fresh one
+                    cur.close()
+                    conn.close()
+
+                    graded = []
                     for problem_id, student_solution, student_answer, correct_answer, ref_solution, domain in rows:
                         student_answer = student_answer or student_solution or ""
 
-                        ar = verify_answer_correctness(student_answer, correct_answer)
-                        sr = verify_solution_logical_flow(student_solution or "", ref_solution or "", correct_answer or "")
-                        score = calculate_final_score(ar, sr)
+                        ar, sr = verify_answer_and_solution(student_answer, student_solution or "", correct_answer, ref_solution or "")
+                        graded.append((problem_id, ar, sr, calculate_final_score(ar, sr)))
 
-                        cur.execute("""
-                            SELECT result_id FROM grading_results
-                            WHERE submission_id = %s AND problem_id = %s
-                        """, (submission_id, problem_id))
-
-                        existing = cur.fetchone()
-
-                        if not existing:
+                    conn = get_db_connection()
+                    cur = conn.cursor()
+                    if graded:
+                        for problem_id, ar, sr, score in graded:
                             cur.execute("""
-                                INSERT INTO grading_results (
-                                  submission_id, problem_id, answer_correctness, answer_is_correct,
-                                  logical_flow_score, first_error_step_index, error_summary,
-                                  final_score, percentage, grading_breakdown
-                                ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                            """, (
-                                submission_id,
-                                problem_id,
-                                ar.get("confidence"),
-                                ar.get("is_correct"),
-                                sr.get("logical_score"),
-                                sr.get("first_error_step_index"),
-                                sr.get("error_summary"),
-                                score.get("final_score"),
-                                score.get("percentage"),
-                                None,
-                            ))
-
-                cur.execute(
-                    "UPDATE test_submissions SET status='graded' WHERE submission_id=%s",
-                    (submission_id,),
-                )
-                conn.commit()
-            except Exception as grading_error:
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.error(f"Error during grading for submission {submission_id}: {str(grading_error)}")
+                                SELECT result_id FROM grading_results
+                                WHERE submission_id = %s AND problem_id = %s
+                            """, (submission_id, problem_id))
+
+                            existing = cur.fetchone()
+
+                            if not existing:
+                                cur.execute("""
+                                    INSERT INTO grading_results (
+                                      submission_id, problem_id, answer_correctness, answer_is_correct,
+                                      logical_flow_score, first_error_step_index, error_summary,
+                                      final_score, percentage, grading_breakdown
+                                    ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+                                """, (
+                                    submission_id,
+                                    problem_id,
+                                    ar.get("confidence"),
+                                    ar.get("is_correct"),
+                                    sr.get("logical_score"),
+                                    sr.get("first_error_step_index"),
+                                    sr.get("error_summary"),
+                                    score.get("final_score"),
+                                    score.get("percentage"),
+                                    None,
+                                ))
+
+                    cur.execute(
+                        "UPDATE test_submissions SET status='graded' WHERE submission_id=%s AND status IS DISTINCT FROM 'graded'",
+                        (submission_id,),
+                    )
+                    conn.commit()
+                    grading_status = "graded"
+                except Exception as grading_error:
+                    import logging
+                    logger = logging.getLogger(__name__)
+                    logger.error(f"Error during grading for submission {submission_id}: {str(grading_error)}")
 
             if submitted_count == 0:
                 message = "Test submitted early (no problems submitted). Test marked as completed."
             elif submitted_count < len(problem_ids):
                 message = f"Test submitted early ({submitted_count}/{len(problem_ids)} problems submitted). Grading initiated for submitted problems."
+                if batch_graded:
+                    message += " Results will be ready within 24 hours."
+            elif batch_graded:
+                message = "Test submitted successfully. Results will be ready within 24 hours."
             else:
                 message = "Test submitted successfully and grading initiated"
 
@@ -406,6 +410,7 @@ def submit_test(test_id: int, current_user: UserOut = Depends(get_current_user))
                 "test_id": test_id,
                 "submission_id": submission_id,
                 "status": "completed",
+                "grading_status": grading_status,
                 "message": message,
                 "submitted_count": submitted_count,
                 "total_problems": len(problem_ids)
@@ -10,8 +10,7 @@ from db.db_connection import get_db_connection
 from schemas.auth import UserOut
 from services.grading_service import (
     calculate_final_score,
-    verify_answer_correctness,
-    verify_solution_logical_flow,
+    verify_answer_and_solution,
 )
 
 logger = logging.getLogger(__name__)
@@ -178,21 +177,13 @@ def start_session(body: StartRequest, current_user: UserOut = Depends(get_curren
 
         # ── get (or create) the student's Practice Session mock_test ────────
         cur.execute("""
-            SELECT test_id FROM mock_tests
-            WHERE student_id = %s AND test_type = 'Practice Session'
-            LIMIT 1
+            INSERT INTO mock_tests (test_type, student_id, problems, status)
+            VALUES ('Practice Session', %s, '[]'::jsonb, 'in_progress')
+            ON CONFLICT (student_id) WHERE test_type = 'Practice Session'
+            DO UPDATE SET student_id = EXCLUDED.student_id
+            RETURNING test_id
         """, (current_user.id,))
-        mt = cur.fetchone()
-
-        if mt:
-            mock_test_id = mt[0]
-        else:
-            cur.execute("""
-                INSERT INTO mock_tests (test_type, student_id, problems, status)
-                VALUES ('Practice Session', %s, '[]'::jsonb, 'in_progress')
-                RETURNING test_id
-            """, (current_user.id,))
-            mock_test_id = cur.fetchone()[0]
+        mock_test_id = cur.fetchone()[0]
 
         # ── pick first problem ──────────────────────────────────────────────
         first = _pick_problem(cur, body.domain, start_diff, [])
@@ -338,10 +329,21 @@ def grade_session_problem(
         student_solution, student_answer, correct_answer, ref_solution = sub
         student_answer = student_answer or student_solution or ""
 
+        cur.execute(
+            "SELECT problem FROM omni_math_data WHERE problem_id = %s",
+            (cur_pid,),
+        )
+        prob_row = cur.fetchone()
+        problem_text = prob_row[0] if prob_row else ""
+
+        # No pooled connection is held across the model calls below; the results
+        # are written on a fresh one
+        conn.commit()
+        conn.close()
+
         # ── run grading pipeline ────────────────────────────────────────────
-        ar = verify_answer_correctness(student_answer, correct_answer or "")
-        sr = verify_solution_logical_flow(
-            student_solution or "", ref_solution or "", correct_answer or ""
+        ar, sr = verify_answer_and_solution(
+            student_answer, student_solution or "", correct_answer or "", ref_solution or ""
         )
         score_data = calculate_final_score(ar, sr)
 
@@ -353,6 +355,8 @@ def grade_session_problem(
         is_correct = verdict == "correct"
 
         # ── persist grading result (feeds analytics) ────────────────────────
+        conn = get_db_connection()
+        cur = conn.cursor()
         cur.execute("""
             SELECT result_id FROM grading_results
             WHERE submission_id = %s AND problem_id = %s
@@ -416,26 +420,19 @@ def grade_session_problem(
             ))
 
         conn.commit()
+        conn.close()
 
         # Generate rich feedback for any score below 100%
         hint_provided = None
         try:
             from services.tutor_service import generate_diagnostic_feedback
 
-            cur.execute(
-                "SELECT problem, solution FROM omni_math_data WHERE problem_id = %s",
-                (cur_pid,),
-            )
-            prob_row = cur.fetchone()
-            problem_text = prob_row[0] if prob_row else ""
-            ref_sol = prob_row[1] if prob_row else ""
-
             hint_provided = generate_diagnostic_feedback(
                 problem=problem_text,
                 student_answer=student_answer,
                 correct_answer=correct_answer or "",
                 student_solution=student_solution or "",
-                ref_solution=ref_sol,
+                ref_solution=ref_solution or "",
                 is_correct=is_correct,
                 verdict=verdict,
             )
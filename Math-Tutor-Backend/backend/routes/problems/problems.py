@@ -1,48 +1,49 @@
-from fastapi import APIRouter, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException
 from typing import List, Optional
-from db.db_connection import get_db_connection
+from cachetools import TTLCache
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.session import get_db
 from models.problem_model import Problem
 import json
 
 router = APIRouter()
 
-def parse_domains(domain_string: str) -> List[str]:
-    """Parse comma-separated domain string into list of unique domains"""
-    if not domain_string or not domain_string.strip():
-        return []
-    domains = [d.strip() for d in domain_string.split(',')]
-    domains = list(set([d for d in domains if d]))
-    return domains
+# (problem_id, include_embedding) -> Problem. Problems are effectively immutable
+# once ingested, so a long TTL is safe; the cache is per worker.
+_problem_cache: TTLCache = TTLCache(maxsize=10_000, ttl=3600)
+
+
+def _problem_columns(include_embedding: bool) -> str:
+    # The 384-dim embedding is ~1.5 KB per row as text and rarely used by clients,
+    # so it is only shipped when asked for.
+    embedding = "embedding::text" if include_embedding else "NULL"
+    return f"problem_id, domain_arr, problem, solution, answer, difficulty_level, source, {embedding}, created_at"
 
 @router.get("/problems/domain", response_model=List[Problem])
-def get_problems_by_domain(domain: str, limit: int = 10):
+async def get_problems_by_domain(domain: str, limit: int = 10, include_embedding: bool = False, db: AsyncSession = Depends(get_db)):
     """
     Get problems by domain.
-    Uses PostgreSQL array functions to search within the domain string.
+    Case-insensitive substring match against each domain element ("algebra" matches
+    "Linear Algebra"). The ILIKE on the whole domain string is answered by its
+    trigram index and only narrows the rows; the domain_arr check keeps a match
+    from spanning two elements.
     """
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-
-        cur.execute("""
-            SELECT problem_id, domain, problem, solution, answer, difficulty_level, source, embedding, created_at
+        result = await db.execute(text(f"""
+            SELECT {_problem_columns(include_embedding)}
             FROM omni_math_data
-            WHERE EXISTS (
-                SELECT 1 
-                FROM unnest(string_to_array(domain, ',')) AS d
-                WHERE LOWER(TRIM(d)) LIKE LOWER(%s)
-            )
-            LIMIT %s;
-        """, (f"%{domain}%", limit))
+            WHERE domain ILIKE :pattern
+              AND EXISTS (SELECT 1 FROM unnest(domain_arr) AS d WHERE d ILIKE :pattern)
+            LIMIT :limit;
+        """), {"pattern": f"%{domain.strip()}%", "limit": limit})
 
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
+        rows = result.all()
 
         return [
             Problem(
                 problem_id=row[0],
-                domain=parse_domains(row[1]),
+                domain=row[1] or [],
                 problem=row[2],
                 solution=row[3],
                 answer=row[4],
@@ -58,26 +59,21 @@ def get_problems_by_domain(domain: str, limit: int = 10):
 
 
 @router.get("/problems/source", response_model=List[Problem])
-def get_problems_by_source(source: str, limit: int = 10):
+async def get_problems_by_source(source: str, limit: int = 10, include_embedding: bool = False, db: AsyncSession = Depends(get_db)):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-
-        cur.execute("""
-            SELECT problem_id, domain, problem, solution, answer, difficulty_level, source, embedding, created_at
+        result = await db.execute(text(f"""
+            SELECT {_problem_columns(include_embedding)}
             FROM omni_math_data
-            WHERE LOWER(source) = LOWER(%s)
-            LIMIT %s;
-        """, (source, limit))
+            WHERE LOWER(source) = LOWER(:source)
+            LIMIT :limit;
+        """), {"source": source, "limit": limit})
 
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
+        rows = result.all()
 
         return [
             Problem(
                 problem_id=row[0],
-                domain=parse_domains(row[1]),
+                domain=row[1] or [],
                 problem=row[2],
                 solution=row[3],
                 answer=row[4],
@@ -93,26 +89,21 @@ def get_problems_by_source(source: str, limit: int = 10):
 
 
 @router.get("/problems", response_model=List[Problem])
-def get_all_problems(limit: int = 10, offset: int = 0):
+async def get_all_problems(limit: int = 10, offset: int = 0, include_embedding: bool = False, db: AsyncSession = Depends(get_db)):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-
-        cur.execute("""
-            SELECT problem_id, domain, problem, solution, answer, difficulty_level, source, embedding, created_at
+        result = await db.execute(text(f"""
+            SELECT {_problem_columns(include_embedding)}
             FROM omni_math_data
             ORDER BY created_at DESC
-            LIMIT %s OFFSET %s;
-        """, (limit, offset))
+            LIMIT :limit OFFSET :offset;
+        """), {"limit": limit, "offset": offset})
 
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
+        rows = result.all()
 
         return [
             Problem(
                 problem_id=row[0],
-                domain=parse_domains(row[1]),
+                domain=row[1] or [],
                 problem=row[2],
                 solution=row[3],
                 answer=row[4],
@@ -127,27 +118,25 @@ def get_all_problems(limit: int = 10, offset: int = 0):
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 @router.get("/problems/{problem_id}", response_model=Problem)
-def get_problem_by_id(problem_id: int):
+async def get_problem_by_id(problem_id: int, include_embedding: bool = False, db: AsyncSession = Depends(get_db)):
+    cached = _problem_cache.get((problem_id, include_embedding))
+    if cached is not None:
+        return cached
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-
-        cur.execute("""
-            SELECT problem_id, domain, problem, solution, answer, difficulty_level, source, embedding, created_at
+        result = await db.execute(text(f"""
+            SELECT {_problem_columns(include_embedding)}
             FROM omni_math_data
-            WHERE problem_id = %s;
-        """, (problem_id,))
+            WHERE problem_id = :problem_id;
+        """), {"problem_id": problem_id})
 
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
+        row = result.first()
 
         if row is None:
             raise HTTPException(status_code=404, detail="Problem not found")
 
-        return Problem(
+        problem = Problem(
             problem_id=row[0],
-            domain=parse_domains(row[1]),
+            domain=row[1] or [],
             problem=row[2],
             solution=row[3],
             answer=row[4],
@@ -156,6 +145,8 @@ def get_problem_by_id(problem_id: int):
             embedding=row[7],
             created_at=row[8]
         )
+        _problem_cache[(problem_id, include_embedding)] = problem
+        return problem
     except HTTPException:
         raise
     except Exception as e:
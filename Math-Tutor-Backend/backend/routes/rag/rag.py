@@ -1,30 +1,29 @@
-from fastapi import APIRouter
-from sentence_transformers import SentenceTransformer
-from db.db_connection import get_db_connection
+from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.session import get_db
+from services.embedding_service import encode_text
+from routes.rag.tutor import wait_for_models
 
 router = APIRouter()
-model = None
 
-@router.get("/search")
-def semantic_search(query: str, limit: int = 5):
-    global model
-    if model is None:
-        model = SentenceTransformer("all-MiniLM-L6-v2")
-    embedding = model.encode(query).tolist()
+@router.get("/search", dependencies=[Depends(wait_for_models)])
+async def semantic_search(query: str, limit: int = 5, db: AsyncSession = Depends(get_db)):
+    # Shared, process-wide model (preloaded at startup) instead of a per-module copy.
+    # Encoding is CPU-bound, so it runs in the threadpool off the event loop.
+    embedding = await run_in_threadpool(encode_text, query)
+    # pgvector text literal; asyncpg sends types without a codec as text
+    embedding_literal = "[" + ",".join(map(str, embedding.tolist())) + "]"
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    cur.execute("""
+    result = await db.execute(text("""
         SELECT problem_id, problem, solution, answer, domain, difficulty_level
         FROM omni_math_data
-        ORDER BY embedding <-> %s
-        LIMIT %s;
-    """, (embedding, limit))
+        ORDER BY (embedding::halfvec(384)) <-> CAST(:embedding AS halfvec(384))
+        LIMIT :limit;
+    """), {"embedding": embedding_literal, "limit": limit})
 
-    results = cur.fetchall()
-    cur.close()
-    conn.close()
+    results = result.all()
 
     return [
         {
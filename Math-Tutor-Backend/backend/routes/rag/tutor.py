@@ -1,5 +1,5 @@
 # tutor.py
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel
 import logging
 from services.tutor_service import generate_tutor_chat_response
@@ -14,7 +14,18 @@ class ChatRequest(BaseModel):
     query: str
 
 
-@router.post("/rag/chat")
+async def wait_for_models(request: Request) -> None:
+    """Dependency for endpoints that encode with the embedding model.
+
+    Waits on the event loop until the startup preload (main.py) has finished, so
+    early requests don't park threadpool workers on the model loader's lock.
+    """
+    models_ready = getattr(request.app.state, "models_ready", None)
+    if models_ready is not None:
+        await models_ready.wait()
+
+
+@router.post("/rag/chat", dependencies=[Depends(wait_for_models)])
 def chat_tutor(
     request: ChatRequest,
     current_user: UserOut = Depends(get_current_user)
@@ -1,284 +1,215 @@
 # grading.py
+import asyncio
 import logging
-from fastapi import APIRouter, HTTPException
+import os
+from fastapi import APIRouter, Depends, HTTPException
 from db.db_connection import get_db_connection
-from typing import Optional
+from db.session import get_db
+from responses import ORJSONResponse
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Union
 
 logger = logging.getLogger(__name__)
 from services.grading_service import (
-    verify_answer_correctness,
-    verify_solution_logical_flow,
-    check_relevance,
-    extract_solution_structure,
+    verify_answer_and_solution_async,
+    verify_solution_logical_flow_async,
+    check_relevance_async,
+    extract_solution_structure_async,
+)
+from services.grading_results_service import (
+    PROOF_BYPASS_RESULT,
+    IrrelevantProblem,
+    grading_feedback,
+    grading_result_row,
+    score_verification,
+    store_grading_results,
 )
-try:
-    from services.tutor_service import generate_diagnostic_feedback
-except ImportError:
-    from services.tutor_service import generate_wrong_answer_feedback as generate_diagnostic_feedback
 
 router = APIRouter()
 
 
-def get_verdict(percentage: float) -> str:
-    """Map a percentage score to a three-state verdict."""
-    if percentage >= 90:
-        return "correct"
-    if percentage >= 50:
-        return "partially_correct"
-    return "incorrect"
+# Read statements are module-level constants run on the asyncpg engine, which
+# prepares each one per connection and reuses the plan (see db/session.py).
+# Strict Pipeline grades only the requested problem; without problem_id every
+# problem in the submission is graded (legacy behavior).
+_ROWS_TO_GRADE_SQL = text("""
+    SELECT ps.problem_id, ps.ocr_text, ps.student_solution, ps.student_answer,
+           oml.answer, oml.solution, oml.domain, oml.problem,
+           -- proof-keyword heuristic, same substrings the Python scan used to match
+           oml.problem ~* 'prove|show that|demonstrate' AS is_proof_hint
+    FROM problem_submissions ps
+    JOIN omni_math_data oml ON oml.problem_id = ps.problem_id
+    WHERE ps.submission_id = :submission_id
+      AND (CAST(:problem_id AS INTEGER) IS NULL OR ps.problem_id = :problem_id)
+""").execution_options(yield_per=64)
+# Columns are aliased to the response keys and the verdict is derived in SQL
+# (same thresholds as get_verdict), so rows map straight onto the response.
+_RESULTS_SQL = text("""
+    SELECT gr.problem_id,
+           gr.answer_is_correct,
+           gr.answer_correctness AS answer_confidence,
+           gr.logical_flow_score,
+           gr.percentage,
+           gr.first_error_step_index,
+           gr.error_summary,
+           gr.hint_provided,
+           gr.final_score,
+           CASE WHEN COALESCE(gr.percentage, 0) >= 90 THEN 'correct'
+                WHEN COALESCE(gr.percentage, 0) >= 50 THEN 'partially_correct'
+                ELSE 'incorrect'
+           END AS verdict
+    FROM grading_results gr
+    WHERE gr.submission_id = :submission_id
+    ORDER BY gr.problem_id
+""")
+
+
+# Problems of one submission are graded concurrently; each one spends almost all
+# of its time waiting on model APIs, so this bounds in-flight calls per request.
+GRADING_CONCURRENCY = int(os.getenv("GRADING_CONCURRENCY", "8"))
+
+
+# Safe defaults when a verification call fails
+_ANSWER_FALLBACK = {"is_correct": False, "confidence": 0.0}
+_LOGIC_FALLBACK = {"logical_score": 0.0, "step_count": 0, "valid_steps": 0, "first_error_step_index": 0, "error_summary": "Evaluation failed"}
+
+
+async def _verify(submission_id: int, structured_answer: str, structured_steps: str, correct_answer, ref_solution: str) -> tuple:
+    try:
+        return await verify_answer_and_solution_async(structured_answer, structured_steps, correct_answer, ref_solution)
+    except Exception as exc:
+        logger.error(f"verify_answer_and_solution failed for submission {submission_id}: {exc}")
+        return dict(_ANSWER_FALLBACK), dict(_LOGIC_FALLBACK)
 
 
-@router.post("/grade_submission/{submission_id}")
-def grade_submission(submission_id: int, problem_id: Optional[int] = None):
+async def _verify_logic(submission_id: int, structured_steps: str, ref_solution: str, correct_answer: str) -> dict:
+    try:
+        return await verify_solution_logical_flow_async(structured_steps, ref_solution, correct_answer)
+    except Exception as exc:
+        logger.error(f"verify_solution_logical_flow failed for submission {submission_id}: {exc}")
+        return dict(_LOGIC_FALLBACK)
+
+
+async def _grade_row(submission_id: int, row) -> Union[tuple, IrrelevantProblem]:
+    """Run the grading pipeline for one problem; returns its grading_results row."""
+    (problem_id, ocr_text, student_solution, student_answer, correct_answer, ref_solution, domain,
+     problem_text, is_proof_hint) = row
+    
+    # 1. Relevance Check (Gatekeeper)
+    # Use ocr_text if available, else fallback to student_solution
+    text_to_check = ocr_text or student_solution or ""
+
+    # Structure extraction only needs the OCR text, so it starts alongside the
+    # relevance check and is cancelled as soon as the submission is found irrelevant.
+    structure_task = asyncio.create_task(extract_solution_structure_async(ocr_text)) if ocr_text else None
+    try:
+        is_relevant, relevance_reason = await check_relevance_async(text_to_check, problem_text)
+    except BaseException:
+        if structure_task is not None:
+            structure_task.cancel()
+        raise
+
+    if not is_relevant:
+        if structure_task is not None:
+            structure_task.cancel()
+        logger.info(
+            f"Submission {submission_id} problem {problem_id} flagged as irrelevant. "
+            f"Reason: {relevance_reason}"
+        )
+        # Its all-zero row is written by SQL in _store_grading_results
+        return IrrelevantProblem(problem_id, relevance_reason)
+
+    # 2. Structure Extraction
+    # Heuristic: proof keywords in the problem text (matched in SQL) mark it as a
+    # proof even if extraction doesn't flag it
+    is_proof = bool(is_proof_hint)
+    # If we have raw OCR text, use it to split steps vs answer
+    if ocr_text:
+        structure = await structure_task
+        structured_answer = structure.get("student_answer", "")
+        structured_steps = "\n".join(structure.get("student_steps", []))
+        is_proof = is_proof or structure.get("is_proof", False)
+    else:
+        structured_answer = student_answer or ""
+        structured_steps = student_solution or ""
+
+    # 3 + 4. Answer and Logical Flow Verification, in a single model request
+    if is_proof:
+        # For proofs, "Final Answer" verification is less strict or N/A.
+        # We assume correct if logic is sound.
+        ar = dict(PROOF_BYPASS_RESULT)
+        sr = await _verify_logic(submission_id, structured_steps, ref_solution or "", correct_answer or "")
+    else:
+        ar, sr = await _verify(submission_id, structured_answer, structured_steps, correct_answer, ref_solution or "")
+
+    # 5. Waterfall Scoring Logic
+    percentage, verdict = score_verification(is_proof, ar, sr)
+
+    # 6. Feedback Generation — fixed praise for fully correct work with near-perfect
+    # logic, otherwise an embedding lookup + sync LLM call, kept off the event loop
+    hint_provided = await asyncio.to_thread(
+        grading_feedback,
+        verdict,
+        sr,
+        problem=problem_text,
+        student_answer=structured_answer,
+        correct_answer=correct_answer,
+        student_solution=structured_steps,
+        ref_solution=ref_solution,
+    )
+
+    return grading_result_row(submission_id, problem_id, ar, sr, percentage, verdict, hint_provided)
+
+
+def _store_grading_results(submission_id: int, results: list, irrelevant: List[IrrelevantProblem]) -> None:
     conn = get_db_connection()
     try:
         with conn:
             with conn.cursor() as cur:
-                if problem_id:
-                    # Strict Pipeline: Grade only the specific problem requested
-                    cur.execute(
-                        """
-                        SELECT ps.problem_id, ps.ocr_text, ps.student_solution, ps.student_answer,
-                               oml.answer, oml.solution, oml.domain, oml.problem
-                        FROM problem_submissions ps
-                        JOIN omni_math_data oml ON oml.problem_id = ps.problem_id
-                        WHERE ps.submission_id = %s AND ps.problem_id = %s
-                        """,
-                        (submission_id, problem_id),
-                    )
-                else:
-                    # Fallback: Grade all problems in submission (legacy behavior)
-                    cur.execute(
-                        """
-                        SELECT ps.problem_id, ps.ocr_text, ps.student_solution, ps.student_answer,
-                               oml.answer, oml.solution, oml.domain, oml.problem
-                        FROM problem_submissions ps
-                        JOIN omni_math_data oml ON oml.problem_id = ps.problem_id
-                        WHERE ps.submission_id = %s
-                        """,
-                        (submission_id,),
-                    )
-                
-                rows = cur.fetchall()
-                if not rows:
-                    raise HTTPException(status_code=404, detail="No problem submissions found")
-
-                # Wipe ALL previous grading results for this submission up front.
-                # Because practice submissions reuse the same submission_id for the same
-                # student, old results from previous problems would otherwise linger in
-                # the table and be returned alongside the new result, causing the wrong
-                # problem's verdict to appear in the UI.
-                cur.execute(
-                    "DELETE FROM grading_results WHERE submission_id = %s",
-                    (submission_id,),
-                )
-
-                total_percentage = 0.0
-                for row in rows:
-                    problem_id, ocr_text, student_solution, student_answer, correct_answer, ref_solution, domain, problem_text = row
-                    
-                    # 1. Relevance Check (Gatekeeper)
-                    # Use ocr_text if available, else fallback to student_solution
-                    text_to_check = ocr_text or student_solution or ""
-
-                    is_relevant, relevance_reason = check_relevance(text_to_check, problem_text)
-
-                    if not is_relevant:
-                        logger.info(
-                            f"Submission {submission_id} problem {problem_id} flagged as irrelevant. "
-                            f"Reason: {relevance_reason}"
-                        )
-                        irrelevance_feedback = (
-                            f"Your submission does not appear to be an attempt at the assigned problem. "
-                            f"Reason: {relevance_reason}"
-                        )
-
-                        cur.execute(
-                            """
-                            INSERT INTO grading_results (
-                                submission_id, problem_id,
-                                answer_correctness, answer_is_correct,
-                                logical_flow_score, first_error_step_index, error_summary,
-                                final_score, percentage, grading_breakdown,
-                                hint_provided
-                            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                            """,
-                            (
-                                submission_id, problem_id,
-                                0.0, False, 0.0, 0, f"Submission irrelevant: {relevance_reason}",
-                                0.0, 0.0, None,
-                                irrelevance_feedback,
-                            )
-                        )
-                        continue
-
-                    # 2. Structure Extraction
-                    is_proof = False
-                    # If we have raw OCR text, use it to split steps vs answer
-                    if ocr_text:
-                        structure = extract_solution_structure(ocr_text)
-                        structured_answer = structure.get("student_answer", "")
-                        structured_steps = "\n".join(structure.get("student_steps", []))
-                        is_proof = structure.get("is_proof", False)
-                    else:
-                        structured_answer = student_answer or ""
-                        structured_steps = student_solution or ""
-                    
-                    # Heuristic: Check for proof keywords in problem text if extraction didn't flag it
-                    if not is_proof and problem_text:
-                        lower_prob = problem_text.lower()
-                        if any(k in lower_prob for k in ["prove", "show that", "demonstrate"]):
-                            is_proof = True
-
-                    # 3. Answer Verification
-                    if is_proof:
-                        # For proofs, "Final Answer" verification is less strict or N/A.
-                        # We assume correct if logic is sound.
-                        ar = {"is_correct": True, "confidence": 1.0, "match_type": "proof_bypass"}
-                    else:
-                        try:
-                            ar = verify_answer_correctness(structured_answer, correct_answer)
-                        except Exception as exc:
-                            logger.error(f"verify_answer_correctness failed for submission {submission_id}: {exc}")
-                            # Fallback to safe defaults
-                            ar = {"is_correct": False, "confidence": 0.0}
-
-                    # 4. Logical Flow Verification
-                    try:
-                        sr = verify_solution_logical_flow(structured_steps, ref_solution or "", correct_answer or "")
-                    except Exception as exc:
-                        logger.error(f"verify_solution_logical_flow failed for submission {submission_id}: {exc}")
-                        sr = {"logical_score": 0.0, "step_count": 0, "valid_steps": 0, "first_error_step_index": 0, "error_summary": "Evaluation failed"}
-
-                    # 5. Waterfall Scoring Logic
-                    answer_correct = ar.get("is_correct", False)
-                    logic_score = float(sr.get("logical_score", 0.0))
-                    
-                    percentage = 0.0
-                    
-                    if is_proof:
-                        # For proofs, logic score is the main driver
-                        if logic_score >= 0.8:
-                            percentage = 100.0
-                            answer_correct = True # override if it was somehow false
-                        elif logic_score >= 0.5:
-                            percentage = 75.0
-                            answer_correct = True
-                        elif logic_score >= 0.3:
-                            percentage = 40.0
-                            answer_correct = False # Treat low logic proof as incorrect
-                        else:
-                            percentage = 0.0
-                            answer_correct = False
-                    elif answer_correct:
-                        if logic_score >= 0.7:
-                            # High confidence correct
-                            percentage = 100.0
-                        elif logic_score >= 0.4:
-                            # Correct answer, shaky logic
-                            percentage = 80.0
-                        else:
-                            # Correct answer, bad/missing logic (Lucky guess?)
-                            percentage = 40.0
-                    else:
-                        if logic_score >= 0.8:
-                            # Wrong answer, but great logic (calculation error?)
-                            percentage = 60.0
-                        elif logic_score >= 0.4:
-                            # Wrong answer, some valid steps
-                            percentage = 30.0
-                        else:
-                            # Wrong answer, bad logic
-                            percentage = 0.0
-                            
-                    final_score = percentage / 100.0
-                    verdict = get_verdict(percentage)
-                    # answer_is_correct reflects the strict threshold (>=90%)
-                    answer_is_correct_flag = verdict == "correct"
-
-                    # 6. Feedback Generation (always — even for correct, partial feedback helps)
-                    try:
-                        hint_provided = generate_diagnostic_feedback(
-                            problem=problem_text or "",
-                            student_answer=structured_answer,
-                            correct_answer=correct_answer or "",
-                            student_solution=structured_steps,
-                            ref_solution=ref_solution or "",
-                            is_correct=answer_is_correct_flag,
-                            verdict=verdict,
-                        )
-                    except Exception as e:
-                        logger.error(f"Feedback generation failed: {e}")
-                        hint_provided = "Could not generate feedback at this time."
-
-                    cur.execute(
-                        """
-                        INSERT INTO grading_results (
-                            submission_id, problem_id,
-                            answer_correctness, answer_is_correct,
-                            logical_flow_score, first_error_step_index, error_summary,
-                            final_score, percentage, grading_breakdown,
-                            hint_provided
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        RETURNING result_id
-                        """,
-                        (
-                            submission_id,
-                            problem_id,
-                            ar.get("confidence"),
-                            answer_is_correct_flag,
-                            sr.get("logical_score"),
-                            sr.get("first_error_step_index"),
-                            sr.get("error_summary"),
-                            final_score,
-                            percentage,
-                            None,
-                            hint_provided,
-                        ),
-                    )
-                    total_percentage += percentage
-
-                cur.execute(
-                    "UPDATE test_submissions SET status='graded' WHERE submission_id=%s",
-                    (submission_id,),
-                )
-
-        return {"submission_id": submission_id, "message": "Grading completed"}
+                store_grading_results(cur, submission_id, results, irrelevant)
     finally:
         conn.close()
 
 
-@router.get("/submission/{submission_id}/results")
-def get_results(submission_id: int):
-    conn = get_db_connection()
+@router.post("/grade_submission/{submission_id}")
+async def grade_submission(submission_id: int, problem_id: Optional[int] = None, db: AsyncSession = Depends(get_db)):
+    # Grade every problem concurrently; the model calls are awaited on the event
+    # loop. Rows come from a server-side cursor and each one starts grading as soon
+    # as it arrives instead of after the whole fetch.
+    sem = asyncio.Semaphore(GRADING_CONCURRENCY)
+
+    async def process_row(row) -> Union[tuple, IrrelevantProblem]:
+        async with sem:
+            return await _grade_row(submission_id, row)
+
+    tasks = []
     try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT gr.problem_id, gr.answer_is_correct, gr.answer_correctness,
-                       gr.logical_flow_score, gr.percentage, gr.first_error_step_index, gr.error_summary,
-                       gr.hint_provided, gr.final_score
-                FROM grading_results gr
-                WHERE gr.submission_id = %s
-                ORDER BY gr.problem_id
-                """,
-                (submission_id,),
-            )
-            rows = cur.fetchall()
-        return [
-            {
-                "problem_id": r[0],
-                "answer_is_correct": r[1],
-                "answer_confidence": r[2],
-                "logical_flow_score": r[3],
-                "percentage": r[4],
-                "first_error_step_index": r[5],
-                "error_summary": r[6],
-                "hint_provided": r[7],
-                "final_score": r[8],
-                "verdict": get_verdict(float(r[4]) if r[4] is not None else 0.0),
-            }
-            for r in rows
-        ]
+        result = await db.stream(_ROWS_TO_GRADE_SQL, {"submission_id": submission_id, "problem_id": problem_id})
+        async for row in result:
+            tasks.append(asyncio.create_task(process_row(row)))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
     finally:
-        conn.close()
+        # Hand the connection back to the pool before waiting on the (slow) model calls
+        await db.close()
+    if not tasks:
+        raise HTTPException(status_code=404, detail="No problem submissions found")
+
+    graded = await asyncio.gather(*tasks)
+    results = [g for g in graded if not isinstance(g, IrrelevantProblem)]
+    irrelevant = [g for g in graded if isinstance(g, IrrelevantProblem)]
+
+    # All writes happen together in one transaction once grading is done
+    await asyncio.to_thread(_store_grading_results, submission_id, results, irrelevant)
+
+    return {"submission_id": submission_id, "message": "Grading completed"}
+
+
+@router.get("/submission/{submission_id}/results")
+async def get_results(submission_id: int, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(_RESULTS_SQL, {"submission_id": submission_id})
+    # Returned as a response so FastAPI skips jsonable_encoder; orjson encodes the rows directly
+    return ORJSONResponse([dict(r) for r in result.mappings()])
@@ -1,10 +1,14 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, Depends, Request, UploadFile, File, Form, HTTPException
 from fastapi.responses import JSONResponse
-from db.db_connection import get_db_connection
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.session import get_db
+import asyncio
 import os
-import json
 import re
 import logging
+import aiofiles
 from typing import List, Optional
 from datetime import datetime
 from services.mathpix_service import extract_text_from_image
@@ -13,6 +17,12 @@ from services.embedding_service import generate_embedding
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Uploaded images are streamed to storage in chunks of this many bytes
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Size limits for submit_solution: the whole request, and each stored image
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+MAX_IMAGE_BYTES = 15 * 1024 * 1024
+
 
 def ensure_storage_dir() -> str:
     storage_path = os.getenv("STORAGE_PATH", os.path.join(os.getcwd(), "storage"))
@@ -20,16 +30,18 @@ def ensure_storage_dir() -> str:
     return storage_path
 
 
-def extract_answer_from_text(ocr_text: str) -> Optional[str]:
-    """
-    Extract the answer from OCR text by looking for answer keywords.
-    Looks for patterns like: "ans:", "answer:", "Answer:", "Ans:", etc.
-    Returns the extracted answer or None if not found.
-    """
-    if not ocr_text:
-        return None
+# The answer patterns scan whole OCR blobs with lazy .+? matches; PCRE2 (optional
+# dependency) JIT-compiles them to machine code and exposes the same API as re.
+try:
+    import pcre2 as _answer_re
+except ImportError:
+    _answer_re = re
 
-    patterns = [
+# Answer patterns, tried in order (earlier patterns win); compiled once at import.
+_FLAGS = _answer_re.IGNORECASE | _answer_re.MULTILINE | _answer_re.DOTALL
+_KEYWORD_ANSWER_PATTERNS = tuple(
+    _answer_re.compile(pattern, _FLAGS)
+    for pattern in (
         r'\banswer\s*:?\s*(.+?)(?:\n|$|\.|,|;|$)',
         r'\bans\s*:?\s*(.+?)(?:\n|$|\.|,|;|$)',
         r'final\s+answer\s*:?\s*(.+?)(?:\n|$|\.|,|;|$)',
@@ -37,180 +49,218 @@ def extract_answer_from_text(ocr_text: str) -> Optional[str]:
         r'\bans\s+=\s*(.+?)(?:\n|$|\.|,|;|$)',
         r'\banswer\s+=\s*(.+?)(?:\n|$|\.|,|;|$)',
         # Removed aggressive equals matchers that catch equations
+    )
+)
+_DELIMITED_ANSWER_PATTERNS = tuple(
+    _answer_re.compile(pattern, _FLAGS)
+    for pattern in (
         r'[│┃│┌┐└┘├┤┬┴┼║╔╗╚╝╠╣╦╩╬─━═][\s]*(.+?)[\s]*[│┃│┌┐└┘├┤┬┴┼║╔╗╚╝╠╣╦╩╬─━═]',
         # Removed aggressive bracket matcher that was catching [Page 1]
         r'\|[\s]*(.+?)[\s]*\|',
-    ]
+    )
+)
+_ANSWER_PATTERNS = _KEYWORD_ANSWER_PATTERNS + _DELIMITED_ANSWER_PATTERNS
+# Every keyword pattern (and the last-line fallback) needs "ans" somewhere in the
+# text, so one scan for it rules them all out on texts without an answer keyword.
+# A fused alternation would return the leftmost match rather than honour the
+# pattern order above.
+_ANSWER_KEYWORD = re.compile(r'ans', re.IGNORECASE)
+# The delimited patterns can only match text containing one of these characters
+_BOX_CHARS = frozenset('│┃┌┐└┘├┤┬┴┼║╔╗╚╝╠╣╦╩╬─━═')
+_TRAIL_PUNCT = re.compile(r'[.,;:]+\s*$')
+_LEADING_NOISE = re.compile(r'^(is|equals?|=\s*)', re.IGNORECASE)
+# A line that starts with "ans"/"answer" followed by ':' or whitespace; the answer
+# is the rest of the line without trailing punctuation
+_LAST_LINE = re.compile(r'\s*(?:answer|ans)(?=[:\s])\s*:?\s*(.*?)[.,;:]*\s*$', re.IGNORECASE)
 
-    for pattern_idx, pattern in enumerate(patterns):
-        matches = list(re.finditer(pattern, ocr_text, re.IGNORECASE | re.MULTILINE | re.DOTALL))
 
-        if matches:
-            match = matches[0]
-        else:
+def extract_answer_from_text(ocr_text: str) -> Optional[str]:
+    """
+    Extract the answer from OCR text by looking for answer keywords.
+    Looks for patterns like: "ans:", "answer:", "Answer:", "Ans:", etc.
+    Returns the extracted answer or None if not found.
+    """
+    if not ocr_text:
+        return None
+
+    has_keyword = _ANSWER_KEYWORD.search(ocr_text) is not None
+    if not has_keyword and '|' not in ocr_text and _BOX_CHARS.isdisjoint(ocr_text):
+        return None
+    for pattern in _ANSWER_PATTERNS if has_keyword else _DELIMITED_ANSWER_PATTERNS:
+        # Only the first match of each pattern is ever used
+        match = pattern.search(ocr_text)
+        if match is None:
             continue
 
         answer = match.group(1).strip()
-        answer = re.sub(r'[.,;:]+\s*$', '', answer)
+        answer = _TRAIL_PUNCT.sub('', answer)
         answer = answer.strip()
 
         if len(answer) > 0:
-            answer = re.sub(r'^(is|equals?|=\s*)', '', answer, flags=re.IGNORECASE).strip()
+            answer = _LEADING_NOISE.sub('', answer).strip()
             if len(answer) > 0:
                 return answer
 
-    lines = ocr_text.split('\n')
-    for line in reversed(lines[-3:]):
-        line_lower = line.lower().strip()
-        if line_lower.startswith(('ans:', 'answer:', 'ans ', 'answer ')):
-            match = re.search(r'(?:ans|answer)\s*:?\s*(.+)', line, re.IGNORECASE)
-            if match:
-                answer = match.group(1).strip()
-                answer = re.sub(r'[.,;:]+\s*$', '', answer).strip()
-                if len(answer) > 0:
-                    return answer
+    if not has_keyword:
+        return None
+
+    for line in reversed(ocr_text.rsplit('\n', 3)[-3:]):
+        match = _LAST_LINE.match(line)
+        if match:
+            answer = match.group(1).strip()
+            if len(answer) > 0:
+                return answer
 
     return None
 
 
+# Statements are module-level constants run on the asyncpg engine, which prepares
+# each one per connection and reuses the plan (see db/session.py).
+# Get or create in one statement; the no-op DO UPDATE makes RETURNING yield the
+# existing row (mock_tests_practice_session_key)
+_PRACTICE_TEST_SQL = text("""
+    INSERT INTO mock_tests (test_type, student_id, problems, status)
+    VALUES ('Practice Session', :student_id, '[]'::jsonb, 'in_progress')
+    ON CONFLICT (student_id) WHERE test_type = 'Practice Session'
+    DO UPDATE SET student_id = EXCLUDED.student_id
+    RETURNING test_id
+""")
+_UPSERT_SUBMISSION_SQL = text("""
+    INSERT INTO test_submissions (test_id, student_id, status)
+    VALUES (:test_id, :student_id, 'processing')
+    ON CONFLICT (test_id, student_id) DO UPDATE SET status = EXCLUDED.status
+    RETURNING submission_id
+""")
+_UPSERT_PROBLEM_SUBMISSION_SQL = text("""
+    INSERT INTO problem_submissions
+    (submission_id, problem_id, image_url, ocr_text, student_solution, student_answer, ocr_processed_at)
+    VALUES (:submission_id, :problem_id, :image_url, :ocr_text, :ocr_text, :student_answer, :ocr_processed_at)
+    ON CONFLICT (submission_id, problem_id)
+    DO UPDATE SET
+        image_url = EXCLUDED.image_url,
+        ocr_text = COALESCE(EXCLUDED.ocr_text, problem_submissions.ocr_text),
+        student_solution = COALESCE(EXCLUDED.student_solution, problem_submissions.student_solution),
+        student_answer = COALESCE(EXCLUDED.student_answer, problem_submissions.student_answer),
+        ocr_processed_at = EXCLUDED.ocr_processed_at
+""")
+
+
+async def _resolve_submission(db: AsyncSession, test_id: int, student_id: str) -> tuple:
+    """Resolve the practice test (test_id=0) and get or create the submission; returns (test_id, submission_id)."""
+    # Special handling for practice problems (test_id=0)
+    if test_id == 0:
+        # mock_tests.student_id is an INTEGER column (test_submissions' is TEXT)
+        result = await db.execute(_PRACTICE_TEST_SQL, {"student_id": int(student_id)})
+        test_id = result.scalar_one()
+
+    # ON CONFLICT ... DO UPDATE always returns the (new or existing) row
+    result = await db.execute(_UPSERT_SUBMISSION_SQL, {"test_id": test_id, "student_id": student_id})
+    submission_id = result.scalar_one()
+    # Committing hands the connection back to the pool until the final write
+    await db.commit()
+    return test_id, submission_id
+
+
 @router.post("/submit_solution")
 async def submit_solution(
+    request: Request,
     test_id: int = Form(...),
     problem_id: int = Form(...),
     student_id: str = Form(...),
     image_files: List[UploadFile] = File(...),
+    db: AsyncSession = Depends(get_db),
 ):
     if not image_files or len(image_files) == 0:
         raise HTTPException(status_code=400, detail="At least one image file is required")
 
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Upload too large")
+
     storage_dir = ensure_storage_dir()
     all_ocr_text = []
     image_paths = []
     timestamp = int(datetime.utcnow().timestamp())
 
-    conn = get_db_connection()
     try:
-        with conn:
-            with conn.cursor() as cur:
-                # Special handling for practice problems (test_id=0)
-                if test_id == 0:
-                    cur.execute(
-                        """
-                        SELECT test_id FROM mock_tests 
-                        WHERE student_id = %s AND test_type = 'Practice Session'
-                        LIMIT 1
-                        """,
-                        (student_id,)
-                    )
-                    row = cur.fetchone()
-
-                    if row:
-                        test_id = row[0]
-                    else:
-                        cur.execute(
-                            """
-                            INSERT INTO mock_tests (test_type, student_id, problems, status)
-                            VALUES (%s, %s, '[]'::jsonb, 'in_progress')
-                            RETURNING test_id
-                            """,
-                            ('Practice Session', student_id)
-                        )
-                        test_id = cur.fetchone()[0]
-
-                cur.execute(
-                    """
-                    INSERT INTO test_submissions (test_id, student_id, status)
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT (test_id, student_id) DO UPDATE SET status = EXCLUDED.status
-                    RETURNING submission_id
-                    """,
-                    (test_id, student_id, "processing"),
-                )
-                result = cur.fetchone()
-                if not result:
-                    cur.execute(
-                        """
-                        SELECT submission_id FROM test_submissions 
-                        WHERE test_id = %s AND student_id = %s
-                        """,
-                        (test_id, student_id)
-                    )
-                    row = cur.fetchone()
-                    if not row:
-                        raise HTTPException(status_code=500, detail="Failed to get or create submission_id")
-                    submission_id = row[0]
-                else:
-                    submission_id = result[0]
-
-                for idx, image_file in enumerate(image_files):
-                    filename = f"{student_id}_{test_id}_{problem_id}_{idx}_{timestamp}_{image_file.filename}"
-                    file_path = os.path.join(storage_dir, filename)
-
-                    try:
-                        with open(file_path, "wb") as out:
-                            content = await image_file.read()
-                            out.write(content)
-
-                        image_paths.append(file_path)
-
-                        ocr = extract_text_from_image(file_path)
-                        if ocr.get("error"):
-                            logger.error(f"MathPix OCR failed for image {idx+1}: {ocr.get('error')}")
-                            continue
-
-                        ocr_text = ocr.get("text", "")
-
-                        if ocr_text:
-                            all_ocr_text.append(ocr_text)
-
-                    except Exception as e:
-                        logger.error(f"Error processing image {idx+1}: {str(e)}")
-                        continue
-                    finally:
-                        await image_file.close()
-
-                if not image_paths:
-                    raise HTTPException(status_code=500, detail="No images were successfully processed")
-
-                if len(all_ocr_text) > 1:
-                    combined_text = "\n\n".join(
-                        [f"[Page {i+1}]\n\n{text}" for i, text in enumerate(all_ocr_text)]
-                    )
-                else:
-                    combined_text = "\n\n".join(all_ocr_text) if all_ocr_text else ""
-
-                logger.info(f"Combined OCR text length: {len(combined_text)} characters")
-
-                extracted_answer = extract_answer_from_text(combined_text)
-                print(f"Extracted answer: {extracted_answer}")
-                if extracted_answer:
-                    logger.info(f"Extracted answer for problem {problem_id}: {extracted_answer}")
-                else:
-                    logger.warning(f"Could not extract answer from OCR text for problem {problem_id}")
-
-                cur.execute(
-                    """
-                    INSERT INTO problem_submissions 
-                    (submission_id, problem_id, image_url, ocr_text, student_solution, student_answer, ocr_processed_at)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (submission_id, problem_id)
-                    DO UPDATE SET 
-                        image_url = EXCLUDED.image_url,
-                        ocr_text = COALESCE(EXCLUDED.ocr_text, problem_submissions.ocr_text),
-                        student_solution = COALESCE(EXCLUDED.student_solution, problem_submissions.student_solution),
-                        student_answer = COALESCE(EXCLUDED.student_answer, problem_submissions.student_answer),
-                        ocr_processed_at = EXCLUDED.ocr_processed_at
-                    """,
-                    (
-                        submission_id,
-                        problem_id,
-                        json.dumps(image_paths),
-                        combined_text,
-                        combined_text,
-                        extracted_answer,
-                        datetime.utcnow(),
-                    ),
-                )
+        # A pooled connection is only held for the two short DB phases, never across
+        # the file writes and MathPix round-trips in between.
+        test_id, submission_id = await _resolve_submission(db, test_id, student_id)
+
+        for idx, image_file in enumerate(image_files):
+            filename = f"{student_id}_{test_id}_{problem_id}_{idx}_{timestamp}_{image_file.filename}"
+            file_path = os.path.join(storage_dir, filename)
+
+            try:
+                # Copy in bounded chunks without blocking the event loop on disk writes
+                written = 0
+                async with aiofiles.open(file_path, "wb") as out:
+                    while chunk := await image_file.read(UPLOAD_CHUNK_SIZE):
+                        written += len(chunk)
+                        if written > MAX_IMAGE_BYTES:
+                            raise HTTPException(status_code=413, detail=f"Image {idx+1} is too large")
+                        await out.write(chunk)
+
+                image_paths.append(file_path)
+            except HTTPException:
+                os.remove(file_path)
+                raise
+            except Exception as e:
+                logger.error(f"Error processing image {idx+1}: {str(e)}")
+                continue
+            finally:
+                await image_file.close()
+
+        # MathPix calls are blocking HTTP requests; run them side by side in the
+        # threadpool so N pages cost about one round-trip. Pages keep their order.
+        ocr_results = await asyncio.gather(
+            *(run_in_threadpool(extract_text_from_image, path) for path in image_paths),
+            return_exceptions=True,
+        )
+        for idx, ocr in enumerate(ocr_results):
+            if isinstance(ocr, Exception):
+                logger.error(f"Error processing image {idx+1}: {str(ocr)}")
+                continue
+            if ocr.get("error"):
+                logger.error(f"MathPix OCR failed for image {idx+1}: {ocr.get('error')}")
+                continue
+
+            ocr_text = ocr.get("text", "")
+
+            if ocr_text:
+                all_ocr_text.append(ocr_text)
+
+        if not image_paths:
+            raise HTTPException(status_code=500, detail="No images were successfully processed")
+
+        if len(all_ocr_text) > 1:
+            combined_text = "\n\n".join(
+                [f"[Page {i+1}]\n\n{text}" for i, text in enumerate(all_ocr_text)]
+            )
+        else:
+            combined_text = "\n\n".join(all_ocr_text) if all_ocr_text else ""
+
+        logger.info(f"Combined OCR text length: {len(combined_text)} characters")
+
+        extracted_answer = extract_answer_from_text(combined_text)
+        print(f"Extracted answer: {extracted_answer}")
+        if extracted_answer:
+            logger.info(f"Extracted answer for problem {problem_id}: {extracted_answer}")
+        else:
+            logger.warning(f"Could not extract answer from OCR text for problem {problem_id}")
+
+        await db.execute(
+            _UPSERT_PROBLEM_SUBMISSION_SQL,
+            {
+                "submission_id": submission_id,
+                "problem_id": problem_id,
+                "image_url": image_paths,
+                "ocr_text": combined_text,
+                "student_answer": extracted_answer,
+                "ocr_processed_at": datetime.utcnow(),
+            },
+        )
+        await db.commit()
 
         return JSONResponse(
             {
@@ -227,5 +277,3 @@ async def submit_solution(
     except Exception as e:
         logger.error(f"Error in submit_solution: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
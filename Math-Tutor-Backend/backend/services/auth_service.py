@@ -1,17 +1,46 @@
 # backend/services/auth_service.py
-from sqlalchemy.orm import Session
+import asyncio
+import hashlib
+import os
+from cachetools import TTLCache
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from models.user import User
-from auth.security import get_password_hash, verify_password
+from auth.security import DUMMY_HASH, get_password_hash_async, verify_password_async, password_needs_rehash
 from typing import Optional
 
-def get_user_by_email(db: Session, email: str) -> Optional[User]:
-    return db.query(User).filter(User.email == email).first()
+# Failed-login throttle, process-local (each worker keeps its own counters):
+# - LOGIN_MAX_FAILURES misses for an email from one client IP within
+#   LOGIN_LOCKOUT_SECONDS reject further attempts from that IP before touching the
+#   DB or running Argon2, which caps the CPU a credential-stuffing run can burn.
+#   Keying on the IP too means knowing a student's email is not enough to lock
+#   them out.
+# - Past LOGIN_DELAY_AFTER misses for an email from any IP, every attempt on it
+#   first waits, doubling per miss up to LOGIN_MAX_DELAY_SECONDS, which slows
+#   guessing spread across many IPs without ever locking the account.
+LOGIN_MAX_FAILURES = int(os.getenv("LOGIN_MAX_FAILURES", "10"))
+LOGIN_LOCKOUT_SECONDS = int(os.getenv("LOGIN_LOCKOUT_SECONDS", "900"))
+LOGIN_DELAY_AFTER = int(os.getenv("LOGIN_DELAY_AFTER", "5"))
+LOGIN_MAX_DELAY_SECONDS = float(os.getenv("LOGIN_MAX_DELAY_SECONDS", "8"))
+_failed_logins: TTLCache = TTLCache(maxsize=100_000, ttl=LOGIN_LOCKOUT_SECONDS)
+_failed_by_email: TTLCache = TTLCache(maxsize=100_000, ttl=LOGIN_LOCKOUT_SECONDS)
 
-def get_user(db: Session, user_id: int) -> Optional[User]:
-    return db.query(User).filter(User.id == user_id).first()
+def _login_key(email: str) -> str:
+    return hashlib.sha256(email.strip().lower().encode("utf-8")).hexdigest()
 
-def create_user(db: Session, *, name: str, email: str, password: str, school: str | None = None, date_of_birth=None, grade: str | None = None) -> User:
-    hashed = get_password_hash(password)
+def _record_failure(email_key: str, client_key: tuple) -> None:
+    _failed_logins[client_key] = _failed_logins.get(client_key, 0) + 1
+    _failed_by_email[email_key] = _failed_by_email.get(email_key, 0) + 1
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalars().first()
+
+async def get_user(db: AsyncSession, user_id: int) -> Optional[User]:
+    return await db.get(User, user_id)
+
+async def create_user(db: AsyncSession, *, name: str, email: str, password: str, school: str | None = None, date_of_birth=None, grade: str | None = None) -> User:
+    hashed = await get_password_hash_async(password)
     user = User(
         name=name,
         email=email,
@@ -21,14 +50,33 @@ def create_user(db: Session, *, name: str, email: str, password: str, school: st
         grade=grade,
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
-    user = get_user_by_email(db, email)
+async def authenticate_user(
+    db: AsyncSession, email: str, password: str, client_ip: Optional[str] = None
+) -> Optional[User]:
+    email_key = _login_key(email)
+    client_key = (email_key, client_ip)
+    if _failed_logins.get(client_key, 0) >= LOGIN_MAX_FAILURES:
+        return None
+    failures = _failed_by_email.get(email_key, 0)
+    if failures >= LOGIN_DELAY_AFTER:
+        await asyncio.sleep(min(2.0 ** (failures - LOGIN_DELAY_AFTER), LOGIN_MAX_DELAY_SECONDS))
+    user = await get_user_by_email(db, email)
     if not user:
+        await verify_password_async(password, DUMMY_HASH)
+        _record_failure(email_key, client_key)
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
+        _record_failure(email_key, client_key)
         return None
+    _failed_logins.pop(client_key, None)
+    _failed_by_email.pop(email_key, None)
+    # Lazily migrate hashes created with older Argon2 parameters (or by Passlib)
+    if password_needs_rehash(user.hashed_password):
+        user.hashed_password = await get_password_hash_async(password)
+        await db.commit()
+        await db.refresh(user)
     return user
@@ -1,61 +1,83 @@
 # curriculum_service.py
 from typing import List, Dict, Optional, Any
 from datetime import date, datetime, timedelta
-from decimal import Decimal
 from db.db_connection import get_db_connection
-import json
+from psycopg2.extras import Json, execute_values
+from responses import dumps
+from cachetools import TTLCache
+import io
+import random
+import threading
 
 
-def convert_decimal_to_float(obj):
-    """Convert Decimal values to float for JSON serialization"""
-    if isinstance(obj, Decimal):
-        return float(obj)
-    elif isinstance(obj, dict):
-        return {key: convert_decimal_to_float(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_decimal_to_float(item) for item in obj]
-    return obj
+def _dumps_jsonb(obj) -> str:
+    # orjson (Decimal -> float, as in API responses) instead of stdlib json
+    return dumps(obj).decode()
 
 
-def analyze_student_weaknesses(student_id: int) -> List[Dict[str, Any]]:
+# Backslash escapes for COPY ... FROM STDIN text format
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_field(value) -> str:
+    return "\\N" if value is None else str(value).translate(_COPY_ESCAPES)
+
+
+# Weakness lists keyed by (student_id, fingerprint of the student's wrong answers
+# and mistakes). A new or removed grading result / mistake changes the fingerprint;
+# the TTL bounds drift of the 7-day recency weighting.
+_weakness_cache: TTLCache = TTLCache(maxsize=4096, ttl=300)
+_weakness_cache_lock = threading.Lock()
+
+
+def analyze_student_weaknesses(student_id: int, cur=None) -> List[Dict[str, Any]]:
     """
     Analyzes test_submissions -> problem_submissions -> grading_results 
     to identify weak domains/topics where the student has incorrect answers.
     
     Returns list of weak domains with scores, weighted by recency.
+    Runs on cur when given; callers already holding a pooled connection must pass
+    it rather than check out a second one.
     """
-    conn = get_db_connection()
+    conn = get_db_connection() if cur is None else None
     try:
-        cur = conn.cursor()
+        if conn is not None:
+            cur = conn.cursor()
+
+        # Cheap index lookups that change whenever the heavy query's inputs do
+        cur.execute("""
+            SELECT
+                (SELECT ROW(MAX(gr.graded_at), COUNT(*))::text
+                 FROM grading_results gr
+                 JOIN test_submissions ts ON ts.submission_id = gr.submission_id
+                 WHERE ts.student_id = %s AND gr.answer_is_correct = FALSE),
+                (SELECT ROW(MAX(created_at), COUNT(*))::text
+                 FROM student_mistakes
+                 WHERE student_id = %s)
+        """, (str(student_id), str(student_id)))
+        cache_key = (student_id, *cur.fetchone())
+        with _weakness_cache_lock:
+            cached = _weakness_cache.get(cache_key)
+        if cached is not None:
+            return [dict(w) for w in cached]
         
         # Analyze weaknesses from grading_results with recency weighting
-        # Recent mistakes (last 7 days) get 2x weight, older mistakes get 1x weight
+        # Recent mistakes (last 7 days) get 2x weight, older mistakes get 1x weight.
+        # Both are counted in a single scan of the student's wrong answers.
         cur.execute("""
-            WITH RecentFailures AS (
+            WITH Failures AS (
                 SELECT 
-                    TRIM(unnest(string_to_array(omd.domain, ','))) as domain,
-                    COUNT(*) * 2 as failure_count,
+                    d.domain,
+                    SUM(CASE WHEN gr.graded_at >= NOW() - INTERVAL '7 days' THEN 2 ELSE 1 END) as failure_count,
                     MAX(gr.graded_at) as last_failure_date
                 FROM grading_results gr
                 JOIN test_submissions ts ON ts.submission_id = gr.submission_id
                 JOIN omni_math_data omd ON omd.problem_id = gr.problem_id
+                CROSS JOIN LATERAL unnest(omd.domain_arr) AS d(domain)
                 WHERE ts.student_id = %s 
                     AND gr.answer_is_correct = FALSE
-                    AND gr.graded_at >= NOW() - INTERVAL '7 days'
-                GROUP BY TRIM(unnest(string_to_array(omd.domain, ',')))
-            ),
-            OlderFailures AS (
-                SELECT 
-                    TRIM(unnest(string_to_array(omd.domain, ','))) as domain,
-                    COUNT(*) as failure_count,
-                    MAX(gr.graded_at) as last_failure_date
-                FROM grading_results gr
-                JOIN test_submissions ts ON ts.submission_id = gr.submission_id
-                JOIN omni_math_data omd ON omd.problem_id = gr.problem_id
-                WHERE ts.student_id = %s 
-                    AND gr.answer_is_correct = FALSE
-                    AND gr.graded_at < NOW() - INTERVAL '7 days'
-                GROUP BY TRIM(unnest(string_to_array(omd.domain, ',')))
+                    AND d.domain <> ''
+                GROUP BY d.domain
             ),
             MistakeCounts AS (
                 SELECT 
@@ -67,20 +89,18 @@ def analyze_student_weaknesses(student_id: int) -> List[Dict[str, Any]]:
                 GROUP BY domain
             )
             SELECT 
-                COALESCE(rf.domain, of.domain, mc.domain) as domain,
-                (COALESCE(rf.failure_count, 0) + COALESCE(of.failure_count, 0) + COALESCE(mc.mistake_count, 0)) as weakness_score,
+                COALESCE(f.domain, mc.domain) as domain,
+                (COALESCE(f.failure_count, 0) + COALESCE(mc.mistake_count, 0)) as weakness_score,
                 GREATEST(
-                    COALESCE(rf.last_failure_date, '1970-01-01'::timestamp),
-                    COALESCE(of.last_failure_date, '1970-01-01'::timestamp),
+                    COALESCE(f.last_failure_date, '1970-01-01'::timestamp),
                     COALESCE(mc.last_mistake_date, '1970-01-01'::timestamp)
                 ) as last_issue_date
-            FROM RecentFailures rf
-            FULL OUTER JOIN OlderFailures of ON rf.domain = of.domain
-            FULL OUTER JOIN MistakeCounts mc ON COALESCE(rf.domain, of.domain) = mc.domain
-            WHERE COALESCE(rf.domain, of.domain, mc.domain) IS NOT NULL
-                AND TRIM(COALESCE(rf.domain, of.domain, mc.domain)) != ''
+            FROM Failures f
+            FULL OUTER JOIN MistakeCounts mc ON f.domain = mc.domain
+            WHERE COALESCE(f.domain, mc.domain) IS NOT NULL
+                AND TRIM(COALESCE(f.domain, mc.domain)) != ''
             ORDER BY weakness_score DESC, last_issue_date DESC
-        """, (str(student_id), str(student_id), str(student_id)))
+        """, (str(student_id), str(student_id)))
         
         rows = cur.fetchall()
         weaknesses = []
@@ -101,176 +121,182 @@ def analyze_student_weaknesses(student_id: int) -> List[Dict[str, Any]]:
                 {"domain": "Geometry", "weakness_score": 1, "last_issue_date": None},
                 {"domain": "Number Theory", "weakness_score": 1, "last_issue_date": None}
             ]
-        
-        return weaknesses
+
+        with _weakness_cache_lock:
+            _weakness_cache[cache_key] = weaknesses
+        return [dict(w) for w in weaknesses]
         
     finally:
-        conn.close()
+        if conn is not None:
+            conn.close()
 
 
-def generate_daily_tasks(student_id: int, duration_months: int, task_date: date) -> List[Dict[str, Any]]:
-    """
-    Generates daily tasks for a specific date based on student weaknesses.
-    Creates 2-3 practice problems and 1-2 study materials.
-    """
-    conn = get_db_connection()
-    try:
-        cur = conn.cursor()
-        
-        # Check if tasks already exist for this date
+def _row_to_task(task_id, task_type, task_content, is_completed) -> Dict[str, Any]:
+    # task_content is JSONB, already decoded by psycopg2
+    return {
+        "task_id": task_id,
+        "task_type": task_type,
+        "task_content": task_content,
+        "is_completed": is_completed
+    }
+
+
+def _build_daily_tasks(cur, student_id: int, task_dates: List[date]) -> Dict[date, List[tuple]]:
+    """Pick practice problems and study materials for each date; returns {date: [(task_type, task_content)]}."""
+    # Analyze weaknesses
+    weaknesses = analyze_student_weaknesses(student_id, cur)
+
+    # Get top 2-3 weak domains
+    top_weak_domains = [w["domain"] for w in weaknesses[:3]]
+
+    # Generate 2-3 practice problems from weak domains
+    problems_per_domain = max(1, 3 // len(top_weak_domains) if top_weak_domains else 1)
+
+    # Per date: list of (task_type, task_content)
+    new_tasks: Dict[date, List[tuple]] = {d: [] for d in task_dates}
+
+    for domain in top_weak_domains[:2]:  # Limit to 2 domains to avoid too many problems
+        clean_domain = domain.strip('[]"')
+
+        # Enough distinct problems for every date, split per date below.
+        # Walks the random_key index from a random start (wrapping around) and
+        # stops at the first matches instead of sorting every match by RANDOM().
         cur.execute("""
-            SELECT task_id FROM daily_tasks 
-            WHERE student_id = %s AND task_date = %s
-        """, (student_id, task_date))
-        
-        if cur.fetchone():
-            # Tasks already exist, return them
-            cur.execute("""
-                SELECT task_id, task_type, task_content, is_completed
-                FROM daily_tasks
-                WHERE student_id = %s AND task_date = %s
-                ORDER BY task_type, task_id
-            """, (student_id, task_date))
-            
-            rows = cur.fetchall()
-            tasks = []
-            for r in rows:
-                task_content = r[2]
-                # Handle JSONB - it might be a dict or a string
-                if isinstance(task_content, str):
-                    try:
-                        task_content = json.loads(task_content)
-                    except (json.JSONDecodeError, TypeError):
-                        pass  # Keep as string if parsing fails
-                tasks.append({
-                    "task_id": r[0],
-                    "task_type": r[1],
-                    "task_content": task_content,
-                    "is_completed": r[3]
-                })
-            return tasks
-        
-        # Analyze weaknesses
-        weaknesses = analyze_student_weaknesses(student_id)
-        
-        # Get top 2-3 weak domains
-        top_weak_domains = [w["domain"] for w in weaknesses[:3]]
-        
-        generated_tasks = []
-        
-        # Generate 2-3 practice problems from weak domains
-        problems_per_domain = max(1, 3 // len(top_weak_domains) if top_weak_domains else 1)
-        
-        for domain in top_weak_domains[:2]:  # Limit to 2 domains to avoid too many problems
-            clean_domain = domain.strip('[]"')
-            
-            cur.execute("""
-                SELECT problem_id, problem, difficulty_level, domain 
+            WITH matching AS NOT MATERIALIZED (
+                SELECT problem_id, problem, difficulty_level, domain, random_key
                 FROM omni_math_data
-                WHERE domain ILIKE %s
-                ORDER BY RANDOM()
-                LIMIT %s
-            """, (f"%{clean_domain}%", problems_per_domain))
-            
-            problem_rows = cur.fetchall()
-            
-            for prob_row in problem_rows:
+                WHERE domain ILIKE %(pattern)s
+            )
+            SELECT problem_id, problem, difficulty_level, domain
+            FROM (
+                (SELECT * FROM matching WHERE random_key >= %(start)s ORDER BY random_key LIMIT %(count)s)
+                UNION ALL
+                (SELECT * FROM matching WHERE random_key < %(start)s ORDER BY random_key LIMIT %(count)s)
+            ) sampled
+            LIMIT %(count)s
+        """, {
+            "pattern": f"%{clean_domain}%",
+            "start": random.random(),
+            "count": problems_per_domain * len(task_dates),
+        })
+
+        problem_rows = cur.fetchall()
+
+        for i, task_date in enumerate(task_dates):
+            for prob_row in problem_rows[i * problems_per_domain:(i + 1) * problems_per_domain]:
                 task_content = {
                     "problem_id": prob_row[0],
                     "problem_text": prob_row[1][:200] + "..." if len(prob_row[1]) > 200 else prob_row[1],
                     "difficulty": prob_row[2],
                     "domain": prob_row[3]
                 }
-                
-                # Convert any Decimal values to float for JSON serialization
-                task_content = convert_decimal_to_float(task_content)
-                
-                # Insert task
-                cur.execute("""
-                    INSERT INTO daily_tasks 
-                    (student_id, task_date, task_type, task_content, curriculum_duration_months)
-                    VALUES (%s, %s, 'practice_problem', %s, %s)
-                    RETURNING task_id
-                """, (student_id, task_date, json.dumps(task_content), duration_months))
-                
-                task_id = cur.fetchone()[0]
-                generated_tasks.append({
-                    "task_id": task_id,
-                    "task_type": "practice_problem",
-                    "task_content": task_content,
-                    "is_completed": False
-                })
-        
-        # Generate 1-2 study materials related to weak topics
-        if top_weak_domains:
-            cur.execute("""
-                SELECT material_id, title, url, material_type, content 
-                FROM study_materials 
-                WHERE related_topics::text ILIKE ANY(%s)
-                ORDER BY RANDOM()
-                LIMIT 2
-            """, ([f"%{d}%" for d in top_weak_domains],))
-            
-            material_rows = cur.fetchall()
-            
-            for mat_row in material_rows:
-                task_content = {
-                    "material_id": mat_row[0],
-                    "title": mat_row[1],
-                    "url": mat_row[2],
-                    "material_type": mat_row[3],
-                    "snippet": mat_row[4][:150] + "..." if mat_row[4] and len(mat_row[4]) > 150 else (mat_row[4] or "")
-                }
-                
-                # Convert any Decimal values to float for JSON serialization
-                task_content = convert_decimal_to_float(task_content)
-                
-                # Insert task
-                cur.execute("""
-                    INSERT INTO daily_tasks 
-                    (student_id, task_date, task_type, task_content, curriculum_duration_months)
-                    VALUES (%s, %s, 'study_material', %s, %s)
-                    RETURNING task_id
-                """, (student_id, task_date, json.dumps(task_content), duration_months))
-                
-                task_id = cur.fetchone()[0]
-                generated_tasks.append({
-                    "task_id": task_id,
-                    "task_type": "study_material",
-                    "task_content": task_content,
-                    "is_completed": False
-                })
-        
+
+                new_tasks[task_date].append(("practice_problem", task_content))
+
+    # Generate 1-2 study materials related to weak topics
+    material_rows = []
+    if top_weak_domains:
+        cur.execute("""
+            SELECT material_id, title, url, material_type, content 
+            FROM study_materials 
+            WHERE related_topics::text ILIKE ANY(%s)
+            ORDER BY RANDOM()
+            LIMIT %s
+        """, ([f"%{d}%" for d in top_weak_domains], 2 * len(task_dates)))
+
+        material_rows = cur.fetchall()
+
+    for task_date in task_dates:
+        # Each date draws its own 1-2 materials from the shared candidates
+        for mat_row in random.sample(material_rows, min(2, len(material_rows))):
+            task_content = {
+                "material_id": mat_row[0],
+                "title": mat_row[1],
+                "url": mat_row[2],
+                "material_type": mat_row[3],
+                "snippet": mat_row[4][:150] + "..." if mat_row[4] and len(mat_row[4]) > 150 else (mat_row[4] or "")
+            }
+
+            new_tasks[task_date].append(("study_material", task_content))
+
         # If no study materials found, create a topic review task
-        if not any(t["task_type"] == "study_material" for t in generated_tasks) and top_weak_domains:
+        if not material_rows and top_weak_domains:
             task_content = {
                 "topics": top_weak_domains[:2],
                 "description": f"Review concepts in {', '.join(top_weak_domains[:2])}"
             }
-            
-            # Convert any Decimal values to float for JSON serialization
-            task_content = convert_decimal_to_float(task_content)
-            
-            cur.execute("""
+
+            new_tasks[task_date].append(("topic_review", task_content))
+
+    return new_tasks
+
+
+def generate_daily_tasks(student_id: int, duration_months: int, task_date: date, conn=None) -> List[Dict[str, Any]]:
+    """
+    Generates daily tasks for a specific date based on student weaknesses.
+    Creates 2-3 practice problems and 1-2 study materials.
+    """
+    return generate_daily_tasks_for_dates(student_id, duration_months, [task_date], conn)[task_date]
+
+
+def generate_daily_tasks_for_dates(
+    student_id: int, duration_months: int, task_dates: List[date], conn=None
+) -> Dict[date, List[Dict[str, Any]]]:
+    """
+    Generates daily tasks for several dates at once (e.g. the first week of a plan).
+
+    Dates that already have tasks return them unchanged. For the rest, weaknesses are
+    analyzed once, candidate problems/materials are fetched once for all dates, and
+    every new task is written with a single multi-row INSERT and one commit.
+
+    Runs on conn when given and leaves the commit to the caller; otherwise checks out
+    its own connection.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        tasks_by_date: Dict[date, List[Dict[str, Any]]] = {d: [] for d in task_dates}
+
+        # Existing tasks for any of the requested dates, in one query
+        cur.execute("""
+            SELECT task_date, task_id, task_type, task_content, is_completed
+            FROM daily_tasks
+            WHERE student_id = %s AND task_date = ANY(%s)
+            ORDER BY task_date, task_type, task_id
+        """, (student_id, list(task_dates)))
+        for r in cur.fetchall():
+            tasks_by_date[r[0]].append(_row_to_task(r[1], r[2], r[3], r[4]))
+
+        missing_dates = [d for d in task_dates if not tasks_by_date[d]]
+        if not missing_dates:
+            return tasks_by_date
+
+        new_tasks = _build_daily_tasks(cur, student_id, missing_dates)
+
+        rows = [
+            (student_id, task_date, task_type, Json(task_content, dumps=_dumps_jsonb), duration_months)
+            for task_date in missing_dates
+            for task_type, task_content in new_tasks[task_date]
+        ]
+        if rows:
+            inserted = execute_values(cur, """
                 INSERT INTO daily_tasks 
                 (student_id, task_date, task_type, task_content, curriculum_duration_months)
-                VALUES (%s, %s, 'topic_review', %s, %s)
-                RETURNING task_id
-            """, (student_id, task_date, json.dumps(task_content), duration_months))
-            
-            task_id = cur.fetchone()[0]
-            generated_tasks.append({
-                "task_id": task_id,
-                "task_type": "topic_review",
-                "task_content": task_content,
-                "is_completed": False
-            })
-        
-        conn.commit()
-        return generated_tasks
+                VALUES %s
+                RETURNING task_date, task_id, task_type, task_content, is_completed
+            """, rows, page_size=len(rows), fetch=True)
+            for r in inserted:
+                tasks_by_date[r[0]].append(_row_to_task(r[1], r[2], r[3], r[4]))
+
+        if own_conn:
+            conn.commit()
+        return tasks_by_date
         
     finally:
-        conn.close()
+        if own_conn:
+            conn.close()
 
 
 def regenerate_daily_tasks_if_needed(student_id: int) -> bool:
@@ -314,8 +340,8 @@ def regenerate_daily_tasks_if_needed(student_id: int) -> bool:
                     WHERE student_id = %s AND task_date = %s
                 """, (student_id, tomorrow))
                 
-                # Regenerate
-                generate_daily_tasks(student_id, duration_months, tomorrow)
+                # Regenerate on this connection, committed together with the DELETE
+                generate_daily_tasks(student_id, duration_months, tomorrow, conn)
                 conn.commit()
                 return True
         
@@ -324,3 +350,52 @@ def regenerate_daily_tasks_if_needed(student_id: int) -> bool:
     finally:
         conn.close()
 
+
+def regenerate_daily_tasks_bulk(student_ids: Optional[List[int]] = None) -> int:
+    """
+    Batch version of regenerate_daily_tasks_if_needed for scheduled runs.
+
+    Finds every student (optionally limited to student_ids) with 5+ correct answers in
+    the last 3 days, replaces their tasks for tomorrow and loads all new rows with a
+    single COPY in one transaction. Returns the number of students regenerated.
+    """
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT ucs.student_id, ucs.duration_months
+            FROM user_curriculum_selections ucs
+            JOIN test_submissions ts ON ts.student_id = ucs.student_id::text
+            JOIN grading_results gr ON gr.submission_id = ts.submission_id
+            WHERE gr.answer_is_correct = TRUE
+                AND gr.graded_at >= NOW() - INTERVAL '3 days'
+                AND (%(student_ids)s::int[] IS NULL OR ucs.student_id = ANY(%(student_ids)s::int[]))
+            GROUP BY ucs.student_id, ucs.duration_months
+            HAVING COUNT(*) >= 5
+        """, {"student_ids": student_ids})
+        selections = cur.fetchall()
+        if not selections:
+            return 0
+
+        tomorrow = date.today() + timedelta(days=1)
+        buf = io.StringIO()
+        for student_id, duration_months in selections:
+            new_tasks = _build_daily_tasks(cur, student_id, [tomorrow])
+            for task_type, task_content in new_tasks[tomorrow]:
+                fields = (student_id, tomorrow, task_type, _dumps_jsonb(task_content), duration_months)
+                buf.write("\t".join(map(_copy_field, fields)) + "\n")
+
+        cur.execute("""
+            DELETE FROM daily_tasks
+            WHERE student_id = ANY(%s) AND task_date = %s
+        """, ([row[0] for row in selections], tomorrow))
+        buf.seek(0)
+        cur.copy_expert("""
+            COPY daily_tasks (student_id, task_date, task_type, task_content, curriculum_duration_months)
+            FROM STDIN
+        """, buf)
+        conn.commit()
+        return len(selections)
+
+    finally:
+        conn.close()
@@ -1,16 +1,52 @@
+import os
+import threading
 from sentence_transformers import SentenceTransformer
 from functools import lru_cache
 
+try:
+    import torch
+except ImportError:  # sentence-transformers always brings torch; guard anyway
+    torch = None
+
+# Serializes the first load so a request arriving while the startup preload is
+# still running waits for that model instead of loading a second copy.
+_model_lock = threading.Lock()
+
 
 @lru_cache(maxsize=1)
-def get_embedding_model() -> SentenceTransformer:
-    import os
+def _load_embedding_model() -> SentenceTransformer:
     model_name = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
-    return SentenceTransformer(model_name)
+    if torch is not None and os.getenv("TORCH_NUM_THREADS"):
+        # Avoid oversubscribing cores when several uvicorn workers each run torch
+        torch.set_num_threads(int(os.getenv("TORCH_NUM_THREADS")))
+    # EMBEDDING_BACKEND=onnx (or openvino) runs the same model through ONNX Runtime's
+    # fused CPU kernels instead of PyTorch; needs `optimum[onnxruntime]`.
+    # EMBEDDING_ONNX_FILE selects a pre-exported variant from the model repo, e.g.
+    # onnx/model_qint8_avx512_vnni.onnx for the int8-quantized MiniLM.
+    backend = os.getenv("EMBEDDING_BACKEND", "torch")
+    kwargs = {}
+    if backend != "torch":
+        kwargs["backend"] = backend
+        if os.getenv("EMBEDDING_ONNX_FILE"):
+            kwargs["model_kwargs"] = {"file_name": os.getenv("EMBEDDING_ONNX_FILE")}
+    model = SentenceTransformer(model_name, **kwargs)
+    model.eval()
+    return model
 
 
-def generate_embedding(text: str):
+def get_embedding_model() -> SentenceTransformer:
+    with _model_lock:
+        return _load_embedding_model()
+
+
+def encode_text(text: str):
+    """Encode one string to a numpy vector without autograd bookkeeping."""
     model = get_embedding_model()
-    return model.encode(text or "").tolist()
+    if torch is None:
+        return model.encode(text or "", convert_to_numpy=True)
+    with torch.inference_mode():
+        return model.encode(text or "", convert_to_numpy=True)
 
 
+def generate_embedding(text: str):
+    return encode_text(text).tolist()
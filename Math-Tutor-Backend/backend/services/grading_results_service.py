@@ -0,0 +1,229 @@
+# Scoring, feedback and storage of grading_results rows, shared by submission
+# grading (routes/submissions/grading.py) and the Batch API path for scheduled
+# tests (services/mock_test_service.py) so both write identical rows.
+import logging
+from typing import Dict, NamedTuple, Sequence, Tuple
+
+try:
+    from services.tutor_service import generate_diagnostic_feedback
+except ImportError:
+    from services.tutor_service import generate_wrong_answer_feedback as generate_diagnostic_feedback
+
+logger = logging.getLogger(__name__)
+
+
+def get_verdict(percentage: float) -> str:
+    """Map a percentage score to a three-state verdict."""
+    if percentage >= 90:
+        return "correct"
+    if percentage >= 50:
+        return "partially_correct"
+    return "incorrect"
+
+
+# Waterfall scoring: (minimum logical_score, percentage) bands, checked in order.
+# Proofs are scored on logic alone (answer verification is bypassed for them).
+_PROOF_BANDS = ((0.8, 100.0), (0.5, 75.0), (0.3, 40.0))
+# Correct answer: high confidence / shaky logic / bad or missing logic (lucky guess?)
+_CORRECT_ANSWER_BANDS = ((0.7, 100.0), (0.4, 80.0), (float("-inf"), 40.0))
+# Wrong answer: great logic (calculation error?) / some valid steps / bad logic
+_WRONG_ANSWER_BANDS = ((0.8, 60.0), (0.4, 30.0))
+
+
+def waterfall_percentage(is_proof: bool, answer_correct: bool, logic_score: float) -> float:
+    """Map the verifier outputs to a percentage score."""
+    if is_proof:
+        bands = _PROOF_BANDS
+    elif answer_correct:
+        bands = _CORRECT_ANSWER_BANDS
+    else:
+        bands = _WRONG_ANSWER_BANDS
+    for threshold, percentage in bands:
+        if logic_score >= threshold:
+            return percentage
+    return 0.0
+
+
+# Answer verification is bypassed for proofs; they are scored on logic alone.
+PROOF_BYPASS_RESULT = {"is_correct": True, "confidence": 1.0, "match_type": "proof_bypass"}
+
+
+def score_verification(is_proof: bool, answer_result: Dict, solution_result: Dict) -> Tuple[float, str]:
+    """(percentage, verdict) for one problem's verifier outputs."""
+    logical_score = solution_result.get("logical_score")
+    logic_score = float(logical_score) if logical_score is not None else 0.0
+    percentage = waterfall_percentage(is_proof, answer_result.get("is_correct", False), logic_score)
+    return percentage, get_verdict(percentage)
+
+
+# Correct answers whose logical_score reaches this get fixed praise instead of a
+# generated feedback call.
+PRAISE_MIN_LOGIC_SCORE = 0.9
+_CANNED_PRAISE = "Great work — your reasoning and final answer are both correct."
+
+
+def grading_feedback(
+    verdict: str, solution_result: Dict, problem: str, student_answer: str, correct_answer: str,
+    student_solution: str, ref_solution: str,
+) -> str:
+    """
+    Feedback stored in hint_provided. Fully correct work with near-perfect logic gets
+    fixed praise; anything else a generated diagnostic (embedding lookup + sync LLM
+    call, so async callers run it in a thread).
+    """
+    logical_score = solution_result.get("logical_score")
+    logic_score = float(logical_score) if logical_score is not None else 0.0
+    if verdict == "correct" and logic_score >= PRAISE_MIN_LOGIC_SCORE:
+        return _CANNED_PRAISE
+    try:
+        return generate_diagnostic_feedback(
+            problem=problem or "",
+            student_answer=student_answer,
+            correct_answer=correct_answer or "",
+            student_solution=student_solution,
+            ref_solution=ref_solution or "",
+            is_correct=verdict == "correct",
+            verdict=verdict,
+        )
+    except Exception as e:
+        logger.error(f"Feedback generation failed: {e}")
+        return "Could not generate feedback at this time."
+
+
+def grading_result_row(
+    submission_id: int, problem_id: int, answer_result: Dict, solution_result: Dict,
+    percentage: float, verdict: str, hint_provided: str,
+) -> tuple:
+    """A grading_results row in _GRADING_RESULTS_COLUMNS order."""
+    return (
+        submission_id,
+        problem_id,
+        answer_result.get("confidence"),
+        # answer_is_correct reflects the strict threshold (>=90%)
+        verdict == "correct",
+        solution_result.get("logical_score"),
+        solution_result.get("first_error_step_index"),
+        solution_result.get("error_summary"),
+        percentage / 100.0,
+        percentage,
+        None,
+        hint_provided,
+    )
+
+
+class IrrelevantProblem(NamedTuple):
+    """A problem whose submission failed the relevance gate."""
+    problem_id: int
+    reason: str
+
+
+_GRADING_RESULTS_COLUMNS = """
+    submission_id, problem_id,
+    answer_correctness, answer_is_correct,
+    logical_flow_score, first_error_step_index, error_summary,
+    final_score, percentage, grading_breakdown,
+    hint_provided
+"""
+# Re-grading a problem updates its existing row in place (UNIQUE (submission_id,
+# problem_id), see db/migrations_add_grading_results_unique.sql).
+_GRADING_RESULTS_UPSERT = """
+    ON CONFLICT (submission_id, problem_id) DO UPDATE SET
+        answer_correctness = EXCLUDED.answer_correctness,
+        answer_is_correct = EXCLUDED.answer_is_correct,
+        logical_flow_score = EXCLUDED.logical_flow_score,
+        first_error_step_index = EXCLUDED.first_error_step_index,
+        error_summary = EXCLUDED.error_summary,
+        final_score = EXCLUDED.final_score,
+        percentage = EXCLUDED.percentage,
+        grading_breakdown = EXCLUDED.grading_breakdown,
+        hint_provided = EXCLUDED.hint_provided,
+        graded_at = NOW()
+"""
+
+
+# Upserts the new results and marks the submission graded in a single statement.
+# With replace, every other previous grading result for the submission is wiped
+# first: because practice submissions reuse the same submission_id for the same
+# student, old results from previous problems would otherwise linger in the table
+# and be returned alongside the new result, causing the wrong problem's verdict to
+# appear in the UI. Without it (batch grading, which stores a test's problems as
+# their requests finish), the submission is only marked graded once every
+# submitted problem has a result. Rows of the problems graded now are overwritten
+# by the upsert instead of deleted and re-inserted. Every value is a bound
+# parameter; the rows arrive as one array per column and are expanded by unnest.
+_STORE_GRADING_RESULTS_SQL = f"""
+    WITH wiped AS (
+        DELETE FROM grading_results
+        WHERE %(replace)s AND submission_id = %(submission_id)s AND problem_id <> ALL(%(graded_ids)s::int[])
+    ),
+    inserted AS (
+        INSERT INTO grading_results ({_GRADING_RESULTS_COLUMNS})
+        SELECT %(submission_id)s, r.problem_id,
+               r.answer_correctness, r.answer_is_correct,
+               r.logical_flow_score, r.first_error_step_index, r.error_summary,
+               r.final_score, r.percentage, NULL,
+               r.hint_provided
+        FROM unnest(
+            %(problem_ids)s::int[], %(answer_correctness)s::numeric[], %(answer_is_correct)s::boolean[],
+            %(logical_flow_score)s::numeric[], %(first_error_step_index)s::int[], %(error_summary)s::text[],
+            %(final_score)s::numeric[], %(percentage)s::numeric[], %(hint_provided)s::text[]
+        ) AS r(problem_id, answer_correctness, answer_is_correct,
+               logical_flow_score, first_error_step_index, error_summary,
+               final_score, percentage, hint_provided)
+        {_GRADING_RESULTS_UPSERT}
+    ),
+    -- Irrelevant submissions all score zero, so their rows are built in SQL from
+    -- the problem ids and relevance reasons alone.
+    irrelevant AS (
+        INSERT INTO grading_results ({_GRADING_RESULTS_COLUMNS})
+        SELECT %(submission_id)s, r.problem_id,
+               0.0, FALSE, 0.0, 0, 'Submission irrelevant: ' || r.reason,
+               0.0, 0.0, NULL,
+               'Your submission does not appear to be an attempt at the assigned problem. Reason: ' || r.reason
+        FROM unnest(%(irrelevant_ids)s::int[], %(reasons)s::text[]) AS r(problem_id, reason)
+        {_GRADING_RESULTS_UPSERT}
+    )
+    -- A re-grade leaves an already graded submission row untouched
+    UPDATE test_submissions SET status = 'graded'
+    WHERE submission_id = %(submission_id)s AND status IS DISTINCT FROM 'graded'
+      AND (%(replace)s OR NOT EXISTS (
+          -- CTE inserts aren't visible here, so problems graded now are excluded by id
+          SELECT 1 FROM problem_submissions ps
+          WHERE ps.submission_id = %(submission_id)s
+            AND ps.problem_id <> ALL(%(graded_ids)s::int[])
+            AND NOT EXISTS (
+                SELECT 1 FROM grading_results gr
+                WHERE gr.submission_id = ps.submission_id AND gr.problem_id = ps.problem_id
+            )
+      ))
+"""
+
+
+def store_grading_results(
+    cur, submission_id: int, results: list, irrelevant: Sequence[IrrelevantProblem] = (), replace: bool = True
+) -> None:
+    """
+    Writes grading_result_row rows (and zero rows for irrelevant problems) for one
+    submission on the caller's cursor; the caller commits.
+    """
+    # results rows are in _GRADING_RESULTS_COLUMNS order; grading_breakdown is always NULL
+    (_, problem_ids, answer_correctness, answer_is_correct, logical_flow_score, first_error_step_index,
+     error_summary, final_score, percentage, _, hint_provided) = (
+        [list(column) for column in zip(*results)] if results else [[] for _ in range(11)]
+    )
+    cur.execute(_STORE_GRADING_RESULTS_SQL, {
+        "submission_id": submission_id,
+        "replace": replace,
+        "graded_ids": problem_ids + [p.problem_id for p in irrelevant],
+        "problem_ids": problem_ids,
+        "answer_correctness": answer_correctness,
+        "answer_is_correct": answer_is_correct,
+        "logical_flow_score": logical_flow_score,
+        "first_error_step_index": first_error_step_index,
+        "error_summary": error_summary,
+        "final_score": final_score,
+        "percentage": percentage,
+        "hint_provided": hint_provided,
+        "irrelevant_ids": [p.problem_id for p in irrelevant],
+        "reasons": [p.reason for p in irrelevant],
+    })
@@ -1,9 +1,14 @@
+import asyncio
 import logging
-from typing import Dict, Optional, Tuple, List
-import json
+from typing import Callable, Dict, Generator, List, NamedTuple, Optional, Tuple
+import hashlib
+import orjson
 import os
+import threading
+from cachetools import LRUCache
 from dotenv import load_dotenv
-from openai import OpenAI
+from services.openai_client import get_async_openai_client, get_openai_client
+from services.symbolic_answer import symbolic_answers_equal
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +20,102 @@ GRADING_MODEL = os.getenv("GRADING_MODEL", "o3-mini")
 
 RELEVANCE_CHECK_MODEL = os.getenv("RELEVANCE_CHECK_MODEL", "gpt-4o-mini")
 
+# Answer checks try ANSWER_FAST_MODEL first and only escalate to GRADING_MODEL when
+# its confidence is below ANSWER_ESCALATE_CONFIDENCE. Empty disables the fast tier.
+ANSWER_FAST_MODEL = os.getenv("ANSWER_FAST_MODEL", "gpt-4o-mini")
+ANSWER_ESCALATE_CONFIDENCE = float(os.getenv("ANSWER_ESCALATE_CONFIDENCE", "0.7"))
+
+# Reasoning effort and completion-token caps. The cap includes hidden reasoning
+# tokens, so it has to leave room for them on top of the short JSON reply. Answer
+# equivalence is a simple task; logical-flow checks (alone or fused) get more room.
+ANSWER_REASONING_EFFORT = os.getenv("ANSWER_REASONING_EFFORT", "low")
+ANSWER_MAX_COMPLETION_TOKENS = int(os.getenv("ANSWER_MAX_COMPLETION_TOKENS", "1000"))
+LOGIC_REASONING_EFFORT = os.getenv("LOGIC_REASONING_EFFORT", "medium")
+LOGIC_MAX_COMPLETION_TOKENS = int(os.getenv("LOGIC_MAX_COMPLETION_TOKENS", "4000"))
+
+
+def _completion_limits(model: str, effort: str, max_completion_tokens: int) -> Dict:
+    # reasoning_effort is rejected by non-reasoning models such as gpt-4o-mini
+    limits = {"max_completion_tokens": max_completion_tokens}
+    if model.startswith(("o1", "o3", "o4", "gpt-5")):
+        limits["reasoning_effort"] = effort
+    return limits
+
+
+# The *_async variants below await the model on the event loop (submission grading)
+# through the shared AsyncOpenAI client; the semaphore caps its in-flight requests.
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "20"))
+_openai_semaphore = asyncio.Semaphore(OPENAI_CONCURRENCY)
+
+
+def _complete(body: Dict) -> str:
+    response = get_openai_client().chat.completions.create(**body)
+    return response.choices[0].message.content
+
+
+async def _complete_async(body: Dict) -> str:
+    async with _openai_semaphore:
+        response = await get_async_openai_client().chat.completions.create(**body)
+    return response.choices[0].message.content
+
+
+# Each check is written once as a generator ("flow") that yields the steps needing
+# I/O and receives their results: a chat completion request body is sent to the
+# model, an _Offload is a blocking local call. _run drives a flow synchronously,
+# _run_async on the event loop; only the transport differs between the two.
+class _Offload(NamedTuple):
+    """A blocking call inside a flow; _run_async runs it in a worker thread."""
+    func: Callable
+    args: tuple
+
+
+def _run(flow: Generator):
+    try:
+        step = next(flow)
+        while True:
+            try:
+                result = step.func(*step.args) if isinstance(step, _Offload) else _complete(step)
+            except Exception as e:
+                step = flow.throw(e)
+            else:
+                step = flow.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def _run_async(flow: Generator):
+    try:
+        step = next(flow)
+        while True:
+            try:
+                if isinstance(step, _Offload):
+                    result = await asyncio.to_thread(step.func, *step.args)
+                else:
+                    result = await _complete_async(step)
+            except Exception as e:
+                step = flow.throw(e)
+            else:
+                step = flow.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+# Relevance verdicts and parsed structures keyed on a digest of the OCR text (and
+# the problem, for relevance). Practice retries resubmit the same OCR text, and
+# both results depend on nothing else. Failed model calls are never cached.
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "4096"))
+_relevance_cache: LRUCache = LRUCache(maxsize=OCR_CACHE_SIZE)
+_structure_cache: LRUCache = LRUCache(maxsize=OCR_CACHE_SIZE)
+_ocr_cache_lock = threading.Lock()
+
+
+def _digest(*parts: str) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update((part or "").encode("utf-8"))
+        h.update(b"\0")
+    return h.digest()
+
 
 def check_relevance(student_text: str, problem_text: str) -> Tuple[bool, str]:
     """
@@ -22,12 +123,37 @@ def check_relevance(student_text: str, problem_text: str) -> Tuple[bool, str]:
     Returns (is_relevant: bool, reason: str).
     Uses a lightweight model — no need for a heavy reasoning model for this binary decision.
     """
+    return _run(_relevance_flow(student_text, problem_text))
+
+
+async def check_relevance_async(student_text: str, problem_text: str) -> Tuple[bool, str]:
+    """check_relevance awaited on the event loop."""
+    return await _run_async(_relevance_flow(student_text, problem_text))
+
+
+def _relevance_flow(student_text: str, problem_text: str) -> Generator:
     if not student_text or not student_text.strip():
         return False, "Empty submission"
 
+    key = _digest(student_text, problem_text)
+    with _ocr_cache_lock:
+        cached = _relevance_cache.get(key)
+    if cached is not None:
+        return cached
+
     try:
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        prompt = f"""You are a grading assistant. Determine if the student's submission is an attempt to solve the given problem.
+        result = _relevance_result((yield _relevance_body(student_text, problem_text)))
+    except Exception as e:
+        logger.error(f"Relevance check failed: {str(e)}")
+        # Fail open — if check errors, assume relevant to avoid silent 0 scores
+        return True, "Relevance check error — defaulting to relevant"
+    with _ocr_cache_lock:
+        _relevance_cache[key] = result
+    return result
+
+
+def _relevance_body(student_text: str, problem_text: str) -> Dict:
+    prompt = f"""You are a grading assistant. Determine if the student's submission is an attempt to solve the given problem.
 
 Problem:
 {problem_text}
@@ -43,26 +169,23 @@ Task:
 
 Return valid JSON only: {{ "is_relevant": boolean, "reason": string }}
 """
-        logger.info(f"--- Check Relevance Prompt (model: {RELEVANCE_CHECK_MODEL}) ---\n{prompt}\n------------------------------")
-        response = client.chat.completions.create(
-            model=RELEVANCE_CHECK_MODEL,
-            messages=[
-                {"role": "system", "content": "You are a precise grading gatekeeper. Respond with valid JSON only."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
-        )
-
-        result = json.loads(response.choices[0].message.content)
-        is_relevant = result.get("is_relevant", False)
-        reason = result.get("reason", "No reason provided")
-        logger.info(f"Relevance check result: is_relevant={is_relevant}, reason={reason}")
-        return is_relevant, reason
+    logger.info(f"--- Check Relevance Prompt (model: {RELEVANCE_CHECK_MODEL}) ---\n{prompt}\n------------------------------")
+    return {
+        "model": RELEVANCE_CHECK_MODEL,
+        "messages": [
+            {"role": "system", "content": "You are a precise grading gatekeeper. Respond with valid JSON only."},
+            {"role": "user", "content": prompt}
+        ],
+        "response_format": {"type": "json_object"},
+    }
 
-    except Exception as e:
-        logger.error(f"Relevance check failed: {str(e)}")
-        # Fail open — if check errors, assume relevant to avoid silent 0 scores
-        return True, "Relevance check error — defaulting to relevant"
+
+def _relevance_result(content: str) -> Tuple[bool, str]:
+    result = orjson.loads(content)
+    is_relevant = result.get("is_relevant", False)
+    reason = result.get("reason", "No reason provided")
+    logger.info(f"Relevance check result: is_relevant={is_relevant}, reason={reason}")
+    return is_relevant, reason
 
 
 def extract_solution_structure(ocr_text: str) -> Dict[str, any]:
@@ -70,13 +193,38 @@ def extract_solution_structure(ocr_text: str) -> Dict[str, any]:
     Extract the final answer and solution steps from the OCR text.
     Handle cases where the problem is a proof (no specific final value).
     """
+    return _run(_structure_flow(ocr_text))
+
+
+async def extract_solution_structure_async(ocr_text: str) -> Dict[str, any]:
+    """extract_solution_structure awaited on the event loop."""
+    return await _run_async(_structure_flow(ocr_text))
+
+
+def _structure_flow(ocr_text: str) -> Generator:
     # If text is extremely short, it's likely not a detailed solution
     if not ocr_text or len(ocr_text.strip()) < 10:
         return {"student_answer": ocr_text or "", "student_steps": [], "is_proof": False}
-        
+
+    key = _digest(ocr_text)
+    with _ocr_cache_lock:
+        cached = _structure_cache.get(key)
+    if cached is not None:
+        return dict(cached)
+
     try:
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        prompt = f"""You are a math solution parser. Extract the structure from the student's handwritten solution (OCR text).
+        result = _structure_result((yield _structure_body(ocr_text)))
+    except Exception as e:
+        logger.error(f"Structure extraction failed: {str(e)}")
+        # Fallback: treat whole text as steps
+        return {"is_proof": False, "student_answer": "", "student_steps": [ocr_text]}
+    with _ocr_cache_lock:
+        _structure_cache[key] = result
+    return dict(result)
+
+
+def _structure_body(ocr_text: str) -> Dict:
+    prompt = f"""You are a math solution parser. Extract the structure from the student's handwritten solution (OCR text).
 
 OCR Text:
 {ocr_text}
@@ -96,43 +244,105 @@ Return valid JSON only:
   "student_steps": ["step 1", "step 2", ...]
 }}
 """
-        logger.info(f"--- Extract Structure Prompt ---\n{prompt}\n------------------------------")
-        response = client.chat.completions.create(
-            model=GRADING_MODEL,
-            messages=[
-                {"role": "system", "content": "You are a structural parser for math solutions. Respond with valid JSON only."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
-        )
-        
-        result = json.loads(response.choices[0].message.content)
-        # Ensure keys exist
-        if "is_proof" not in result:
-            result["is_proof"] = False
-        return result
-        
-    except Exception as e:
-        logger.error(f"Structure extraction failed: {str(e)}")
-        # Fallback: treat whole text as steps
-        return {"is_proof": False, "student_answer": "", "student_steps": [ocr_text]}
+    logger.info(f"--- Extract Structure Prompt ---\n{prompt}\n------------------------------")
+    return {
+        "model": GRADING_MODEL,
+        "messages": [
+            {"role": "system", "content": "You are a structural parser for math solutions. Respond with valid JSON only."},
+            {"role": "user", "content": prompt}
+        ],
+        "response_format": {"type": "json_object"},
+    }
+
+
+def _structure_result(content: str) -> Dict[str, any]:
+    result = orjson.loads(content)
+    # Ensure keys exist
+    if "is_proof" not in result:
+        result["is_proof"] = False
+    return result
+
+
+# Verdicts keyed on the normalized (student_answer, correct_answer) pair. Retries and
+# common numeric answers repeat the same pair, and the verdict doesn't depend on
+# anything else. Failed verifications raise and are never cached.
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "8192"))
+_answer_cache: LRUCache = LRUCache(maxsize=ANSWER_CACHE_SIZE)
+_answer_cache_lock = threading.Lock()
+
+
+def _normalize_answer(answer: str) -> str:
+    return " ".join(answer.split()).lower()
 
 
 def verify_answer_correctness(student_answer: str, correct_answer: str) -> Dict:
     """
-    Verify answer correctness using OpenAI.
+    Verify answer correctness using OpenAI, memoized on the normalized answer pair.
     """
+    return _run(_answer_flow(student_answer, correct_answer))
+
+
+async def verify_answer_correctness_async(student_answer: str, correct_answer: str) -> Dict:
+    """verify_answer_correctness awaited on the event loop."""
+    return await _run_async(_answer_flow(student_answer, correct_answer))
+
+
+def _answer_flow(student_answer: str, correct_answer: str) -> Generator:
     if not student_answer or not correct_answer:
         return {"is_correct": False, "confidence": 0.0, "match_type": "openai", "reasoning": "Missing answer"}
-    
+    if not isinstance(student_answer, str) or not isinstance(correct_answer, str):
+        return (yield from _verify_answer_flow(student_answer, correct_answer))
+
+    key = (_normalize_answer(student_answer), _normalize_answer(correct_answer))
+    with _answer_cache_lock:
+        cached = _answer_cache.get(key)
+    if cached is not None:
+        return dict(cached)
+
+    result = yield from _verify_answer_flow(student_answer, correct_answer)
+    with _answer_cache_lock:
+        _answer_cache[key] = result
+    return dict(result)
+
+
+def _symbolic_answer_result(student_answer: str, correct_answer: str) -> Optional[Dict]:
+    """
+    Returns a correct verdict if SymPy proves the answers equal, else None.
+    Blocks for up to SYMBOLIC_TIMEOUT seconds, so flows yield it as an _Offload.
+    """
+    if not symbolic_answers_equal(student_answer, correct_answer):
+        return None
+    return {
+        "is_correct": True,
+        "confidence": 1.0,
+        "match_type": "sympy",
+        "reasoning": "Answer is symbolically equal to the correct answer",
+    }
+
+
+def _verify_answer_flow(student_answer: str, correct_answer: str) -> Generator:
+    symbolic = yield _Offload(_symbolic_answer_result, (student_answer, correct_answer))
+    if symbolic is not None:
+        return symbolic
     # Use OpenAI for semantic/equivalence checking
     try:
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        prompt = f"""You are a math grading assistant. Compare the student's answer with the correct answer.
+        if ANSWER_FAST_MODEL and ANSWER_FAST_MODEL != GRADING_MODEL:
+            result = _answer_result(orjson.loads((yield _answer_body(student_answer, correct_answer, ANSWER_FAST_MODEL))))
+            if result["confidence"] >= ANSWER_ESCALATE_CONFIDENCE:
+                return result
+        return _answer_result(orjson.loads((yield _answer_body(student_answer, correct_answer))))
+    except Exception as e:
+        logger.error(f"OpenAI answer verification failed: {str(e)}")
+        raise RuntimeError(f"Answer verification failed — OpenAI API error: {str(e)}") from e
 
-Student Answer: {student_answer}
 
-Correct Answer: {correct_answer}
+# The grading prompts keep every static instruction in a module-level system prompt
+# and put only the per-submission values in the user message, so consecutive requests
+# share an identical prefix that OpenAI's prompt caching can reuse; prompt_cache_key
+# keeps requests of one kind on the same cache.
+_ANSWER_SYSTEM_PROMPT = """You are a precise math grading assistant. Always respond with valid JSON only.
+
+You will be given a student's answer and the correct answer.
 
 Task:
 1. Determine if the student's answer is mathematically correct/equivalent to the correct answer.
@@ -145,44 +355,98 @@ Task:
 
 Only return valid JSON, no other text."""
 
-        logger.info(f"--- Answer Verification Prompt ---\n{prompt}\n------------------------------")
-        response = client.chat.completions.create(
-            model=GRADING_MODEL,
-            messages=[
-                {"role": "system", "content": "You are a precise math grading assistant. Always respond with valid JSON only."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}  # Force JSON response
-        )
-        
-        result_text = response.choices[0].message.content
-        result = json.loads(result_text)
-        
-        is_correct = result.get("is_correct", False)
-        confidence = float(result.get("confidence", 0.0))
-        reasoning = result.get("reasoning", "")
-        
-        # If confidence is very high (>= 0.85), treat as correct
-        if is_correct and confidence >= 0.85:
-            is_correct = True
-            reasoning = reasoning + " (Marked as correct due to high confidence despite format differences)"
-        
-        return {
-            "is_correct": is_correct,
-            "confidence": confidence,
-            "match_type": "openai",
-            "reasoning": reasoning
-        }
-        
-    except Exception as e:
-        logger.error(f"OpenAI answer verification failed: {str(e)}")
-        raise RuntimeError(f"Answer verification failed — OpenAI API error: {str(e)}") from e
 
+def _answer_body(student_answer: str, correct_answer: str, model: str = GRADING_MODEL) -> Dict:
+    prompt = f"""Student Answer: {student_answer}
+
+Correct Answer: {correct_answer}"""
+
+    logger.info(f"--- Answer Verification Prompt ---\n{prompt}\n------------------------------")
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": _ANSWER_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "response_format": {"type": "json_object"},  # Force JSON response
+        "prompt_cache_key": "grading-answer",
+        **_completion_limits(model, ANSWER_REASONING_EFFORT, ANSWER_MAX_COMPLETION_TOKENS),
+    }
 
-def verify_solution_logical_flow(student_solution: str, reference_solution: str, correct_answer: str) -> Dict:
+
+def _answer_result(result: Dict) -> Dict:
+    is_correct = result.get("is_correct", False)
+    confidence = float(result.get("confidence", 0.0))
+    reasoning = result.get("reasoning", "")
+
+    # If confidence is very high (>= 0.85), treat as correct
+    if is_correct and confidence >= 0.85:
+        is_correct = True
+        reasoning = reasoning + " (Marked as correct due to high confidence despite format differences)"
+
+    return {
+        "is_correct": is_correct,
+        "confidence": confidence,
+        "match_type": "openai",
+        "reasoning": reasoning
+    }
+
+
+# Logical-flow verdicts keyed on a digest of the whitespace-normalized solution text,
+# the reference solution, the correct answer and the student's normalized final
+# answer. Only exact resubmissions hit: solutions that differ in a single step must
+# be graded on their own. Failed evaluations raise and are never cached.
+LOGIC_CACHE_SIZE = int(os.getenv("LOGIC_CACHE_SIZE", "4096"))
+_logic_cache: LRUCache = LRUCache(maxsize=LOGIC_CACHE_SIZE)
+_logic_cache_lock = threading.Lock()
+
+
+def _logic_cache_get(
+    student_solution: str, reference_solution: str, correct_answer: str, student_answer: Optional[str]
+) -> Tuple[Optional[bytes], Optional[Dict]]:
+    """Returns (cache_key, cached_result); cache_key is None if the result must not be cached."""
+    if not reference_solution or not str(reference_solution).strip():
+        # Without a reference the key can't tell problems with the same answer apart
+        return None, None
+    if not student_answer or not isinstance(student_answer, str):
+        return None, None
+    key = _digest(
+        " ".join(student_solution.split()), str(reference_solution), str(correct_answer or ""),
+        _normalize_answer(student_answer),
+    )
+    with _logic_cache_lock:
+        cached = _logic_cache.get(key)
+    return key, (dict(cached) if cached is not None else None)
+
+
+def _logic_cache_put(key: Optional[bytes], result: Dict) -> None:
+    if key is None:
+        return
+    with _logic_cache_lock:
+        _logic_cache[key] = result
+
+
+def verify_solution_logical_flow(
+    student_solution: str, reference_solution: str, correct_answer: str, student_answer: Optional[str] = None
+) -> Dict:
     """
     Verify solution logical flow using OpenAI with Chain of Thought.
+    When the student's final answer is given, an exact resubmission of a solution to
+    the same problem reuses the cached verdict.
     """
+    return _run(_logic_flow(student_solution, reference_solution, correct_answer, student_answer))
+
+
+async def verify_solution_logical_flow_async(
+    student_solution: str, reference_solution: str, correct_answer: str, student_answer: Optional[str] = None
+) -> Dict:
+    """verify_solution_logical_flow awaited on the event loop."""
+    return await _run_async(_logic_flow(student_solution, reference_solution, correct_answer, student_answer))
+
+
+def _logic_flow(
+    student_solution: str, reference_solution: str, correct_answer: str, student_answer: Optional[str]
+) -> Generator:
     if not student_solution or not student_solution.strip():
         return {
             "logical_score": 0.0,
@@ -191,21 +455,21 @@ def verify_solution_logical_flow(student_solution: str, reference_solution: str,
             "first_error_step_index": 0,
             "error_summary": "No solution steps found",
         }
-    
-    try:
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        prompt = f"""You are a math grading assistant evaluating a student's solution logic.
 
-Student's Solution:
-{student_solution}
+    cache_key, cached = _logic_cache_get(student_solution, reference_solution, correct_answer, student_answer)
+    if cached is not None:
+        return cached
 
-Reference Solution:
-{reference_solution}
+    try:
+        result = _solution_result(orjson.loads((yield _logic_body(student_solution, reference_solution, correct_answer))))
+    except Exception as e:
+        logger.error(f"OpenAI logical flow evaluation failed: {str(e)}")
+        raise RuntimeError(f"Solution evaluation failed — OpenAI API error: {str(e)}") from e
+    _logic_cache_put(cache_key, result)
+    return result
 
-Correct Answer: {correct_answer}
 
-Task:
-Evaluate the logical flow and correctness of the student's solution.
+_LOGIC_INSTRUCTIONS = """Evaluate the logical flow and correctness of the student's solution.
 Perform a step-by-step consistency check (Chain of Thought).
 
 **IMPORTANT Context**:
@@ -216,7 +480,19 @@ Perform a step-by-step consistency check (Chain of Thought).
 1. Go step-by-step through the student's work (reordering pages if needed).
 2. For each step, check: Does this strictly follow from the previous line?
 3. Identify the *first* line where a logical error occurs.
-4. Does the final answer actually derive from the work shown, or does it appear out of nowhere?
+4. Does the final answer actually derive from the work shown, or does it appear out of nowhere?"""
+
+_LOGIC_SCORE_RUBRIC = """The logical_score should be high (>=0.8) if:
+- The solution uses a valid mathematical approach
+- The logical steps are sound
+- It leads to the correct answer (or close approximation)"""
+
+_LOGIC_SYSTEM_PROMPT = f"""You are a precise math grading assistant. Always respond with valid JSON only. Evaluate mathematical solutions fairly, recognizing that multiple valid approaches exist.
+
+You will be given a student's solution, a reference solution and the correct answer.
+
+Task:
+{_LOGIC_INSTRUCTIONS}
 
 Return a JSON object with:
 - "logical_score": float (0.0 to 1.0, representing overall logical correctness and flow)
@@ -225,49 +501,236 @@ Return a JSON object with:
 - "first_error_step_index": integer (0-based index of first step with significant error, or -1 if no errors)
 - "error_summary": string (brief description of first error found, or null if solution is correct)
 
-The logical_score should be high (>=0.8) if:
-- The solution uses a valid mathematical approach
-- The logical steps are sound
-- It leads to the correct answer (or close approximation)
+{_LOGIC_SCORE_RUBRIC}
 
 Only return valid JSON, no other text."""
 
-        logger.info(f"--- Logical Flow Prompt ---\n{prompt}\n------------------------------")
-        response = client.chat.completions.create(
-            model=GRADING_MODEL,
-            messages=[
-                {"role": "system", "content": "You are a precise math grading assistant. Always respond with valid JSON only. Evaluate mathematical solutions fairly, recognizing that multiple valid approaches exist."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}  # Force JSON response
-        )
-        
-        result_text = response.choices[0].message.content
-        result = json.loads(result_text)
-        
-        logical_score = float(result.get("logical_score", 0.0))
-        step_count = int(result.get("step_count", 0))
-        valid_steps = int(result.get("valid_steps", 0))
-        first_error_idx = int(result.get("first_error_step_index", -1))
-        error_summary = result.get("error_summary")
-        
-        # Ensure first_error_step_index is non-negative or 0
-        if first_error_idx < 0:
-            first_error_idx = 0
-            if error_summary:
-                error_summary = None  # Clear error if index is -1
-        
-        return {
-            "logical_score": logical_score,
-            "step_count": step_count,
-            "valid_steps": valid_steps,
-            "first_error_step_index": first_error_idx,
-            "error_summary": error_summary,
-        }
-        
+
+def _logic_body(student_solution: str, reference_solution: str, correct_answer: str) -> Dict:
+    prompt = f"""Student's Solution:
+{student_solution}
+
+Reference Solution:
+{reference_solution}
+
+Correct Answer: {correct_answer}"""
+
+    logger.info(f"--- Logical Flow Prompt ---\n{prompt}\n------------------------------")
+    return {
+        "model": GRADING_MODEL,
+        "messages": [
+            {"role": "system", "content": _LOGIC_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "response_format": {"type": "json_object"},  # Force JSON response
+        "prompt_cache_key": "grading-logic",
+        **_completion_limits(GRADING_MODEL, LOGIC_REASONING_EFFORT, LOGIC_MAX_COMPLETION_TOKENS),
+    }
+
+
+def _solution_result(result: Dict) -> Dict:
+    logical_score = float(result.get("logical_score", 0.0))
+    step_count = int(result.get("step_count", 0))
+    valid_steps = int(result.get("valid_steps", 0))
+    first_error_idx = int(result.get("first_error_step_index", -1))
+    error_summary = result.get("error_summary")
+
+    # Ensure first_error_step_index is non-negative or 0
+    if first_error_idx < 0:
+        first_error_idx = 0
+        if error_summary:
+            error_summary = None  # Clear error if index is -1
+
+    return {
+        "logical_score": logical_score,
+        "step_count": step_count,
+        "valid_steps": valid_steps,
+        "first_error_step_index": first_error_idx,
+        "error_summary": error_summary,
+    }
+
+
+def verify_answer_and_solution(
+    student_answer: str, student_solution: str, correct_answer: str, reference_solution: str
+) -> Tuple[Dict, Dict]:
+    """
+    Run verify_answer_correctness and verify_solution_logical_flow as one OpenAI request.
+    Returns (answer_result, solution_result) in the same shapes as those two functions.
+
+    Falls back to the single check that is still needed when either verdict is
+    already cached (or the answers are symbolically equal) or either side is empty.
+    """
+    return _run(_answer_and_solution_flow(student_answer, student_solution, correct_answer, reference_solution))
+
+
+async def verify_answer_and_solution_async(
+    student_answer: str, student_solution: str, correct_answer: str, reference_solution: str
+) -> Tuple[Dict, Dict]:
+    """verify_answer_and_solution awaited on the event loop."""
+    return await _run_async(
+        _answer_and_solution_flow(student_answer, student_solution, correct_answer, reference_solution)
+    )
+
+
+def _answer_and_solution_flow(
+    student_answer: str, student_solution: str, correct_answer: str, reference_solution: str
+) -> Generator:
+    if (not student_solution or not student_solution.strip()
+            or not student_answer or not correct_answer
+            or not isinstance(student_answer, str) or not isinstance(correct_answer, str)):
+        answer_result = yield from _answer_flow(student_answer, correct_answer)
+        solution_result = yield from _logic_flow(student_solution, reference_solution, correct_answer, student_answer)
+        return answer_result, solution_result
+
+    key = (_normalize_answer(student_answer), _normalize_answer(correct_answer))
+    with _answer_cache_lock:
+        cached = _answer_cache.get(key)
+    if cached is None:
+        cached = yield _Offload(_symbolic_answer_result, (student_answer, correct_answer))
+    if cached is not None:
+        solution_result = yield from _logic_flow(student_solution, reference_solution, correct_answer, student_answer)
+        return dict(cached), solution_result
+    cache_key, cached_solution = _logic_cache_get(
+        student_solution, reference_solution, correct_answer, student_answer
+    )
+    if cached_solution is not None:
+        answer_result = yield from _answer_flow(student_answer, correct_answer)
+        return answer_result, cached_solution
+
+    try:
+        answer_result, solution_result = _answer_and_solution_results((yield _answer_and_solution_body(
+            student_answer, student_solution, correct_answer, reference_solution
+        )))
     except Exception as e:
-        logger.error(f"OpenAI logical flow evaluation failed: {str(e)}")
-        raise RuntimeError(f"Solution evaluation failed — OpenAI API error: {str(e)}") from e
+        logger.error(f"OpenAI answer + logical flow verification failed: {str(e)}")
+        raise RuntimeError(f"Grading failed — OpenAI API error: {str(e)}") from e
+
+    with _answer_cache_lock:
+        _answer_cache[key] = answer_result
+    _logic_cache_put(cache_key, solution_result)
+    return dict(answer_result), solution_result
+
+
+_ANSWER_AND_SOLUTION_SYSTEM_PROMPT = f"""You are a precise math grading assistant. Always respond with valid JSON only. Evaluate mathematical solutions fairly, recognizing that multiple valid approaches exist.
+
+You will be given a student's final answer and solution, the correct answer and a reference solution. Grade the student's final answer and the logic of their solution.
+
+Part 1 — Final answer:
+1. Determine if the student's answer is mathematically correct/equivalent to the correct answer.
+2. Consider that answers can be in different formats (e.g., fractions vs decimals, different forms of expressions).
+3. If this is a PROOF question (where the answer is "See Proof" or similar), check if the student's conclusion statement matches the goal.
+
+Part 2 — Solution logic:
+{_LOGIC_INSTRUCTIONS}
+
+{_LOGIC_SCORE_RUBRIC}
+
+Return a JSON object with:
+- "answer": object with
+   - "is_correct": boolean (true if the answers are mathematically equivalent)
+   - "confidence": float (0.0 to 1.0, representing how confident you are)
+   - "reasoning": string (brief explanation of your judgment)
+- "solution": object with
+   - "logical_score": float (0.0 to 1.0, representing overall logical correctness and flow)
+   - "step_count": integer (estimated number of logical steps in student solution)
+   - "valid_steps": integer (number of steps that are mathematically valid)
+   - "first_error_step_index": integer (0-based index of first step with significant error, or -1 if no errors)
+   - "error_summary": string (brief description of first error found, or null if solution is correct)
+
+Only return valid JSON, no other text."""
+
+
+def _answer_and_solution_body(
+    student_answer: str, student_solution: str, correct_answer: str, reference_solution: str
+) -> Dict:
+    """Chat completion request body for the fused answer + logic check (also used for batches)."""
+    prompt = f"""Student Answer: {student_answer}
+
+Student's Solution:
+{student_solution}
+
+Correct Answer: {correct_answer}
+
+Reference Solution:
+{reference_solution}"""
+
+    logger.info(f"--- Answer + Logical Flow Prompt ---\n{prompt}\n------------------------------")
+    return {
+        "model": GRADING_MODEL,
+        "messages": [
+            {"role": "system", "content": _ANSWER_AND_SOLUTION_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "response_format": {"type": "json_object"},
+        "prompt_cache_key": "grading-answer-solution",
+        **_completion_limits(GRADING_MODEL, LOGIC_REASONING_EFFORT, LOGIC_MAX_COMPLETION_TOKENS),
+    }
+
+
+def _answer_and_solution_results(content: str) -> Tuple[Dict, Dict]:
+    result = orjson.loads(content)
+    return _answer_result(result.get("answer") or {}), _solution_result(result.get("solution") or {})
+
+
+def submit_grading_batch(submissions: List[Dict]) -> str:
+    """
+    Queue fused answer + logic checks on the OpenAI Batch API (24h turnaround at half
+    the price of real-time calls) for grading that is not latency-sensitive.
+
+    Each submission has "custom_id", "student_answer", "student_solution",
+    "correct_answer" and "reference_solution". Returns the batch id.
+    """
+    client = get_openai_client()
+    lines = [
+        orjson.dumps({
+            "custom_id": sub["custom_id"],
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": _answer_and_solution_body(
+                sub["student_answer"], sub["student_solution"], sub["correct_answer"], sub["reference_solution"]
+            ),
+        })
+        for sub in submissions
+    ]
+    batch_file = client.files.create(file=("grading_batch.jsonl", b"\n".join(lines)), purpose="batch")
+    batch = client.batches.create(
+        input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h"
+    )
+    logger.info(f"Submitted grading batch {batch.id} with {len(lines)} requests")
+    return batch.id
+
+
+def collect_grading_batch(batch_id: str) -> Optional[Dict[str, Tuple[Dict, Dict]]]:
+    """
+    Results of a submit_grading_batch batch as {custom_id: (answer_result, solution_result)}.
+    Returns None while the batch is still running. Requests that failed — or all of
+    them, if the batch failed or expired — are missing from the result.
+    """
+    client = get_openai_client()
+    batch = client.batches.retrieve(batch_id)
+    if batch.status in ("validating", "in_progress", "finalizing", "cancelling"):
+        return None
+
+    results: Dict[str, Tuple[Dict, Dict]] = {}
+    if batch.status != "completed" or not batch.output_file_id:
+        logger.error(f"Grading batch {batch_id} ended with status {batch.status}")
+        return results
+
+    for line in client.files.content(batch.output_file_id).text.splitlines():
+        if not line.strip():
+            continue
+        item = orjson.loads(line)
+        response = item.get("response") or {}
+        if item.get("error") or response.get("status_code") != 200:
+            logger.error(f"Grading batch {batch_id} request {item.get('custom_id')} failed: {item.get('error')}")
+            continue
+        try:
+            results[item["custom_id"]] = _answer_and_solution_results(
+                response["body"]["choices"][0]["message"]["content"]
+            )
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            logger.error(f"Grading batch {batch_id} request {item.get('custom_id')} unparseable: {str(e)}")
+    return results
 
 
 def calculate_final_score(answer_result: Dict, solution_result: Dict, max_score: float = 1.0) -> Dict:
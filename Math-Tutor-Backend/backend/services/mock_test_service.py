@@ -1,45 +1,146 @@
-import json
+import orjson
 import logging
 import math
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 from decimal import Decimal
 
 from db.db_connection import get_db_connection
+from psycopg2.extras import execute_values
+from services.grading_results_service import (
+    PROOF_BYPASS_RESULT,
+    grading_feedback,
+    grading_result_row,
+    score_verification,
+    store_grading_results,
+)
+from services.grading_service import collect_grading_batch, submit_grading_batch
 
 logger = logging.getLogger(__name__)
 
 KNOWN_DOMAINS = ["Algebra", "Number Theory", "Geometry", "Combinatorics"]
 TARGETED_TEST_SIZE = 10
 
-def parse_domains(domain_string: str) -> List[str]:
-    """Parse comma-separated domain string into list of unique domains"""
-    if not domain_string or not domain_string.strip():
-        return []
-    domains = [d.strip() for d in domain_string.split(',')]
-    return list(set([d for d in domains if d]))
+# Difficulty band pre-filtered into the mv_rmo_problems materialized view
+RMO_POOL_MIN_DIFF = 3.0
+RMO_POOL_MAX_DIFF = 6.0
+
+# test_type of weekly scheduled tests; their submissions are graded through the
+# OpenAI Batch API instead of on submit
+SCHEDULED_TEST_TYPE_PREFIX = "Scheduled Mock Test"
+# OpenAI caps a batch at 50,000 requests
+GRADING_BATCH_MAX_REQUESTS = 50000
+# Feedback calls in flight while a finished batch is stored
+BATCH_FEEDBACK_CONCURRENCY = int(os.getenv("BATCH_FEEDBACK_CONCURRENCY", "8"))
 
 def fetch_problems_by_domain(conn, domain: str, count: int, min_diff: float = 3.0, max_diff: float = 6.0) -> List[tuple]:
-    """Fetch problems for a specific domain within difficulty range"""
+    """Fetch problems for a specific domain within difficulty range.
+
+    Ranges inside the RMO band read the mv_rmo_problems pool (one row per problem and
+    domain element, indexed on (domain_key, random_key)); other ranges match the
+    GIN-indexed domain_arr on omni_math_data. Either way, rows are sampled by walking
+    random_key from a random start (wrapping around) rather than ORDER BY RANDOM(),
+    which sorts every matching row.
+    """
+    params = {"domain": domain, "min_diff": min_diff, "max_diff": max_diff, "count": count, "start": random.random()}
+    if min_diff >= RMO_POOL_MIN_DIFF and max_diff <= RMO_POOL_MAX_DIFF:
+        source = "mv_rmo_problems WHERE domain_key = %(domain)s"
+    else:
+        source = "omni_math_data WHERE domain_arr @> ARRAY[%(domain)s]::text[]"
     cur = conn.cursor()
     try:
-        cur.execute("""
-            SELECT problem_id, domain, problem, solution, answer, difficulty_level, created_at
-            FROM omni_math_data
-            WHERE EXISTS (
-                SELECT 1 
-                FROM unnest(string_to_array(domain, ',')) AS d
-                WHERE LOWER(TRIM(d)) LIKE LOWER(%s)
+        cur.execute(f"""
+            WITH matching AS NOT MATERIALIZED (
+                SELECT problem_id, domain, problem, solution, answer, difficulty_level, created_at, random_key
+                FROM {source}
+                AND difficulty_level >= %(min_diff)s 
+                AND difficulty_level <= %(max_diff)s
             )
-            AND difficulty_level >= %s 
-            AND difficulty_level <= %s
-            ORDER BY RANDOM()
-            LIMIT %s;
-        """, (f"%{domain}%", min_diff, max_diff, count))
+            SELECT problem_id, domain, problem, solution, answer, difficulty_level, created_at
+            FROM (
+                (SELECT * FROM matching WHERE random_key >= %(start)s ORDER BY random_key LIMIT %(count)s)
+                UNION ALL
+                (SELECT * FROM matching WHERE random_key < %(start)s ORDER BY random_key LIMIT %(count)s)
+            ) sampled
+            LIMIT %(count)s;
+        """, params)
         return cur.fetchall()
     finally:
         cur.close()
 
+def fetch_problem_ids_by_domains(conn, domain_config: List[tuple], min_diff: float, max_diff: float) -> List[int]:
+    """Fetch problem ids for several (domain, count) pairs in one query.
+
+    Same sources and random_key sampling as fetch_problems_by_domain, run once per
+    domain through a LATERAL join; ids come back grouped in domain_config order.
+    A problem tagged with several requested domains is returned once, for the first
+    of them; each domain samples twice its count so later domains can still fill
+    their share after such overlaps.
+    """
+    params = {
+        "domains": [domain for domain, _ in domain_config],
+        "counts": [count for _, count in domain_config],
+        "min_diff": min_diff,
+        "max_diff": max_diff,
+        "start": random.random(),
+    }
+    if min_diff >= RMO_POOL_MIN_DIFF and max_diff <= RMO_POOL_MAX_DIFF:
+        source = "mv_rmo_problems WHERE domain_key = x.domain"
+    else:
+        source = "omni_math_data WHERE domain_arr @> ARRAY[x.domain]"
+    cur = conn.cursor()
+    try:
+        cur.execute(f"""
+            WITH picks AS (
+                SELECT x.ord, x.count, p.problem_id, p.rn
+                FROM unnest(%(domains)s::text[], %(counts)s::int[]) WITH ORDINALITY AS x(domain, count, ord)
+                CROSS JOIN LATERAL (
+                    SELECT problem_id, row_number() OVER (ORDER BY wrapped, random_key) AS rn
+                    FROM (
+                        (SELECT problem_id, random_key, FALSE AS wrapped FROM {source}
+                            AND difficulty_level >= %(min_diff)s AND difficulty_level <= %(max_diff)s
+                            AND random_key >= %(start)s ORDER BY random_key LIMIT x.count * 2)
+                        UNION ALL
+                        (SELECT problem_id, random_key, TRUE AS wrapped FROM {source}
+                            AND difficulty_level >= %(min_diff)s AND difficulty_level <= %(max_diff)s
+                            AND random_key < %(start)s ORDER BY random_key LIMIT x.count * 2)
+                    ) sampled
+                    ORDER BY wrapped, random_key
+                    LIMIT x.count * 2
+                ) p
+            ),
+            -- each problem goes to the first requested domain that sampled it
+            firsts AS (
+                SELECT DISTINCT ON (problem_id) problem_id, ord, count, rn
+                FROM picks
+                ORDER BY problem_id, ord, rn
+            ),
+            ranked AS (
+                SELECT problem_id, ord, count, rn, row_number() OVER (PARTITION BY ord ORDER BY rn) AS k
+                FROM firsts
+            )
+            SELECT problem_id
+            FROM ranked
+            WHERE k <= count
+            ORDER BY ord, rn;
+        """, params)
+        return [row[0] for row in cur.fetchall()]
+    finally:
+        cur.close()
+
+def refresh_rmo_problem_pool() -> None:
+    """Rebuild mv_rmo_problems from omni_math_data without blocking readers."""
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_rmo_problems;")
+        conn.commit()
+    finally:
+        conn.close()
+
 def generate_entry_mock_test_for_user(user_id: int) -> int:
     """
     Generates an RMO Entry Mock Test for a newly signed up user.
@@ -53,11 +154,9 @@ def generate_entry_mock_test_for_user(user_id: int) -> int:
             ("Combinatorics", 1)
         ]
         
-        all_problems = []
-        for domain_name, count in domain_config:
-            # Entry level difficulty: 3.0 - 6.0
-            rows = fetch_problems_by_domain(conn, domain_name, count, min_diff=3.0, max_diff=6.0)
-            all_problems.extend([{ "problem_id": row[0] } for row in rows])
+        # Entry level difficulty: 3.0 - 6.0
+        problem_ids = fetch_problem_ids_by_domains(conn, domain_config, min_diff=3.0, max_diff=6.0)
+        all_problems = [{ "problem_id": problem_id } for problem_id in problem_ids]
         
         if not all_problems:
             logger.warning(f"No problems found for entry test generation for user {user_id}")
@@ -76,7 +175,7 @@ def generate_entry_mock_test_for_user(user_id: int) -> int:
                 """,
                 (
                     "RMO Entry Mock Test",
-                    json.dumps(all_problems),
+                    orjson.dumps(all_problems).decode(),
                     user_id,
                     "not_started"
                 ),
@@ -112,7 +211,7 @@ def _get_domain_performance(conn, student_id: int) -> Dict[str, Dict]:
                 FROM grading_results gr
                 JOIN test_submissions ts ON ts.submission_id = gr.submission_id
                 JOIN omni_math_data omd ON omd.problem_id = gr.problem_id
-                JOIN LATERAL unnest(string_to_array(omd.domain, ',')) AS d(domain) ON TRUE
+                JOIN LATERAL unnest(omd.domain_arr) AS d(domain) ON TRUE
                 WHERE ts.student_id = %s
                 GROUP BY TRIM(d.domain)
             )
@@ -242,7 +341,7 @@ def generate_weakness_mock_test(student_id: int) -> int:
                 VALUES (%s, %s, %s, 'not_started', NOW())
                 RETURNING test_id
                 """,
-                (test_type, json.dumps(all_problems[:TARGETED_TEST_SIZE]), student_id),
+                (test_type, orjson.dumps(all_problems[:TARGETED_TEST_SIZE]).decode(), student_id),
             )
             test_id = cur.fetchone()[0]
             conn.commit()
@@ -289,32 +388,32 @@ def generate_scheduled_test_for_batch(batch_id: int = None) -> List[int]:
             ("Combinatorics", 2)
         ]
         
-        template_problems = []
-        for domain_name, count in domain_config:
-            rows = fetch_problems_by_domain(conn, domain_name, count, min_diff=4.0, max_diff=8.0)
-            template_problems.extend([{ "problem_id": row[0] } for row in rows])
+        problem_ids = fetch_problem_ids_by_domains(conn, domain_config, min_diff=4.0, max_diff=8.0)
+        template_problems = [{ "problem_id": problem_id } for problem_id in problem_ids]
 
         if not template_problems:
              logger.warning("No problems found for scheduled test generation.")
              return []
 
-        problems_json = json.dumps(template_problems)
-        test_type = f"Scheduled Mock Test - {datetime.now().strftime('%Y-%m-%d')}"
+        problems_json = orjson.dumps(template_problems).decode()
+        test_type = f"{SCHEDULED_TEST_TYPE_PREFIX} - {datetime.now().strftime('%Y-%m-%d')}"
         
         created_test_ids = []
         
-        # 3. Assign to students
-        for student in students:
-            student_id = student[0]
-            cur.execute(
-                """
-                INSERT INTO mock_tests (test_type, problems, student_id, status, created_at)
-                VALUES (%s, %s, %s, %s, NOW())
-                RETURNING test_id;
-                """,
-                (test_type, problems_json, student_id, "not_started")
-            )
-            created_test_ids.append(cur.fetchone()[0])
+        # 3. Assign to students, one multi-row INSERT per 1000 students
+        inserted = execute_values(
+            cur,
+            """
+            INSERT INTO mock_tests (test_type, problems, student_id, status, created_at)
+            VALUES %s
+            RETURNING test_id;
+            """,
+            [(test_type, problems_json, student[0], "not_started") for student in students],
+            template="(%s, %s, %s, %s, NOW())",
+            page_size=1000,
+            fetch=True,
+        )
+        created_test_ids.extend(row[0] for row in inserted)
             
         conn.commit()
         logger.info(f"Generated scheduled tests for {len(created_test_ids)} students.")
@@ -329,5 +428,143 @@ def generate_scheduled_test_for_batch(batch_id: int = None) -> List[int]:
         conn.close()
 
 
+def submit_scheduled_grading_batch() -> Optional[str]:
+    """
+    Queues the ungraded problems of submitted scheduled tests (test completed,
+    submission still 'processing', not already in a batch) as one OpenAI batch.
+    Returns the batch id, or None if nothing is waiting.
+    """
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT ps.submission_id, ps.problem_id, ps.student_solution, ps.student_answer,
+                   omd.answer, omd.solution
+            FROM test_submissions ts
+            JOIN mock_tests mt ON mt.test_id = ts.test_id
+            JOIN problem_submissions ps ON ps.submission_id = ts.submission_id
+            JOIN omni_math_data omd ON omd.problem_id = ps.problem_id
+            WHERE mt.test_type LIKE %s
+                AND mt.status = 'completed'
+                AND ts.status = 'processing'
+                AND NOT EXISTS (
+                    SELECT 1 FROM grading_batches gb WHERE ts.submission_id = ANY(gb.submission_ids)
+                )
+                AND NOT EXISTS (
+                    SELECT 1 FROM grading_results gr
+                    WHERE gr.submission_id = ps.submission_id AND gr.problem_id = ps.problem_id
+                )
+            ORDER BY ps.submission_id, ps.problem_id
+            LIMIT %s
+        """, (SCHEDULED_TEST_TYPE_PREFIX + "%", GRADING_BATCH_MAX_REQUESTS))
+        rows = cur.fetchall()
+        if not rows:
+            return None
+
+        batch_id = submit_grading_batch([
+            {
+                "custom_id": f"{submission_id}:{problem_id}",
+                "student_answer": student_answer or student_solution or "",
+                "student_solution": student_solution or "",
+                "correct_answer": correct_answer or "",
+                "reference_solution": ref_solution or "",
+            }
+            for submission_id, problem_id, student_solution, student_answer, correct_answer, ref_solution in rows
+        ])
+        cur.execute(
+            "INSERT INTO grading_batches (batch_id, submission_ids) VALUES (%s, %s)",
+            (batch_id, sorted({row[0] for row in rows})),
+        )
+        conn.commit()
+        return batch_id
+    finally:
+        conn.close()
+
 
+# Everything the realtime path needs to score a problem and write its feedback;
+# same proof heuristic as routes/submissions/grading.py
+_BATCH_PROBLEMS_SQL = """
+    SELECT ps.submission_id, ps.problem_id, ps.student_solution, ps.student_answer,
+           omd.answer, omd.solution, omd.problem,
+           omd.problem ~* 'prove|show that|demonstrate' AS is_proof_hint
+    FROM problem_submissions ps
+    JOIN omni_math_data omd ON omd.problem_id = ps.problem_id
+    WHERE ps.submission_id = ANY(%s)
+"""
+
+
+def _batch_result_row(problem: tuple, ar: Dict, sr: Dict) -> tuple:
+    """Scores one batch result and generates its feedback exactly like submission grading."""
+    submission_id, problem_id, student_solution, student_answer, correct_answer, ref_solution, problem_text, is_proof = problem
+    if is_proof:
+        ar = dict(PROOF_BYPASS_RESULT)
+    percentage, verdict = score_verification(is_proof, ar, sr)
+    hint_provided = grading_feedback(
+        verdict,
+        sr,
+        problem=problem_text,
+        student_answer=student_answer or student_solution or "",
+        correct_answer=correct_answer,
+        student_solution=student_solution or "",
+        ref_solution=ref_solution,
+    )
+    return grading_result_row(submission_id, problem_id, ar, sr, percentage, verdict, hint_provided)
+
+
+def collect_scheduled_grading_batches() -> int:
+    """
+    Stores the results of finished grading batches and marks fully graded
+    submissions 'graded'. Results are scored, get feedback and are written by the
+    same helpers as submission grading. Problems whose request failed are picked up
+    by the next submit_scheduled_grading_batch run. Returns the number of results stored.
 
+    No pooled connection is held across the Batch API or feedback calls.
+    """
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT batch_id, submission_ids FROM grading_batches ORDER BY created_at")
+        batches = cur.fetchall()
+    finally:
+        conn.close()
+
+    stored = 0
+    for batch_id, submission_ids in batches:
+        results = collect_grading_batch(batch_id)
+        if results is None:
+            continue
+
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(_BATCH_PROBLEMS_SQL, (submission_ids,))
+            problems = {(row[0], row[1]): row for row in cur.fetchall()}
+        finally:
+            conn.close()
+
+        graded = []
+        for custom_id, (ar, sr) in results.items():
+            submission_id, problem_id = map(int, custom_id.split(":"))
+            problem = problems.get((submission_id, problem_id))
+            if problem is not None:
+                graded.append((problem, ar, sr))
+        with ThreadPoolExecutor(max_workers=BATCH_FEEDBACK_CONCURRENCY) as executor:
+            rows = list(executor.map(lambda g: _batch_result_row(*g), graded))
+
+        by_submission: Dict[int, list] = {}
+        for row in rows:
+            by_submission.setdefault(row[0], []).append(row)
+
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            for submission_id, submission_rows in by_submission.items():
+                # replace=False: earlier batches may already hold this test's other problems
+                store_grading_results(cur, submission_id, submission_rows, replace=False)
+            cur.execute("DELETE FROM grading_batches WHERE batch_id = %s", (batch_id,))
+            conn.commit()
+        finally:
+            conn.close()
+        stored += len(rows)
+        logger.info(f"Collected grading batch {batch_id}: {len(rows)} results")
+    return stored
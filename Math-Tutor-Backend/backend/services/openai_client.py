@@ -0,0 +1,35 @@
+import os
+from functools import lru_cache
+
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, DefaultAioHttpClient, DefaultHttpxClient, OpenAI
+
+load_dotenv()
+
+# Process-wide clients: every service call reuses pooled keep-alive connections
+# instead of building a new client, connection pool and TLS session per request.
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "50"))
+
+
+@lru_cache(maxsize=None)
+def get_openai_client() -> OpenAI:
+    """Shared sync client; safe to use from worker threads."""
+    return OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        http_client=DefaultHttpxClient(
+            limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_KEEPALIVE)
+        ),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_async_openai_client() -> AsyncOpenAI:
+    """Shared async client for code running on the event loop."""
+    try:
+        # aiohttp transport when the openai[aiohttp] extra is installed
+        http_client = DefaultAioHttpClient()
+    except RuntimeError:
+        http_client = None
+    return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
@@ -13,7 +13,7 @@ import logging
 import os
 from typing import Optional
 
-from openai import OpenAI
+from services.openai_client import get_openai_client
 from db.db_connection import get_db_connection
 
 logger = logging.getLogger(__name__)
@@ -223,7 +223,7 @@ def _generate_study_tip(domain: str, error_themes: list[str]) -> Optional[str]:
         return None
 
     try:
-        client = OpenAI(api_key=api_key)
+        client = get_openai_client()
         themes_str = "; ".join(error_themes[:5])
         prompt = (
             f"A student preparing for math olympiads is weak in {domain}. "
@@ -294,7 +294,7 @@ def get_recommendations_for_student(student_id: int, max_domains: int = 3) -> di
                 FROM grading_results gr
                 JOIN test_submissions ts ON ts.submission_id = gr.submission_id
                 JOIN omni_math_data omd   ON omd.problem_id  = gr.problem_id
-                JOIN LATERAL unnest(string_to_array(omd.domain, ',')) AS d(domain) ON TRUE
+                JOIN LATERAL unnest(omd.domain_arr) AS d(domain) ON TRUE
                 WHERE ts.student_id = %s
                 GROUP BY TRIM(d.domain)
             )
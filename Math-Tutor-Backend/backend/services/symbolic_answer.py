@@ -0,0 +1,103 @@
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from typing import Optional
+
+try:
+    import sympy
+    from sympy.parsing.sympy_parser import parse_expr, standard_transformations
+except ImportError:  # optional; answers then always go to the model
+    sympy = None
+
+logger = logging.getLogger(__name__)
+
+# Plain numeric/algebraic answers ("2/4", "0.5", "2*sqrt(3)", "x*x - 1") are compared
+# symbolically before any model call. Powers are rejected outright: "9^9^9" is five
+# characters and never finishes evaluating. What's left still goes through
+# simplify(), so the comparison runs in a worker process that is killed after
+# SYMBOLIC_TIMEOUT seconds; callers then fall back to the grading model.
+_SYMBOLIC_ANSWER = re.compile(r"(?:sqrt|pi|\d+(?:\.\d+)?|[a-zA-Z](?![a-zA-Z])|[\s+\-*/().])+")
+_SYMBOLIC_MAX_LEN = 80
+SYMBOLIC_TIMEOUT = float(os.getenv("SYMBOLIC_TIMEOUT", "2"))
+SYMBOLIC_WORKERS = int(os.getenv("SYMBOLIC_WORKERS", "2"))
+# Seconds the worker processes get to start and import SymPy
+SYMBOLIC_START_TIMEOUT = float(os.getenv("SYMBOLIC_START_TIMEOUT", "60"))
+
+_pool = None
+_pool_failed = False
+_pool_lock = threading.Lock()
+
+
+def _parse(answer: str):
+    # Single letters are plain symbols, never SymPy names such as N, S or O
+    local_dict = {c: sympy.Symbol(c) for c in set(answer) if c.isalpha()}
+    local_dict.update(sqrt=sympy.sqrt, pi=sympy.pi)
+    return parse_expr(answer, local_dict=local_dict, transformations=standard_transformations, evaluate=False)
+
+
+def _sympy_equal(student_answer: str, correct_answer: str) -> bool:
+    """Runs in a worker process."""
+    return sympy.simplify(_parse(student_answer) - _parse(correct_answer)) == 0
+
+
+def _get_pool():
+    """The worker pool, or None if it could not be started (the check is then skipped)."""
+    global _pool, _pool_failed
+    with _pool_lock:
+        if _pool is None and not _pool_failed:
+            # spawn: forking a threaded server process is unsafe
+            pool = multiprocessing.get_context("spawn").Pool(SYMBOLIC_WORKERS)
+            try:
+                # Wait out interpreter start + SymPy import here, not inside SYMBOLIC_TIMEOUT
+                pool.apply_async(_sympy_equal, ("1", "1")).get(timeout=SYMBOLIC_START_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"SymPy worker pool failed to start, symbolic answer check disabled: {str(e)}")
+                pool.terminate()
+                _pool_failed = True
+                return None
+            _pool = pool
+        return _pool
+
+
+def _kill_pool(pool) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.terminate()
+
+
+def symbolic_answers_equal(student_answer: str, correct_answer: str) -> Optional[bool]:
+    """
+    True if SymPy proves the two answers equal. None when it can't tell: SymPy is
+    missing, either answer isn't a plain expression, parsing fails or the check
+    times out. Blocks for up to SYMBOLIC_TIMEOUT seconds.
+    """
+    if sympy is None:
+        return None
+    sa, ca = student_answer.strip().rstrip("."), correct_answer.strip().rstrip(".")
+    for answer in (sa, ca):
+        if len(answer) > _SYMBOLIC_MAX_LEN or "**" in answer or not _SYMBOLIC_ANSWER.fullmatch(answer):
+            return None
+
+    pool = _get_pool()
+    if pool is None:
+        return None
+    try:
+        return pool.apply_async(_sympy_equal, (sa, ca)).get(timeout=SYMBOLIC_TIMEOUT) or None
+    except multiprocessing.TimeoutError:
+        # The worker is still stuck in SymPy; terminating the pool is the only way to stop it
+        _kill_pool(pool)
+        return None
+    except Exception:
+        return None
+
+
+def close_symbolic_pool() -> None:
+    """Stop the worker processes (app shutdown)."""
+    with _pool_lock:
+        pool = _pool
+    if pool is not None:
+        _kill_pool(pool)
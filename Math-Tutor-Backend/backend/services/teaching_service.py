@@ -20,6 +20,7 @@ import os
 from typing import Optional
 
 from openai import OpenAI
+from services.openai_client import get_openai_client
 
 logger = logging.getLogger(__name__)
 
@@ -91,7 +92,7 @@ Use LaTeX math ($...$).  Keep it under 250 words.  Do NOT give the direct answer
 
 
 def _client() -> OpenAI:
-    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return get_openai_client()
 
 
 def generate_lesson_plan(topic: str, domain: str) -> list[dict]:
@@ -2,31 +2,58 @@
 import os
 import logging
 import json
+import threading
+from collections import deque
+from functools import lru_cache
 from typing import Optional
 
-from sentence_transformers import SentenceTransformer
+import numpy as np
+from cachetools import LRUCache
 from dotenv import load_dotenv
 
 from db.db_connection import get_db_connection
-from openai import OpenAI
+from services.embedding_service import encode_text
+from services.openai_client import get_openai_client
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
-_MODEL = None
 
-def _get_semantic_model() -> SentenceTransformer:
-    global _MODEL
-    if _MODEL is None:
-        model_name = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
-        logger.info(f"Loading embedding model: {model_name}")
-        _MODEL = SentenceTransformer(model_name)
-    return _MODEL
+@lru_cache(maxsize=2048)
+def _encode_query(query: str) -> tuple:
+    """Embedding for the RAG lookups; repeat queries skip the encoder."""
+    return tuple(encode_text(query).tolist())
+
+
+# Hints keyed on the normalized query, plus the embeddings of recent hint queries so
+# a near-identical query (cosine >= HINT_SIMILARITY) reuses a hint without another
+# retrieval and LLM call. Error messages are never cached.
+HINT_CACHE_SIZE = int(os.getenv("HINT_CACHE_SIZE", "1024"))
+HINT_SIMILARITY = float(os.getenv("HINT_SIMILARITY", "0.97"))
+_hint_cache: LRUCache = LRUCache(maxsize=HINT_CACHE_SIZE)
+_recent_hints: deque = deque(maxlen=int(os.getenv("HINT_SEMANTIC_CACHE_SIZE", "256")))
+_hint_cache_lock = threading.Lock()
 
 
 def generate_hint_text(query: str, limit: int = 3) -> Optional[str]:
     """Thin wrapper kept for backward compatibility — delegates to the detailed feedback path."""
-    return generate_diagnostic_feedback(
+    if not query or not query.strip():
+        return None
+
+    key = (query.strip().lower(), limit)
+    with _hint_cache_lock:
+        cached = _hint_cache.get(key)
+    if cached is not None:
+        return cached
+
+    emb = np.asarray(_encode_query(query))
+    emb = emb / (np.linalg.norm(emb) or 1.0)
+    with _hint_cache_lock:
+        for other_emb, other_limit, hint in _recent_hints:
+            if other_limit == limit and float(other_emb @ emb) >= HINT_SIMILARITY:
+                return hint
+
+    hint = generate_diagnostic_feedback(
         problem=query,
         student_answer="",
         correct_answer="",
@@ -35,6 +62,11 @@ def generate_hint_text(query: str, limit: int = 3) -> Optional[str]:
         is_correct=False,
         limit=limit,
     )
+    if hint and not hint.startswith("Error"):
+        with _hint_cache_lock:
+            _hint_cache[key] = hint
+            _recent_hints.append((emb, limit, hint))
+    return hint
 
 
 def generate_diagnostic_feedback(
@@ -58,8 +90,8 @@ def generate_diagnostic_feedback(
         if not query or not query.strip():
             return None
 
-        model = _get_semantic_model()
-        emb = model.encode(query).tolist()
+        # Shared embedding model (and backend) from embedding_service
+        emb = list(_encode_query(query))
 
         conn = get_db_connection()
         cur = conn.cursor()
@@ -68,7 +100,7 @@ def generate_diagnostic_feedback(
                 """
                 SELECT problem, solution, answer
                 FROM omni_math_data
-                ORDER BY embedding <-> %s::vector
+                ORDER BY (embedding::halfvec(384)) <-> %s::halfvec(384)
                 LIMIT %s;
                 """,
                 (emb, limit),
@@ -148,7 +180,7 @@ Similar worked examples for context:
 
 Write in clear, friendly language suitable for a student. Be thorough."""
 
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        client = get_openai_client()
         model_name = os.getenv("RAG_HINT_MODEL", "gpt-4o")
         is_reasoning_model = model_name.startswith("o1") or model_name.startswith("o3")
         
@@ -204,8 +236,8 @@ def generate_tutor_chat_response(student_id: int, query: str) -> str:
                     FROM grading_results gr
                     JOIN test_submissions ts ON ts.submission_id = gr.submission_id
                     JOIN omni_math_data omd ON omd.problem_id = gr.problem_id
-                    JOIN LATERAL unnest(string_to_array(omd.domain, ',')) AS d(domain) ON TRUE
-                    WHERE ts.student_id = %s
+                    JOIN LATERAL unnest(omd.domain_arr) AS d(domain) ON TRUE
+                    WHERE ts.student_id = %s AND d.domain <> ''
                     GROUP BY 1
                 )
                 SELECT domain FROM Stats WHERE avg_score < 60 ORDER BY avg_score ASC LIMIT 3
@@ -234,13 +266,12 @@ def generate_tutor_chat_response(student_id: int, query: str) -> str:
             context_str = "\n".join(context_parts)
             
             # 2. RAG for Math Context
-            model = _get_semantic_model()
-            emb = model.encode(query).tolist()
+            emb = list(_encode_query(query))
             
             cur.execute("""
                 SELECT problem, solution, answer
                 FROM omni_math_data
-                ORDER BY embedding <-> %s::vector
+                ORDER BY (embedding::halfvec(384)) <-> %s::halfvec(384)
                 LIMIT 2;
             """, (emb,))
             rag_rows = cur.fetchall()
@@ -276,7 +307,7 @@ User Query:
 {query}
 """
 
-        client = OpenAI(api_key=api_key)
+        client = get_openai_client()
         response = client.chat.completions.create(
             model=os.getenv("TUTOR_CHAT_MODEL", "gpt-4o"),
             messages=[
@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("sympy")
+
+from services import symbolic_answer
+from services.grading_service import _symbolic_answer_result
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _symbolic_pool():
+    yield
+    symbolic_answer.close_symbolic_pool()
+
+
+@pytest.mark.parametrize("student_answer, correct_answer", [
+    ("2/4", "0.5"),
+    ("0.5", "1/2"),
+    ("2*sqrt(3)", "sqrt(12)"),
+    ("x*x - 1", "(x - 1)*(x + 1)"),
+    ("pi/2", "pi*0.5"),
+    (" 42. ", "42"),
+])
+def test_accepts_equivalent_answers(student_answer, correct_answer):
+    result = _symbolic_answer_result(student_answer, correct_answer)
+    assert result is not None
+    assert result["is_correct"] is True
+    assert result["match_type"] == "sympy"
+    assert result["confidence"] == 1.0
+
+
+@pytest.mark.parametrize("student_answer, correct_answer", [
+    ("3", "4"),
+    ("x + 1", "x"),
+    # Powers are never parsed: "9^9^9" would not finish evaluating
+    ("9^9^9", "1"),
+    ("9**9**9", "1"),
+    ("2^2", "4"),
+    # Words, SymPy names and anything outside the allow-list go to the model
+    ("four", "4"),
+    ("N(2)", "2"),
+    ("x = 2", "2"),
+    ("2!", "2"),
+    ("1/0", "1"),
+    ("1" * 81, "1"),
+])
+def test_rejects_other_answers(student_answer, correct_answer):
+    assert _symbolic_answer_result(student_answer, correct_answer) is None
+
+
+def test_timeout_falls_back_and_recovers(monkeypatch):
+    # Warm the pool, then give the check no time at all
+    assert symbolic_answer.symbolic_answers_equal("1", "1") is True
+    monkeypatch.setattr(symbolic_answer, "SYMBOLIC_TIMEOUT", 1e-9)
+    assert _symbolic_answer_result("x*x - 1", "(x - 1)*(x + 1)") is None
+    # The stuck pool was terminated; the next check starts a fresh one
+    assert symbolic_answer._pool is None
+    monkeypatch.undo()
+    assert _symbolic_answer_result("2/4", "0.5") is not None